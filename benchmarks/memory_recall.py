@@ -0,0 +1,201 @@
+"""
+Per-user memory recall latency as the number of users grows.
+
+Fills each memory layout (see mem_agent/store.py) with synthetic users, each
+holding --memories random memory vectors, and at every --users checkpoint
+times filtered top-k searches for random users. Users are added incrementally,
+so one run covers 100 -> 100,000 users. Reports p50/p95/p99 recall latency,
+and checks that no search returns another user's memories.
+
+Runs on a scratch local store by default, or against a Qdrant server with
+--backend qdrant (in throwaway `recall_bench_*` collections). There the
+`unindexed` layout (one shared collection without payload indexes or per-user
+graphs) shows what the indexes buy.
+
+Usage:
+    python benchmarks/memory_recall.py
+    python benchmarks/memory_recall.py --users 100,1000,10000,100000 --layouts shared,sharded
+    python benchmarks/memory_recall.py --backend qdrant --layouts unindexed,shared,sharded,per_tenant
+"""
+import argparse
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+import uuid
+from datetime import datetime, timedelta
+from pathlib import Path
+
+import numpy as np
+
+# Local stores go to a scratch directory, set before the store modules read it
+SCRATCH = Path(tempfile.mkdtemp(prefix="memory-recall-bench-"))
+os.environ["LOCAL_VECTOR_DIR"] = str(SCRATCH / "vectors")
+
+# Make the shared `common` package and the mem_agent modules importable when run from the repo root
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.append(str(ROOT))
+sys.path.append(str(ROOT / "mem_agent"))
+from langchain_core.embeddings import DeterministicFakeEmbedding
+from qdrant_client import QdrantClient
+from common.vector_store import QDRANT_URL
+from store import EMBEDDING_DIM, MEMORY_SHARDS, MemoryStore
+
+RESULTS_DIR = Path(__file__).parent / "results"
+PERCENTILES = (50, 95, 99)
+INGEST_BATCH = 4096
+READY_TIMEOUT = 600  # seconds to wait for Qdrant to finish indexing a checkpoint
+
+
+def make_store(layout: str, args, client) -> MemoryStore:
+    indexed = layout != "unindexed"
+    return MemoryStore(
+        DeterministicFakeEmbedding(size=EMBEDDING_DIM),
+        client,
+        layout="shared" if layout == "unindexed" else layout,
+        shards=args.shards,
+        backend=args.backend,
+        base_name=f"recall_bench_{layout}",
+        indexed=indexed
+    )
+
+
+def ingest(store: MemoryStore, first_user: int, last_user: int, memories: int, rng) -> float:
+    """Add users [first_user, last_user) with `memories` memories each. Returns seconds taken."""
+    started = time.perf_counter()
+    now = datetime.now()
+    users = range(first_user, last_user)
+    per_batch = max(1, INGEST_BATCH // memories)
+    for start in range(0, len(users), per_batch):
+        batch = users[start:start + per_batch]
+        count = len(batch) * memories
+        vectors = rng.standard_normal((count, EMBEDDING_DIM), dtype=np.float32)
+        vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+        metadatas = [
+            {
+                "user_id": f"user-{user}",
+                "timestamp": (now - timedelta(minutes=m)).isoformat(),
+                "user_message": f"message {m}",
+                "ai_response": f"response {m}"
+            }
+            for user in batch for m in range(memories)
+        ]
+        store.upsert(
+            [str(uuid.UUID(bytes=rng.bytes(16), version=4)) for _ in range(count)],
+            [f"User: {m['user_message']}\nAssistant: {m['ai_response']}" for m in metadatas],
+            vectors.tolist(),
+            metadatas
+        )
+    return time.perf_counter() - started
+
+
+def wait_ready(store: MemoryStore):
+    """Wait until Qdrant has optimized (indexed) every collection of the store."""
+    if store.backend == "local":
+        return
+    deadline = time.monotonic() + READY_TIMEOUT
+    for collection_name in store.collections():
+        while store.client.get_collection(collection_name).status.value != "green":
+            if time.monotonic() > deadline:
+                print(f"⚠️ {collection_name} still indexing; measuring anyway")
+                return
+            time.sleep(0.5)
+
+
+def measure(store: MemoryStore, n_users: int, args, rng) -> dict:
+    """Time `args.queries` searches for random users."""
+    users = rng.integers(n_users, size=args.queries + args.warmup)
+    queries = rng.standard_normal((len(users), EMBEDDING_DIM), dtype=np.float32)
+    latencies, leaks = [], 0
+    for i, (user, query) in enumerate(zip(users, queries)):
+        user_id = f"user-{user}"
+        started = time.perf_counter()
+        docs = store.search_by_vector(user_id, query.tolist(), k=args.k)
+        elapsed = time.perf_counter() - started
+        if i >= args.warmup:
+            latencies.append(elapsed * 1000)
+        leaks += sum(doc.metadata.get("user_id") != user_id for doc in docs)
+    ms = np.asarray(latencies)
+    return {
+        "mean_ms": round(float(ms.mean()), 3),
+        **{f"p{p}_ms": round(float(v), 3) for p, v in zip(PERCENTILES, np.percentile(ms, PERCENTILES))},
+        "leaks": int(leaks)
+    }
+
+
+def print_table(rows: list):
+    print(f"\n{'layout':<12}{'users':>10}{'points':>11}{'collections':>13}{'ingest s':>10}"
+          f"{'mean ms':>10}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'leaks':>7}")
+    for r in rows:
+        print(
+            f"{r['layout']:<12}{r['users']:>10}{r['points']:>11}{r['collections']:>13}{r['ingest_s']:>10.1f}"
+            f"{r['mean_ms']:>10.3f}{r['p50_ms']:>9.3f}{r['p95_ms']:>9.3f}{r['p99_ms']:>9.3f}{r['leaks']:>7}"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Memory recall latency vs user count")
+    parser.add_argument("--users", default="100,1000,10000", help="comma-separated user count checkpoints")
+    parser.add_argument("--memories", type=int, default=5, help="memories per user")
+    parser.add_argument("--layouts", default="shared,sharded", help="shared, sharded, per_tenant, unindexed (qdrant)")
+    parser.add_argument("--backend", choices=["local", "qdrant"], default="local")
+    parser.add_argument("--qdrant-url", default=QDRANT_URL)
+    parser.add_argument("--shards", type=int, default=MEMORY_SHARDS)
+    parser.add_argument("--queries", type=int, default=500)
+    parser.add_argument("--warmup", type=int, default=50)
+    parser.add_argument("-k", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    checkpoints = sorted(int(n) for n in args.users.split(","))
+    layouts = args.layouts.split(",")
+    if args.backend == "local" and {"unindexed", "per_tenant"} & set(layouts):
+        parser.error("the unindexed and per_tenant layouts need --backend qdrant")
+    client = QdrantClient(url=args.qdrant_url, timeout=60) if args.backend == "qdrant" else None
+
+    rows = []
+    try:
+        for layout in layouts:
+            store = make_store(layout, args, client)
+            for name in store.collections():
+                store.drop(name)  # leftovers of an interrupted run
+            rng = np.random.default_rng(args.seed)
+            added = 0
+            for n_users in checkpoints:
+                ingest_s = ingest(store, added, n_users, args.memories, rng)
+                added = n_users
+                wait_ready(store)
+                result = measure(store, n_users, args, rng)
+                rows.append({
+                    "layout": layout,
+                    "users": n_users,
+                    "points": n_users * args.memories,
+                    "collections": len(store.collections()),
+                    "ingest_s": round(ingest_s, 2),
+                    **result
+                })
+                print(f"⏱️ {layout}: {n_users} users, p50 {result['p50_ms']:.3f} ms, p99 {result['p99_ms']:.3f} ms")
+            if args.backend == "qdrant":
+                for name in store.collections():
+                    store.drop(name)
+    finally:
+        shutil.rmtree(SCRATCH, ignore_errors=True)
+
+    print_table(rows)
+    for layout in layouts:
+        runs = [r for r in rows if r["layout"] == layout]
+        if len(runs) > 1:
+            first, last = runs[0], runs[-1]
+            print(f"📈 {layout}: p50 x{last['p50_ms'] / first['p50_ms']:.2f} from {first['users']} to {last['users']} users")
+
+    RESULTS_DIR.mkdir(exist_ok=True)
+    out = RESULTS_DIR / f"memory_recall-{args.backend}-{time.strftime('%Y%m%d-%H%M%S')}.json"
+    with open(out, "w", encoding="utf-8") as f:
+        json.dump({"args": vars(args), "rows": rows}, f, indent=2)
+    print(f"\n💾 Saved {out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,169 @@
+"""
+Recall-vs-latency report for vector quantization, on our own collections.
+
+Copies a collection into a scratch local store (from the local backend, or
+imported from Qdrant), then for full precision, int8 and binary codes at several
+oversampling factors measures:
+- recall@k against exact full-precision search
+- mean and p95 search latency
+- vector memory used by the first search pass
+
+Queries are real questions from --queries (one per line, embedded with the
+shared model) or, by default, stored vectors perturbed with Gaussian noise.
+With --qdrant-native the same comparison is also run against the Qdrant
+collection itself (exact search vs its configured quantization + rescoring).
+
+Usage:
+    python benchmarks/quantization.py rag
+    python benchmarks/quantization.py rag --source qdrant --queries questions.txt
+    python benchmarks/quantization.py mem_agent --source qdrant --qdrant-native
+"""
+import argparse
+import json
+import shutil
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+from qdrant_client import QdrantClient, models
+
+# Make the shared `common` package importable when run from the repo root
+sys.path.append(str(Path(__file__).resolve().parent.parent))
+from common import get_embedding_model
+from common.vector_store import QDRANT_URL, LOCAL_VECTOR_DIR, LocalVectorStore, import_from_qdrant
+
+RESULTS_DIR = Path(__file__).parent / "results"
+OVERSAMPLING = [1.0, 2.0, 3.0, 4.0, 8.0]
+
+
+def load_queries(store: LocalVectorStore, args) -> np.ndarray:
+    """Embed real questions, or perturb a sample of stored vectors."""
+    if args.queries:
+        lines = [line.strip() for line in open(args.queries, encoding="utf-8") if line.strip()]
+        return np.asarray(get_embedding_model().embed_documents(lines[:args.n_queries]), dtype=np.float32)
+
+    rng = np.random.default_rng(args.seed)
+    vectors = np.concatenate([batch for _, _, batch, _ in store.iter_rows(4096)])
+    sample = vectors[rng.choice(len(vectors), min(args.n_queries, len(vectors)), replace=False)]
+    return sample + rng.normal(0, args.noise, sample.shape).astype(np.float32)
+
+
+def run_queries(search, queries: np.ndarray, k: int) -> tuple:
+    """Run every query, returning (result id lists, latencies in ms)."""
+    results, latencies = [], []
+    for query in queries:
+        started = time.perf_counter()
+        ids = search(query, k)
+        latencies.append((time.perf_counter() - started) * 1000)
+        results.append(ids)
+    return results, np.asarray(latencies)
+
+
+def recall(results: list, truth: list, k: int) -> float:
+    return float(np.mean([len(set(r[:k]) & set(t[:k])) / k for r, t in zip(results, truth)]))
+
+
+def row(label: str, oversampling, results, latencies, truth, k: int, memory_bytes: int) -> dict:
+    return {
+        "mode": label,
+        "oversampling": oversampling,
+        f"recall@{k}": round(recall(results, truth, k), 4),
+        "mean_ms": round(float(latencies.mean()), 3),
+        "p95_ms": round(float(np.percentile(latencies, 95)), 3),
+        "vector_memory_mb": round(memory_bytes / 2**20, 2)
+    }
+
+
+def local_report(store: LocalVectorStore, queries: np.ndarray, k: int) -> list:
+    def search(query, k):
+        return [doc.metadata["_id"] for doc, _ in store.similarity_search_with_score_by_vector(query, k)]
+
+    store.drop_ivf()
+    store.quantize("none")
+    truth, latencies = run_queries(search, queries, k)
+    rows = [row("float32", None, truth, latencies, truth, k, store.vector_memory()["full_precision_bytes"])]
+
+    for mode in ("int8", "binary"):
+        store.quantize(mode)
+        for oversampling in OVERSAMPLING:
+            store.oversampling = oversampling
+            results, latencies = run_queries(search, queries, k)
+            rows.append(row(mode, oversampling, results, latencies, truth, k, store.vector_memory()["quantized_bytes"]))
+    store.quantize("none")
+    return rows
+
+
+def qdrant_report(client: QdrantClient, collection: str, queries: np.ndarray, k: int) -> list:
+    config = client.get_collection(collection).config.quantization_config
+    label = f"qdrant-{type(config).__name__ if config else 'none'}"
+
+    def searcher(params):
+        def search(query, k):
+            response = client.query_points(collection, query=query.tolist(), limit=k, search_params=params)
+            return [str(point.id) for point in response.points]
+        return search
+
+    truth, latencies = run_queries(searcher(models.SearchParams(exact=True)), queries, k)
+    rows = [row("qdrant-exact", None, truth, latencies, truth, k, 0)]
+    for oversampling in OVERSAMPLING:
+        params = models.SearchParams(
+            quantization=models.QuantizationSearchParams(rescore=True, oversampling=oversampling)
+        )
+        results, latencies = run_queries(searcher(params), queries, k)
+        rows.append(row(label, oversampling, results, latencies, truth, k, 0))
+    return rows
+
+
+def print_table(rows: list, k: int):
+    print(f"\n{'mode':<22}{'oversampling':>13}{f'recall@{k}':>11}{'mean ms':>10}{'p95 ms':>10}{'vectors MB':>12}")
+    for r in rows:
+        oversampling = "-" if r["oversampling"] is None else f"{r['oversampling']:.0f}x"
+        print(
+            f"{r['mode']:<22}{oversampling:>13}{r[f'recall@{k}']:>11.4f}"
+            f"{r['mean_ms']:>10.3f}{r['p95_ms']:>10.3f}{r['vector_memory_mb']:>12.2f}"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Quantization recall-vs-latency report")
+    parser.add_argument("collection")
+    parser.add_argument("--source", choices=["local", "qdrant"], default="local")
+    parser.add_argument("--queries", help="file with one question per line")
+    parser.add_argument("--n-queries", type=int, default=200)
+    parser.add_argument("--noise", type=float, default=0.02, help="perturbation for synthetic queries")
+    parser.add_argument("-k", type=int, default=5)
+    parser.add_argument("--qdrant-native", action="store_true")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    scratch = Path(tempfile.mkdtemp(prefix="quant-bench-"))
+    try:
+        # Work on a copy so the real store's quantization settings are untouched
+        if args.source == "local":
+            shutil.copytree(LOCAL_VECTOR_DIR / args.collection, scratch / args.collection)
+            store = LocalVectorStore(scratch / args.collection, None, args.collection)
+        else:
+            store = LocalVectorStore(scratch / args.collection, None, args.collection)
+            import_from_qdrant(QdrantClient(url=QDRANT_URL), args.collection, store)
+        print(f"📦 {len(store)} vectors from {args.source}:{args.collection}")
+
+        queries = load_queries(store, args)
+        rows = local_report(store, queries, args.k)
+        if args.qdrant_native:
+            rows += qdrant_report(QdrantClient(url=QDRANT_URL), args.collection, queries, args.k)
+    finally:
+        shutil.rmtree(scratch, ignore_errors=True)
+
+    print_table(rows, args.k)
+
+    RESULTS_DIR.mkdir(exist_ok=True)
+    out = RESULTS_DIR / f"quantization-{args.collection}-{time.strftime('%Y%m%d-%H%M%S')}.json"
+    with open(out, "w", encoding="utf-8") as f:
+        json.dump({"collection": args.collection, "vectors": len(store), "queries": len(queries), "rows": rows}, f, indent=2)
+    print(f"\n💾 Saved {out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,590 @@
+"""
+Load test for the rag_queue service, runnable offline on a laptop.
+
+Runs the real server (rag_queue/server.py, under uvicorn on a local port) or
+the real RQ worker (queues.worker in warm pool threads) against local
+stand-ins:
+- a scratch local vector store filled with a synthetic corpus
+- deterministic fake embeddings with a configurable forward-pass latency
+- fake LLM providers behind the real LLM router, with a configurable time to
+  first token, token rate and share of stalled (tail) requests
+- fakeredis for RQ queues, results, coalescing keys and collection versions
+
+then drives it with a fixed number of concurrent clients (or worker threads)
+and reports:
+- throughput
+- p50/p95/p99 end-to-end latency (and time to first token for /chat/stream)
+- p50/p95/p99 latency of each stage and of the queue wait, from the
+  observations the service makes on its own Prometheus histograms
+- resident memory before, during and after the run
+
+Results are saved under benchmarks/results/ with the git commit, so runs can be
+compared between commits with --compare.
+
+Usage:
+    python benchmarks/rag_queue_load.py chat --requests 500 --concurrency 50
+    python benchmarks/rag_queue_load.py stream --ttft-ms 300 --tokens-per-sec 40
+    python benchmarks/rag_queue_load.py worker --concurrency 8 --distinct 100
+    python benchmarks/rag_queue_load.py chat --compare benchmarks/results/rag_queue-chat-20260101-120000.json
+"""
+import argparse
+import asyncio
+import gc
+import json
+import os
+import random
+import resource
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from collections import defaultdict
+from pathlib import Path
+
+import fakeredis
+import httpx
+import numpy as np
+from langchain_core.embeddings import DeterministicFakeEmbedding
+from prometheus_client import Histogram
+
+# Make the shared `common` package and rag_queue modules importable when run from the repo root
+REPO_ROOT = Path(__file__).resolve().parent.parent
+sys.path.append(str(REPO_ROOT))
+sys.path.append(str(REPO_ROOT / "rag_queue"))
+
+# Configuration is read at import time: point everything at scratch storage
+# and local stand-ins before the first service module is imported
+SCRATCH = Path(tempfile.mkdtemp(prefix="rag-queue-bench-"))
+os.environ.update({
+    "VECTOR_BACKEND": "local",
+    "LOCAL_VECTOR_DIR": str(SCRATCH / "vectors"),
+    "EMBEDDING_CACHE_DIR": str(SCRATCH / "embeddings"),
+    "RESULTS_BACKEND": "memory",
+    "RESULT_CALLBACK_URL": "",
+    "PUSHGATEWAY_URL": ""
+})
+from common.llm_router import Completion, LLMRouter, Provider
+
+RESULTS_DIR = Path(__file__).parent / "results"
+EMBEDDING_DIM = 384
+PERCENTILES = (50, 95, 99)
+
+TOPICS = [
+    "retrieval", "latency", "throughput", "caching", "indexing", "quantization", "batching",
+    "tokenization", "embeddings", "rate limits", "queues", "replication", "sharding", "timeouts"
+]
+
+
+# ================================
+# Stand-ins
+# ================================
+class FakeEmbeddings(DeterministicFakeEmbedding):
+    """Deterministic embeddings that take `latency` seconds per forward pass."""
+
+    latency: float = 0.0
+
+    def embed_documents(self, texts):
+        time.sleep(self.latency)
+        return super().embed_documents(texts)
+
+    def embed_query(self, text):
+        time.sleep(self.latency)
+        return super().embed_query(text)
+
+
+class FakeLLM(Provider):
+    """
+    Stand-in LLM provider for the router.
+
+    Answers take a fixed time to first token, then `completion_tokens` tokens
+    at `tokens_per_sec`. A `tail_fraction` of requests first stall for
+    `tail` extra seconds, like a slow remote endpoint, which is what hedging
+    is for.
+    """
+
+    def __init__(self, name: str, ttft: float, tokens_per_sec: float, completion_tokens: int,
+                 tail_fraction: float = 0.0, tail: float = 0.0):
+        super().__init__(name)
+        self.first_token = ttft
+        self.token_interval = 1 / tokens_per_sec
+        self.tokens = ([" lorem", " ipsum", " dolor", " sit", " amet"] * (completion_tokens // 5 + 1))[:completion_tokens]
+        self.tail_fraction = tail_fraction
+        self.tail = tail
+
+    def _first_token_delay(self) -> float:
+        return self.first_token + (self.tail if random.random() < self.tail_fraction else 0.0)
+
+    async def complete(self, messages, max_tokens, temperature) -> Completion:
+        await asyncio.sleep(self._first_token_delay() + len(self.tokens) * self.token_interval)
+        return Completion(
+            text="".join(self.tokens),
+            provider=self.name,
+            seconds=0.0,
+            prompt_tokens=len(messages[-1]["content"]) // 4 + 1,
+            completion_tokens=len(self.tokens)
+        )
+
+    async def stream(self, messages, max_tokens, temperature):
+        await asyncio.sleep(self._first_token_delay())
+        for i, token in enumerate(self.tokens):
+            if i:
+                await asyncio.sleep(self.token_interval)
+            yield token
+
+
+def reset_llm_stats(llm: LLMRouter):
+    """Forget the warm-up's request counters (latency windows are kept, as in a running service)."""
+    for provider in llm.providers:
+        provider.requests = provider.failures = provider.hedges = provider.hedge_wins = 0
+
+
+def synthetic_corpus(n: int, rng: random.Random) -> list:
+    """Chunk-sized paragraphs mentioning a few topics each."""
+    return [
+        " ".join(f"Section {i} discusses {rng.choice(TOPICS)} and its effect on {rng.choice(TOPICS)}." for _ in range(12))
+        for i in range(n)
+    ]
+
+
+def synthetic_queries(n: int, distinct: int, rng: random.Random) -> list:
+    """`n` questions drawn from `distinct` different ones (repeats exercise caching and coalescing)."""
+    pool = [f"How does {rng.choice(TOPICS)} affect {rng.choice(TOPICS)} in section {i}?" for i in range(distinct)]
+    queries = [pool[i % distinct] for i in range(n)]
+    rng.shuffle(queries)
+    return queries
+
+
+def fill_vector_store(vector_store, embeddings: FakeEmbeddings, n_docs: int, rng: random.Random):
+    texts = synthetic_corpus(n_docs, rng)
+    latency, embeddings.latency = embeddings.latency, 0.0
+    vectors = embeddings.embed_documents(texts)
+    embeddings.latency = latency
+    metadatas = [{"source": f"synthetic-{i // 20}.pdf", "page": i % 20} for i in range(n_docs)]
+    vector_store.add_embeddings(texts, vectors, metadatas=metadatas)
+
+
+# ================================
+# Measurements
+# ================================
+def rss_mb() -> float:
+    """Current resident set size (peak on platforms without /proc)."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2**20
+    except OSError:
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak / 2**20 if sys.platform == "darwin" else peak / 2**10
+
+
+class MemorySampler:
+    """Samples RSS in the background to catch the peak during a run."""
+
+    def __init__(self, interval: float = 0.1):
+        self.interval = interval
+        self.start = rss_mb()
+        self.peak = self.start
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="rss-sampler", daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.peak = max(self.peak, rss_mb())
+
+    def stop(self) -> dict:
+        self._stop.set()
+        self._thread.join()
+        gc.collect()
+        end = rss_mb()
+        return {
+            "rss_start_mb": round(self.start, 1),
+            "rss_peak_mb": round(max(self.peak, end), 1),
+            "rss_end_mb": round(end, 1),
+            "rss_growth_mb": round(end - self.start, 1)
+        }
+
+
+def percentiles(seconds: list) -> dict:
+    if not seconds:
+        return {}
+    ms = np.asarray(seconds) * 1000
+    return {
+        "count": len(ms),
+        "mean_ms": round(float(ms.mean()), 2),
+        **{f"p{p}_ms": round(float(v), 2) for p, v in zip(PERCENTILES, np.percentile(ms, PERCENTILES))}
+    }
+
+
+class StageRecorder:
+    """
+    Keeps every observation the service makes on its latency histograms.
+
+    Prometheus buckets are too coarse for percentiles of fast stages, so while
+    recording, each rag_stage_seconds / rag_queue_wait_seconds observation for
+    the component is also kept as a raw value.
+    """
+
+    NAMES = {"rag_stage_seconds", "rag_queue_wait_seconds"}
+
+    def __init__(self, component: str):
+        self.component = component
+        self.samples = defaultdict(list)
+        self._observe = None
+
+    def __enter__(self):
+        self._observe = observe = Histogram.observe
+        recorder = self
+
+        def recording_observe(histogram, amount, *args, **kwargs):
+            observe(histogram, amount, *args, **kwargs)
+            labels = getattr(histogram, "_labelvalues", ())
+            if histogram._name in recorder.NAMES and labels and labels[0] == recorder.component:
+                recorder.samples[labels[1] if len(labels) > 1 else "queue_wait"].append(amount)
+
+        Histogram.observe = recording_observe
+        return self
+
+    def __exit__(self, *exc):
+        Histogram.observe = self._observe
+
+    def report(self) -> dict:
+        return {stage: percentiles(seconds) for stage, seconds in sorted(self.samples.items())}
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=REPO_ROOT, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+# ================================
+# Server load (/chat and /chat/stream)
+# ================================
+def start_uvicorn(app) -> tuple:
+    """Serve an app on a free local port from a background thread."""
+    import uvicorn
+
+    sock = socket.socket()
+    sock.bind(("127.0.0.1", 0))
+    config = uvicorn.Config(app, log_level="warning", access_log=False, timeout_keep_alive=60)
+    server = uvicorn.Server(config)
+    thread = threading.Thread(target=server.run, kwargs={"sockets": [sock]}, name="uvicorn", daemon=True)
+    thread.start()
+    while not server.started:
+        time.sleep(0.05)
+    return server, thread, f"http://127.0.0.1:{sock.getsockname()[1]}"
+
+
+async def chat_request(client: httpx.AsyncClient, query: str) -> dict:
+    """POST /chat, then long-poll /status until the job is done."""
+    from notifier import TERMINAL_STATUSES
+
+    started = time.perf_counter()
+    response = await client.post("/chat", json={"message": query})
+    if response.status_code != 200:
+        return {"ok": False, "status": response.status_code, "seconds": time.perf_counter() - started}
+    body = response.json()
+    job_id, coalesced = body["job_id"], body["coalesced"]
+    status = body["status"]
+    while status not in TERMINAL_STATUSES:
+        body = (await client.get(f"/status/{job_id}", params={"wait": 30})).json()
+        status = body["status"]
+    return {
+        "ok": status == "completed",
+        "status": status,
+        "seconds": time.perf_counter() - started,
+        "cache_hit": bool(body.get("cache_hit")),
+        "coalesced": coalesced
+    }
+
+
+async def stream_request(client: httpx.AsyncClient, query: str) -> dict:
+    """POST /chat/stream and read the events to the end."""
+    started = time.perf_counter()
+    first_token = None
+    event = status = None
+    cache_hit = False
+    async with client.stream("POST", "/chat/stream", json={"message": query}) as response:
+        if response.status_code != 200:
+            return {"ok": False, "status": response.status_code, "seconds": time.perf_counter() - started}
+        coalesced = response.headers.get("X-Coalesced") == "true"
+        async for line in response.aiter_lines():
+            if line.startswith("event: "):
+                event = line[len("event: "):]
+                if event == "token" and first_token is None:
+                    first_token = time.perf_counter() - started
+                status = event if event in ("done", "error") else status
+            elif line.startswith("data: ") and event == "done":
+                cache_hit = bool(json.loads(line[len("data: "):]).get("cache_hit"))
+    return {
+        "ok": status == "done",
+        "status": status,
+        "seconds": time.perf_counter() - started,
+        "ttft": first_token,
+        "cache_hit": cache_hit,
+        "coalesced": coalesced
+    }
+
+
+async def drive(base_url: str, queries: list, concurrency: int, request) -> tuple:
+    """Run every query with `concurrency` clients in a closed loop; returns (outcomes, wall seconds)."""
+    pending = iter(queries)
+    outcomes = []
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=httpx.Timeout(120)) as client:
+        async def user():
+            for query in pending:
+                outcomes.append(await request(client, query))
+
+        started = time.perf_counter()
+        await asyncio.gather(*(user() for _ in range(concurrency)))
+        return outcomes, time.perf_counter() - started
+
+
+def run_server(args, embeddings: FakeEmbeddings, llm: LLMRouter, redis, rng: random.Random) -> dict:
+    import server
+    from results import RedisResultsStore
+
+    # Step 1: Swap the network-backed pieces for the stand-ins
+    server.query_embedding.embedding = embeddings
+    server.llm = llm
+    server.collection_versions.redis = redis
+    server.rq_client.redis_conn = redis
+    for queue in server.rq_client.queues.values():
+        queue.connection = redis
+    server.worker_results = RedisResultsStore(
+        redis, async_redis=fakeredis.FakeAsyncRedis(server=redis.connection_pool.connection_kwargs["server"])
+    )
+    fill_vector_store(server.vector_store, embeddings, args.docs, rng)
+
+    uvicorn_server, thread, base_url = start_uvicorn(server.app)
+    request = stream_request if args.mode == "stream" else chat_request
+    try:
+        # Step 2: Warm up, then measure
+        if args.warmup:
+            asyncio.run(drive(base_url, synthetic_queries(args.warmup, args.warmup, random.Random(-1)), args.concurrency, request))
+        reset_llm_stats(llm)
+        memory = MemorySampler()
+        with StageRecorder("server") as stages:
+            outcomes, wall = asyncio.run(
+                drive(base_url, synthetic_queries(args.requests, args.distinct, rng), args.concurrency, request)
+            )
+        memory = memory.stop()
+        server_stats = {
+            "embedding_batches": server.query_embedding.stats(),
+            "coalescing": server.inflight.stats(),
+            "answer_cache": server.answer_cache.stats()
+        }
+    finally:
+        uvicorn_server.should_exit = True
+        thread.join(timeout=10)
+
+    succeeded = [o for o in outcomes if o["ok"]]
+    report = {
+        "requests": len(outcomes),
+        "failed": len(outcomes) - len(succeeded),
+        "rejected": sum(1 for o in outcomes if o["status"] == 429),
+        "wall_seconds": round(wall, 3),
+        "throughput_rps": round(len(succeeded) / wall, 2),
+        "llm_calls": sum(p.requests for p in llm.providers),
+        "llm": llm.stats(),
+        "cache_hits": sum(1 for o in succeeded if o.get("cache_hit")),
+        "coalesced": sum(1 for o in succeeded if o.get("coalesced")),
+        "end_to_end": percentiles([o["seconds"] for o in succeeded]),
+        "stages": stages.report(),
+        "memory": memory,
+        "server": server_stats
+    }
+    if args.mode == "stream":
+        report["time_to_first_token"] = percentiles([o["ttft"] for o in succeeded if o.get("ttft") is not None])
+    return report
+
+
+# ================================
+# Worker load (RQ queue)
+# ================================
+def run_worker(args, embeddings: FakeEmbeddings, llm: LLMRouter, redis, rng: random.Random) -> dict:
+    from rq import Queue
+    from rq.job import Job
+
+    from client import QUEUE_NAMES, rq_client
+    from queues import worker
+    from queues.pool import WarmWorker
+    from results import RedisResultsStore
+
+    # Step 1: Swap the network-backed pieces for the stand-ins
+    worker.embedding_model = embeddings
+    worker.llm = llm
+    worker.collection_versions.redis = redis
+    worker.results_store = RedisResultsStore(redis)
+    worker.callback_sink = None
+    rq_client.redis_conn = redis
+    rq_client.queues = {priority: Queue(name, connection=redis) for priority, name in QUEUE_NAMES.items()}
+    fill_vector_store(worker.vector_store, embeddings, args.docs, rng)
+    queues = [rq_client.queues[priority] for priority in ("interactive", "batch")]
+
+    def drain(queries: list) -> tuple:
+        """Enqueue every query, then run the workers until the queues are empty."""
+        job_ids = []
+        for start in range(0, len(queries), args.enqueue_batch):
+            job_ids += rq_client.enqueue_many(queries[start:start + args.enqueue_batch], priority=args.priority)
+        workers = [WarmWorker(queues, connection=redis, name=f"bench-{i}-{time.monotonic_ns()}") for i in range(args.concurrency)]
+        threads = [threading.Thread(target=w.work, kwargs={"burst": True, "logging_level": "WARNING"}) for w in workers]
+        started = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return job_ids, time.perf_counter() - started
+
+    # Step 2: Warm up, then measure
+    if args.warmup:
+        drain(synthetic_queries(args.warmup, args.warmup, random.Random(-1)))
+    reset_llm_stats(llm)
+    memory = MemorySampler()
+    with StageRecorder("worker") as stages:
+        job_ids, wall = drain(synthetic_queries(args.requests, args.distinct, rng))
+    memory = memory.stop()
+
+    # Coalesced copies share their leader's job, so count each job once
+    jobs = [job for job in Job.fetch_many(list(dict.fromkeys(job_ids)), connection=redis) if job is not None]
+    finished = [job for job in jobs if job.get_status() == "finished" and job.return_value()["status"] == "completed"]
+    return {
+        "requests": len(job_ids),
+        "jobs": len(jobs),
+        "failed": len(jobs) - len(finished),
+        "wall_seconds": round(wall, 3),
+        "throughput_rps": round(len(job_ids) / wall, 2),
+        "llm_calls": sum(p.requests for p in llm.providers),
+        "llm": llm.stats(),
+        "cache_hits": sum(1 for job in finished if job.return_value().get("cache_hit")),
+        "coalesced": len(job_ids) - len(jobs),
+        "end_to_end": percentiles([(job.ended_at - job.enqueued_at).total_seconds() for job in finished]),
+        "stages": stages.report(),
+        "memory": memory
+    }
+
+
+# ================================
+# Report
+# ================================
+def print_report(report: dict):
+    r = report["results"]
+    print(f"\n📈 {r['requests']} requests in {r['wall_seconds']:.2f}s: {r['throughput_rps']:.2f} req/s "
+          f"({r['failed']} failed, {r['llm_calls']} LLM calls, {r['cache_hits']} cache hits, {r['coalesced']} coalesced)")
+    hedges = sum(p["hedges"] for p in r["llm"].values())
+    if hedges:
+        wins = sum(p["hedge_wins"] for p in r["llm"].values())
+        print(f"🔀 {hedges} hedged LLM requests, {wins} answered by the hedge")
+    print(f"\n{'latency':<22}{'count':>8}{'mean ms':>10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+    rows = [("end_to_end", r["end_to_end"])]
+    if "time_to_first_token" in r:
+        rows.append(("time_to_first_token", r["time_to_first_token"]))
+    rows += sorted(r["stages"].items())
+    for name, row in rows:
+        if "p50_ms" not in row:
+            continue
+        print(f"{name:<22}{row['count']:>8}{row['mean_ms']:>10.2f}{row['p50_ms']:>10.2f}{row['p95_ms']:>10.2f}{row['p99_ms']:>10.2f}")
+    m = r["memory"]
+    print(f"\n🧠 RSS {m['rss_start_mb']:.1f} MB -> {m['rss_end_mb']:.1f} MB "
+          f"(peak {m['rss_peak_mb']:.1f} MB, growth {m['rss_growth_mb']:+.1f} MB)")
+
+
+def print_comparison(report: dict, previous: dict):
+    """Key numbers side by side with an earlier run."""
+    def rows(r: dict) -> dict:
+        flat = {"throughput_rps": r["throughput_rps"], "rss_growth_mb": r["memory"]["rss_growth_mb"]}
+        flat.update({f"end_to_end {k}": v for k, v in r["end_to_end"].items() if k != "count"})
+        flat.update({f"ttft {k}": v for k, v in r.get("time_to_first_token", {}).items() if k != "count"})
+        for stage, row in r["stages"].items():
+            flat[f"{stage} p95_ms"] = row["p95_ms"]
+        return flat
+
+    before, after = rows(previous["results"]), rows(report["results"])
+    print(f"\n🔍 Compared with {previous['commit']} ({previous['timestamp']})")
+    print(f"{'metric':<30}{'before':>12}{'after':>12}{'change':>10}")
+    for name, value in after.items():
+        if name not in before:
+            continue
+        change = f"{(value - before[name]) / before[name]:+.1%}" if before[name] else "-"
+        print(f"{name:<30}{before[name]:>12.2f}{value:>12.2f}{change:>10}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline load test for rag_queue")
+    parser.add_argument("mode", choices=["chat", "stream", "worker"],
+                        help="server /chat (+ long-poll), server /chat/stream, or RQ worker pool")
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=20, help="concurrent clients (worker threads for worker)")
+    parser.add_argument("--distinct", type=int, help="distinct questions among the requests (default: all distinct)")
+    parser.add_argument("--warmup", type=int, default=20, help="unmeasured requests sent first")
+    parser.add_argument("--docs", type=int, default=2000, help="synthetic chunks in the vector store")
+    parser.add_argument("--embed-ms", type=float, default=5.0, help="latency of one embedding forward pass")
+    parser.add_argument("--ttft-ms", type=float, default=200.0, help="fake LLM time to first token")
+    parser.add_argument("--tokens-per-sec", type=float, default=50.0, help="fake LLM generation rate")
+    parser.add_argument("--completion-tokens", type=int, default=64)
+    parser.add_argument("--providers", type=int, default=1, help="fake LLM providers behind the router")
+    parser.add_argument("--tail-fraction", type=float, default=0.0, help="share of LLM requests that stall")
+    parser.add_argument("--tail-ms", type=float, default=5000.0, help="extra delay of a stalled request")
+    parser.add_argument("--priority", choices=["interactive", "batch"], default="batch", help="RQ queue for worker")
+    parser.add_argument("--enqueue-batch", type=int, default=1000, help="queries per enqueue_many call for worker")
+    parser.add_argument("--compare", help="earlier result file to compare against")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    args.distinct = args.distinct or args.requests
+
+    # Keep admission control out of the way of the load
+    os.environ.update({
+        "QUEUE_MAX_DEPTH_INTERACTIVE": str(args.requests + args.warmup),
+        "QUEUE_MAX_DEPTH_BATCH": str(args.requests + args.warmup),
+        "CLIENT_RATE": "1000000",
+        "CLIENT_BURST": "1000000",
+        "BATCH_CLIENT_RATE": "1000000",
+        "BATCH_CLIENT_BURST": "1000000"
+    })
+
+    rng = random.Random(args.seed)
+    embeddings = FakeEmbeddings(size=EMBEDDING_DIM, latency=args.embed_ms / 1000)
+    llm = LLMRouter([
+        FakeLLM(f"fake-{i}", args.ttft_ms / 1000, args.tokens_per_sec, args.completion_tokens,
+                args.tail_fraction, args.tail_ms / 1000)
+        for i in range(args.providers)
+    ])
+    redis = fakeredis.FakeRedis(server=fakeredis.FakeServer())
+
+    print(f"🏁 {args.mode}: {args.requests} requests ({args.distinct} distinct), concurrency {args.concurrency}, "
+          f"LLM {args.ttft_ms:g} ms + {args.completion_tokens} tokens at {args.tokens_per_sec:g}/s")
+    run = run_worker if args.mode == "worker" else run_server
+    try:
+        results = run(args, embeddings, llm, redis, rng)
+    finally:
+        shutil.rmtree(SCRATCH, ignore_errors=True)
+
+    report = {
+        "benchmark": "rag_queue",
+        "mode": args.mode,
+        "commit": git_commit(),
+        "timestamp": time.strftime("%Y-%m-%d %H:%M:%S"),
+        "config": {k: v for k, v in vars(args).items() if k != "compare"},
+        "results": results
+    }
+    print_report(report)
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            print_comparison(report, json.load(f))
+
+    RESULTS_DIR.mkdir(exist_ok=True)
+    out = RESULTS_DIR / f"rag_queue-{args.mode}-{time.strftime('%Y%m%d-%H%M%S')}.json"
+    with open(out, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    print(f"\n💾 Saved {out}")
+
+
+if __name__ == "__main__":
+    main()
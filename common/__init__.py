@@ -0,0 +1,26 @@
+from .context import PackedContext, get_token_counter, pack_context
+from .embeddings import EMBEDDING_MODEL, CachedEmbeddings, get_embedding_model
+from .history import ShortTermMemory
+from .llm_router import Completion, LLMRouter, NoProviderAvailable, get_llm_router
+from .vector_store import LocalVectorStore, get_vector_store, match_filter, quantization_config, search_params
+from .versions import CollectionVersions
+
+__all__ = [
+    "PackedContext",
+    "get_token_counter",
+    "pack_context",
+    "EMBEDDING_MODEL",
+    "CachedEmbeddings",
+    "get_embedding_model",
+    "ShortTermMemory",
+    "Completion",
+    "LLMRouter",
+    "NoProviderAvailable",
+    "get_llm_router",
+    "LocalVectorStore",
+    "get_vector_store",
+    "match_filter",
+    "quantization_config",
+    "search_params",
+    "CollectionVersions",
+]
@@ -0,0 +1,167 @@
+"""
+Token-budgeted context packing for RAG prompts.
+
+Retrieved chunks overlap heavily (chunk_overlap=400 on chunk_size=1000), and
+joining the top-k blindly wastes prompt tokens on repeated text. pack_context()
+walks the chunks in relevance order and:
+1. trims spans that overlap a chunk already packed (suffix/prefix overlaps from
+   the splitter, or chunks fully contained in another)
+2. drops near-duplicates (word-shingle Jaccard similarity)
+3. adds what is left until the token budget is reached, counting tokens with
+   the target model's tokenizer, truncating the last chunk to fit
+"""
+import os
+import re
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Callable, List
+
+from langchain_core.documents import Document
+
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "1500"))
+CONTEXT_SEPARATOR = "\n\n---\n\n"
+
+MIN_OVERLAP_CHARS = 50      # shorter suffix/prefix matches are coincidence
+MIN_CHUNK_CHARS = 50        # chunks trimmed below this add nothing
+MIN_TRUNCATED_TOKENS = 32   # don't bother squeezing in less than this
+DUPLICATE_THRESHOLD = 0.85  # shingle Jaccard similarity of near-duplicates
+OVERLAP_WINDOW = 1000       # chars compared at each chunk boundary (>= chunk_overlap)
+
+
+@lru_cache(maxsize=None)
+def get_token_counter(model_name: str) -> Callable[[str], int]:
+    """
+    Token counter for a model.
+
+    Uses the model's own tokenizer from the HuggingFace Hub when available,
+    otherwise tiktoken's cl100k_base, otherwise ~4 characters per token.
+    """
+    try:
+        from tokenizers import Tokenizer
+        tokenizer = Tokenizer.from_pretrained(model_name, token=os.getenv("HUGGINGFACE_TOKEN"))
+        return lambda text: len(tokenizer.encode(text, add_special_tokens=False).ids)
+    except Exception:
+        pass
+    try:
+        import tiktoken
+        encoding = tiktoken.get_encoding("cl100k_base")
+        return lambda text: len(encoding.encode(text, disallowed_special=()))
+    except Exception:
+        return lambda text: len(text) // 4 + 1
+
+
+@dataclass
+class PackedContext:
+    text: str
+    tokens: int
+    chunks_used: int
+    chunks_dropped: int
+
+
+def _longest_overlap(a: str, b: str) -> int:
+    """Length of the longest suffix of `a` that is also a prefix of `b` (KMP prefix function)."""
+    a, b = a[-OVERLAP_WINDOW:], b[:OVERLAP_WINDOW]
+    s = b + "\x00" + a
+    prefix = [0] * len(s)
+    for i in range(1, len(s)):
+        j = prefix[i - 1]
+        while j and s[i] != s[j]:
+            j = prefix[j - 1]
+        if s[i] == s[j]:
+            j += 1
+        prefix[i] = j
+    return prefix[-1]
+
+
+def _trim_overlap(packed: str, text: str) -> str:
+    """Remove the parts of `text` already present in `packed`."""
+    if text in packed:
+        return ""
+    overlap = _longest_overlap(packed, text)
+    if overlap >= MIN_OVERLAP_CHARS:
+        text = text[overlap:]
+    overlap = _longest_overlap(text, packed)
+    if overlap >= MIN_OVERLAP_CHARS:
+        text = text[:-overlap]
+    return text.strip()
+
+
+def _shingles(text: str, size: int = 3) -> set:
+    words = re.findall(r"\w+", text.lower())
+    return {tuple(words[i:i + size]) for i in range(max(1, len(words) - size + 1))}
+
+
+def _truncate(text: str, max_tokens: int, count_tokens: Callable[[str], int]) -> str:
+    """Longest word prefix of `text` within `max_tokens` (binary search)."""
+    words = text.split(" ")
+    low, high = 0, len(words)
+    while low < high:
+        mid = (low + high + 1) // 2
+        if count_tokens(" ".join(words[:mid])) <= max_tokens:
+            low = mid
+        else:
+            high = mid - 1
+    return " ".join(words[:low])
+
+
+def pack_context(
+    docs: List[Document],
+    count_tokens: Callable[[str], int],
+    budget: int = CONTEXT_TOKEN_BUDGET,
+    separator: str = CONTEXT_SEPARATOR
+) -> PackedContext:
+    """
+    Pack retrieved chunks into a context string within a token budget.
+
+    Args:
+        docs: Retrieved documents, most relevant first
+        count_tokens: Token counter of the target model (see get_token_counter)
+        budget: Maximum context tokens
+        separator: String placed between chunks
+
+    Returns:
+        PackedContext: The context text and packing statistics
+    """
+    separator_tokens = count_tokens(separator)
+    packed: List[str] = []
+    packed_shingles: List[set] = []
+    used = 0
+
+    for doc in docs:
+        text = doc.page_content.strip()
+        for previous in packed:
+            text = _trim_overlap(previous, text)
+            if not text:
+                break
+        if len(text) < MIN_CHUNK_CHARS:
+            continue
+
+        shingles = _shingles(text)
+        if any(
+            len(shingles & other) / len(shingles | other) >= DUPLICATE_THRESHOLD
+            for other in packed_shingles
+        ):
+            continue
+
+        cost = count_tokens(text) + (separator_tokens if packed else 0)
+        if used + cost > budget:
+            remaining = budget - used - (separator_tokens if packed else 0)
+            if remaining < MIN_TRUNCATED_TOKENS:
+                continue  # a shorter chunk further down may still fit
+            text = _truncate(text, remaining, count_tokens)
+            if not text:
+                continue
+            cost = count_tokens(text) + (separator_tokens if packed else 0)
+
+        packed.append(text)
+        packed_shingles.append(shingles)
+        used += cost
+        if budget - used < MIN_TRUNCATED_TOKENS:
+            break
+
+    return PackedContext(
+        text=separator.join(packed),
+        tokens=used,
+        chunks_used=len(packed),
+        chunks_dropped=len(docs) - len(packed)
+    )
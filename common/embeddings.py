@@ -0,0 +1,279 @@
+"""
+Shared, cached embeddings for every retrieval entry point.
+
+CachedEmbeddings wraps HuggingFaceEmbeddings with two cache tiers:
+- an in-memory LRU of recently used vectors
+- a disk cache shared by every process on the machine: a memory-mapped float32
+  matrix (vectors.f32) and a compact key index (keys.bin, one 16-byte digest
+  per row, in row order)
+
+Keys are a hash of the model name plus the text, so repeat queries and
+re-indexing runs skip the model forward pass entirely. The model itself is only
+loaded on the first cache miss.
+"""
+import fcntl
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+# ================================
+# Configuration
+# ================================
+EMBEDDING_MODEL = os.getenv("EMBEDDING_MODEL", "sentence-transformers/all-MiniLM-L6-v2")
+CACHE_DIR = Path(os.getenv(
+    "EMBEDDING_CACHE_DIR",
+    Path(__file__).resolve().parent.parent / ".cache" / "embeddings"
+))
+LRU_SIZE = int(os.getenv("EMBEDDING_LRU_SIZE", "10000"))
+
+KEY_SIZE = 16            # bytes per key digest
+INITIAL_CAPACITY = 1024  # rows preallocated in a new vectors file
+
+
+class DiskEmbeddingCache:
+    """
+    Append-only vector cache backed by a memory-mapped float32 matrix.
+
+    Writers take an exclusive file lock, write the vector rows first and only
+    then append their keys, so a reader that knows a key can always read its
+    row. Readers pick up rows appended by other processes on the next lookup.
+    """
+
+    def __init__(self, directory: Path):
+        directory.mkdir(parents=True, exist_ok=True)
+        self.meta_path = directory / "meta.json"
+        self.keys_path = directory / "keys.bin"
+        self.vectors_path = directory / "vectors.f32"
+        self.lock_path = directory / ".lock"
+
+        self._index: Dict[bytes, int] = {}
+        self._rows = 0
+        self._dim: Optional[int] = None
+        self._vectors: Optional[np.memmap] = None
+        self._lock = threading.RLock()
+        self._refresh()
+
+    def __len__(self) -> int:
+        return self._rows
+
+    def _map(self):
+        """(Re)map the vectors file at its current size."""
+        size = self.vectors_path.stat().st_size if self.vectors_path.exists() else 0
+        capacity = size // (self._dim * 4)
+        self._vectors = None
+        if capacity:
+            self._vectors = np.memmap(
+                self.vectors_path, dtype=np.float32, mode="r+", shape=(capacity, self._dim)
+            )
+
+    def _refresh(self):
+        """Load keys appended since the last refresh, by this or another process."""
+        if self._dim is None:
+            if not self.meta_path.exists():
+                return
+            with open(self.meta_path, "r", encoding="utf-8") as f:
+                self._dim = json.load(f)["dim"]
+
+        size = self.keys_path.stat().st_size if self.keys_path.exists() else 0
+        loaded = self._rows * KEY_SIZE
+        # Ignore a partially written trailing key
+        size -= size % KEY_SIZE
+        if size <= loaded:
+            return
+
+        with open(self.keys_path, "rb") as f:
+            f.seek(loaded)
+            data = f.read(size - loaded)
+        for offset in range(0, len(data), KEY_SIZE):
+            self._index[data[offset:offset + KEY_SIZE]] = self._rows
+            self._rows += 1
+
+        if self._vectors is None or self._vectors.shape[0] < self._rows:
+            self._map()
+
+    def get_many(self, keys: Iterable[bytes]) -> Dict[bytes, np.ndarray]:
+        """Return the cached vectors for whichever of `keys` are present."""
+        with self._lock:
+            keys = list(keys)
+            if any(key not in self._index for key in keys):
+                self._refresh()
+            found = {}
+            for key in keys:
+                row = self._index.get(key)
+                if row is not None:
+                    found[key] = np.array(self._vectors[row])
+            return found
+
+    def put_many(self, items: Dict[bytes, np.ndarray]):
+        """Append vectors for keys that are not cached yet."""
+        if not items:
+            return
+        with self._lock, open(self.lock_path, "a") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                self._refresh()
+                new = [(key, vector) for key, vector in items.items() if key not in self._index]
+                if not new:
+                    return
+
+                if self._dim is None:
+                    self._dim = len(new[0][1])
+                    with open(self.meta_path, "w", encoding="utf-8") as f:
+                        json.dump({"dim": self._dim}, f)
+
+                # Grow the file geometrically so appends stay amortized O(1)
+                needed = self._rows + len(new)
+                capacity = 0 if self._vectors is None else self._vectors.shape[0]
+                if needed > capacity:
+                    capacity = max(needed, capacity * 2, INITIAL_CAPACITY)
+                    if self._vectors is not None:
+                        self._vectors.flush()
+                    with open(self.vectors_path, "ab") as f:
+                        f.truncate(capacity * self._dim * 4)
+                    self._map()
+
+                start = self._rows
+                self._vectors[start:needed] = np.asarray([v for _, v in new], dtype=np.float32)
+                self._vectors.flush()
+
+                with open(self.keys_path, "ab") as f:
+                    f.write(b"".join(key for key, _ in new))
+                for row, (key, _) in enumerate(new, start):
+                    self._index[key] = row
+                self._rows = needed
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+class CachedEmbeddings(Embeddings):
+    """HuggingFace embeddings with an in-memory LRU and a shared disk cache."""
+
+    def __init__(
+        self,
+        model_name: str = EMBEDDING_MODEL,
+        cache_dir: Path = CACHE_DIR,
+        lru_size: int = LRU_SIZE,
+        base: Optional[Embeddings] = None
+    ):
+        """
+        Initialize the cached embeddings.
+
+        Args:
+            model_name: Sentence-transformers model name
+            cache_dir: Root directory of the disk cache
+            lru_size: Number of vectors kept in memory
+            base: Underlying embeddings (defaults to HuggingFaceEmbeddings,
+                loaded lazily on the first cache miss)
+        """
+        self.model_name = model_name
+        self.lru_size = lru_size
+        self.disk = DiskEmbeddingCache(Path(cache_dir) / model_name.replace("/", "__"))
+        self._base = base
+        self._lru: "OrderedDict[bytes, np.ndarray]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._model_lock = threading.Lock()
+
+        self.hits_memory = 0
+        self.hits_disk = 0
+        self.misses = 0
+
+    @property
+    def base(self) -> Embeddings:
+        """The wrapped embedding model, loaded on first use."""
+        if self._base is None:
+            with self._model_lock:
+                if self._base is None:
+                    from langchain_huggingface import HuggingFaceEmbeddings
+                    self._base = HuggingFaceEmbeddings(model_name=self.model_name)
+        return self._base
+
+    def _key(self, text: str) -> bytes:
+        return hashlib.blake2b(
+            f"{self.model_name}\x00{text}".encode("utf-8"), digest_size=KEY_SIZE
+        ).digest()
+
+    def _remember(self, key: bytes, vector: np.ndarray):
+        """Insert into the LRU tier. Caller holds self._lock."""
+        self._lru[key] = vector
+        self._lru.move_to_end(key)
+        while len(self._lru) > self.lru_size:
+            self._lru.popitem(last=False)
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        """Embed texts, running the model only for texts never seen before."""
+        keys = [self._key(text) for text in texts]
+        vectors: Dict[bytes, np.ndarray] = {}
+
+        # Tier 1: in-memory LRU
+        with self._lock:
+            for key in keys:
+                vector = self._lru.get(key)
+                if vector is not None:
+                    self._lru.move_to_end(key)
+                    vectors[key] = vector
+                    self.hits_memory += 1
+
+        # Tier 2: memory-mapped disk cache
+        missing = {key: text for key, text in zip(keys, texts) if key not in vectors}
+        if missing:
+            found = self.disk.get_many(missing)
+            with self._lock:
+                for key, vector in found.items():
+                    self._remember(key, vector)
+                    self.hits_disk += 1
+            vectors.update(found)
+
+        # Tier 3: the model, once per unique text
+        missing = {key: text for key, text in missing.items() if key not in vectors}
+        if missing:
+            embedded = self.base.embed_documents(list(missing.values()))
+            computed = {
+                key: np.asarray(vector, dtype=np.float32)
+                for key, vector in zip(missing, embedded)
+            }
+            self.disk.put_many(computed)
+            with self._lock:
+                for key, vector in computed.items():
+                    self._remember(key, vector)
+                self.misses += len(computed)
+            vectors.update(computed)
+
+        return [vectors[key].tolist() for key in keys]
+
+    def embed_query(self, text: str) -> List[float]:
+        """Embed a single query through the same cache."""
+        return self.embed_documents([text])[0]
+
+    def stats(self) -> dict:
+        """Hit/miss counters for monitoring."""
+        lookups = self.hits_memory + self.hits_disk + self.misses
+        return {
+            "model": self.model_name,
+            "hits_memory": self.hits_memory,
+            "hits_disk": self.hits_disk,
+            "misses": self.misses,
+            "hit_rate": (self.hits_memory + self.hits_disk) / lookups if lookups else 0.0,
+            "lru_entries": len(self._lru),
+            "disk_entries": len(self.disk)
+        }
+
+
+_embedding_model: Optional[CachedEmbeddings] = None
+_embedding_lock = threading.Lock()
+
+
+def get_embedding_model() -> CachedEmbeddings:
+    """Process-wide cached embedding model shared by all entry points."""
+    global _embedding_model
+    if _embedding_model is None:
+        with _embedding_lock:
+            if _embedding_model is None:
+                _embedding_model = CachedEmbeddings()
+    return _embedding_model
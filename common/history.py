@@ -0,0 +1,180 @@
+"""
+Token-budgeted short-term conversation memory.
+
+Chat loops that append every message to a list send an ever longer prompt and
+keep whole sessions in RAM. ShortTermMemory keeps the recent messages in a
+bounded buffer instead, trimmed by token count (with the target model's
+tokenizer, see get_token_counter()) and by a fixed message capacity. The oldest
+whole turns are evicted first, and the current turn never is.
+
+Evicted turns are folded into a rolling summary that is sent as a system
+message ahead of the kept messages. The summary is updated incrementally: the
+LLM sees the previous summary plus only the newly evicted turns. Trimming goes
+down to HISTORY_LOW_WATER of the budget, so the summary is refreshed every few
+turns rather than on every one. Without an LLM (or if the call fails), the
+evicted turns are condensed to their first words instead.
+"""
+import os
+from collections import deque
+from typing import Callable, Deque, List, Optional
+
+HISTORY_TOKEN_BUDGET = int(os.getenv("HISTORY_TOKEN_BUDGET", "2000"))
+HISTORY_MAX_MESSAGES = int(os.getenv("HISTORY_MAX_MESSAGES", "64"))
+HISTORY_SUMMARY_TOKENS = int(os.getenv("HISTORY_SUMMARY_TOKENS", "300"))
+HISTORY_LOW_WATER = float(os.getenv("HISTORY_LOW_WATER", "0.75"))
+
+FALLBACK_SNIPPET_CHARS = 160  # per evicted message, when no LLM summarizes
+
+SUMMARY_PROMPT = """Update the running summary of a conversation between a user and an AI assistant.
+
+Current summary:
+{summary}
+
+Messages that are leaving the conversation window:
+{messages}
+
+Write the updated summary in at most {words} words. Keep facts about the user, their
+goals and preferences, decisions, tool results and open questions. Drop small talk.
+
+Updated summary:"""
+
+
+class ShortTermMemory:
+    """Recent messages within a token budget, plus a rolling summary of older ones."""
+
+    def __init__(
+        self,
+        count_tokens: Callable[[str], int],
+        complete: Optional[Callable[[List[dict]], str]] = None,
+        token_budget: int = HISTORY_TOKEN_BUDGET,
+        max_messages: int = HISTORY_MAX_MESSAGES,
+        summary_tokens: int = HISTORY_SUMMARY_TOKENS
+    ):
+        """
+        Initialize an empty history.
+
+        Args:
+            count_tokens: Token counter for the model the messages are sent to
+            complete: Sends chat messages to an LLM and returns its reply, used to
+                      update the summary (None condenses evicted turns without an LLM)
+            token_budget: Most tokens of kept messages and summary together
+            max_messages: Most messages kept, whatever their size
+            summary_tokens: Most tokens in the rolling summary
+        """
+        self.count_tokens = count_tokens
+        self.complete = complete
+        self.token_budget = token_budget
+        self.max_messages = max_messages
+        self.summary_tokens = summary_tokens
+
+        self.summary = ""
+        self._messages: Deque[dict] = deque()
+        self._tokens: Deque[int] = deque()  # token count of each kept message
+        self._total = 0
+        self._summary_total = 0
+        self.evicted = 0
+        self.summary_updates = 0
+
+    def add(self, role: str, content: str):
+        """Append a message, evicting (and summarizing) the oldest turns if over budget."""
+        tokens = self.count_tokens(content) + 4  # role and separators
+        self._messages.append({"role": role, "content": content})
+        self._tokens.append(tokens)
+        self._total += tokens
+        if self._over(1.0):
+            self._trim()
+
+    def add_turn(self, user: str, assistant: str):
+        """Append a user message and the assistant's reply."""
+        self.add("user", user)
+        self.add("assistant", assistant)
+
+    def messages(self) -> List[dict]:
+        """The summary (as a system message, if any) followed by the kept messages."""
+        messages = list(self._messages)
+        if self.summary:
+            messages.insert(0, {"role": "system", "content": f"Summary of the earlier conversation:\n{self.summary}"})
+        return messages
+
+    @property
+    def tokens(self) -> int:
+        """Tokens the history adds to a prompt."""
+        return self._total + self._summary_total
+
+    def __len__(self) -> int:
+        return len(self._messages)
+
+    def clear(self):
+        """Forget the messages and the summary."""
+        self.summary = ""
+        self._messages.clear()
+        self._tokens.clear()
+        self._total = self._summary_total = 0
+
+    def _over(self, fraction: float) -> bool:
+        return (
+            self._total + self._summary_total > self.token_budget * fraction
+            or len(self._messages) > self.max_messages * fraction
+        )
+
+    def _turn_starts(self) -> List[int]:
+        return [i for i, message in enumerate(self._messages) if message["role"] == "user"]
+
+    def _trim(self):
+        evicted = []
+        while self._over(HISTORY_LOW_WATER):
+            # Whole turns only (a user message through the replies and tool results
+            # that follow it), never the latest one
+            later_turns = [i for i in self._turn_starts() if i > 0]
+            if not later_turns:
+                break
+            for _ in range(later_turns[0]):
+                evicted.append(self._messages.popleft())
+                self._total -= self._tokens.popleft()
+        if evicted:
+            self.evicted += len(evicted)
+            self._summarize(evicted)
+
+    def _summarize(self, evicted: List[dict]):
+        listing = "\n".join(f"{m['role']}: {m['content']}" for m in evicted)
+        summary = None
+        if self.complete is not None:
+            prompt = SUMMARY_PROMPT.format(
+                summary=self.summary or "(empty)",
+                messages=listing,
+                words=int(self.summary_tokens * 0.75)
+            )
+            try:
+                summary = self.complete([{"role": "user", "content": prompt}]).strip()
+            except Exception as e:
+                print(f"⚠️ Conversation summary update failed: {e}")
+        if not summary:
+            condensed = "\n".join(
+                f"- {m['role']}: {' '.join(m['content'].split())[:FALLBACK_SNIPPET_CHARS]}" for m in evicted
+            )
+            summary = f"{self.summary}\n{condensed}".strip()
+        self.summary = self._fit_summary(summary)
+        self._summary_total = self.count_tokens(self.summary) + 4
+        self.summary_updates += 1
+
+    def _fit_summary(self, summary: str) -> str:
+        """Cut a summary to its token budget, keeping the most recent lines."""
+        if self.count_tokens(summary) <= self.summary_tokens:
+            return summary
+        lines = summary.splitlines()
+        while len(lines) > 1 and self.count_tokens("\n".join(lines)) > self.summary_tokens:
+            lines.pop(0)
+        text = "\n".join(lines)
+        while text and self.count_tokens(text) > self.summary_tokens:
+            text = text[len(text) // 10 + 1:]
+        return text
+
+    def stats(self) -> dict:
+        """History size counters for monitoring."""
+        return {
+            "messages": len(self._messages),
+            "tokens": self.tokens,
+            "summary_tokens": self._summary_total,
+            "evicted_messages": self.evicted,
+            "summary_updates": self.summary_updates
+        }
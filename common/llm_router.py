@@ -0,0 +1,456 @@
+"""
+Latency-aware routing across LLM providers, with hedged requests.
+
+LLMRouter sends each request to the first healthy provider in preference
+order. It keeps a rolling window of recent latencies per provider (full
+completion time, and time to first token for streams). If the request is still
+running when it passes that provider's p95, a hedged copy goes to a backup
+provider: the fastest healthy one by recent p95, or the same provider again
+when there is no other. Whichever answer arrives first wins and the loser is
+cancelled. A provider that fails is skipped for the next one straight away.
+After repeated failures its circuit breaker opens and it gets no traffic until
+a trial request succeeds.
+
+Providers are configured as "kind:model" specs, in preference order:
+- hf:<repo id>          HuggingFace Inference (HUGGINGFACE_TOKEN)
+- gemini:<model>        Gemini through its OpenAI-compatible endpoint (GEMINI_API_KEY)
+- ollama:<model>        Local Ollama through its OpenAI-compatible endpoint (OLLAMA_URL)
+
+LLM_PROVIDERS (comma separated) overrides each entry point's default list.
+"""
+import asyncio
+import os
+import threading
+import time
+from collections import deque
+from dataclasses import dataclass
+from typing import AsyncIterator, Awaitable, Callable, List, Optional
+
+OLLAMA_URL = os.getenv("OLLAMA_URL", "http://localhost:11434/v1")
+GEMINI_OPENAI_URL = "https://generativelanguage.googleapis.com/v1beta/openai/"
+LLM_TIMEOUT = float(os.getenv("LLM_TIMEOUT", "120"))
+
+# Hedging: fire a backup request once the first passes this percentile of its provider's latency
+HEDGE_PERCENTILE = float(os.getenv("LLM_HEDGE_PERCENTILE", "95"))
+HEDGE_MIN_SAMPLES = int(os.getenv("LLM_HEDGE_MIN_SAMPLES", "20"))   # below this, use the default delay
+HEDGE_DEFAULT_DELAY = float(os.getenv("LLM_HEDGE_DEFAULT_DELAY", "5"))
+HEDGE_MIN_DELAY = float(os.getenv("LLM_HEDGE_MIN_DELAY", "0.1"))
+MAX_HEDGES = int(os.getenv("LLM_MAX_HEDGES", "1"))
+LATENCY_WINDOW = int(os.getenv("LLM_LATENCY_WINDOW", "200"))
+
+# Circuit breaker: open after this many consecutive failures, try again after the reset time
+BREAKER_FAILURES = int(os.getenv("LLM_BREAKER_FAILURES", "5"))
+BREAKER_RESET_SECONDS = float(os.getenv("LLM_BREAKER_RESET", "30"))
+
+
+class NoProviderAvailable(Exception):
+    """Every provider's circuit breaker is open."""
+
+
+@dataclass
+class Completion:
+    text: str
+    provider: str
+    seconds: float
+    hedged: bool = False
+    prompt_tokens: Optional[int] = None
+    completion_tokens: Optional[int] = None
+
+
+class LatencyWindow:
+    """Rolling window of recent latencies."""
+
+    def __init__(self, size: int = LATENCY_WINDOW):
+        self._samples = deque(maxlen=size)
+
+    def add(self, seconds: float):
+        self._samples.append(seconds)
+
+    def __len__(self) -> int:
+        return len(self._samples)
+
+    def percentile(self, q: float) -> Optional[float]:
+        """The q-th percentile (0-100) of the window, or None if it is empty."""
+        if not self._samples:
+            return None
+        ordered = sorted(self._samples)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * q / 100))]
+
+
+class CircuitBreaker:
+    """
+    Consecutive-failure circuit breaker.
+
+    closed: every request is allowed. open: none are, until `reset_seconds`
+    have passed. half-open: a single trial request is allowed; its success
+    closes the circuit, its failure opens it again.
+    """
+
+    def __init__(self, failures: int = BREAKER_FAILURES, reset_seconds: float = BREAKER_RESET_SECONDS):
+        self.failure_threshold = failures
+        self.reset_seconds = reset_seconds
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+        self.trips = 0
+        self._trial = False
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at < self.reset_seconds:
+            return "open"
+        return "half-open"
+
+    def allow(self) -> bool:
+        """Whether a request may be sent now."""
+        state = self.state
+        return state == "closed" or (state == "half-open" and not self._trial)
+
+    def start(self):
+        """A request is being sent: in half-open state it becomes the trial."""
+        if self.state == "half-open":
+            self._trial = True
+
+    def record_success(self):
+        self.failures = 0
+        self.opened_at = None
+        self._trial = False
+
+    def record_failure(self):
+        self.failures += 1
+        if self._trial or (self.opened_at is None and self.failures >= self.failure_threshold):
+            self.trips += 1
+            self.opened_at = time.monotonic()
+        self._trial = False
+
+    def release(self):
+        """A trial request was cancelled without an outcome."""
+        self._trial = False
+
+
+class Provider:
+    """One LLM backend. Subclasses implement complete() and stream()."""
+
+    def __init__(self, name: str):
+        self.name = name
+        self.latency = LatencyWindow()   # full completion time
+        self.ttft = LatencyWindow()      # time to first streamed token
+        self.breaker = CircuitBreaker()
+        self.requests = 0
+        self.failures = 0
+        self.hedges = 0
+        self.hedge_wins = 0
+
+    async def complete(self, messages: List[dict], max_tokens: int, temperature: float) -> Completion:
+        raise NotImplementedError
+
+    def stream(self, messages: List[dict], max_tokens: int, temperature: float) -> AsyncIterator[str]:
+        raise NotImplementedError
+
+    async def aclose(self):
+        pass
+
+    def stats(self) -> dict:
+        def ms(window: LatencyWindow, q: float):
+            value = window.percentile(q)
+            return None if value is None else round(value * 1000, 1)
+
+        return {
+            "requests": self.requests,
+            "failures": self.failures,
+            "hedges": self.hedges,
+            "hedge_wins": self.hedge_wins,
+            "p50_ms": ms(self.latency, 50),
+            "p95_ms": ms(self.latency, 95),
+            "ttft_p95_ms": ms(self.ttft, 95),
+            "breaker": self.breaker.state,
+            "breaker_trips": self.breaker.trips
+        }
+
+
+class HuggingFaceProvider(Provider):
+    """HuggingFace Inference chat completion."""
+
+    def __init__(self, model: str, timeout: float = LLM_TIMEOUT):
+        from huggingface_hub import AsyncInferenceClient
+
+        super().__init__(f"hf:{model}")
+        self.client = AsyncInferenceClient(model=model, token=os.getenv("HUGGINGFACE_TOKEN"), timeout=timeout)
+
+    async def complete(self, messages, max_tokens, temperature) -> Completion:
+        response = await self.client.chat_completion(messages=messages, max_tokens=max_tokens, temperature=temperature)
+        usage = getattr(response, "usage", None)
+        return Completion(
+            text=response.choices[0].message.content,
+            provider=self.name,
+            seconds=0.0,
+            prompt_tokens=usage.prompt_tokens if usage else None,
+            completion_tokens=usage.completion_tokens if usage else None
+        )
+
+    async def stream(self, messages, max_tokens, temperature) -> AsyncIterator[str]:
+        stream = await self.client.chat_completion(
+            messages=messages, max_tokens=max_tokens, temperature=temperature, stream=True
+        )
+        async for chunk in stream:
+            text = chunk.choices[0].delta.content if chunk.choices else None
+            if text:
+                yield text
+
+    async def aclose(self):
+        await self.client.close()
+
+
+class OpenAICompatibleProvider(Provider):
+    """Any OpenAI-compatible chat completions endpoint (Gemini, Ollama)."""
+
+    def __init__(self, name: str, model: str, base_url: str, api_key: str, timeout: float = LLM_TIMEOUT):
+        from openai import AsyncOpenAI
+
+        super().__init__(name)
+        self.model = model
+        self.client = AsyncOpenAI(base_url=base_url, api_key=api_key, timeout=timeout, max_retries=0)
+
+    async def complete(self, messages, max_tokens, temperature) -> Completion:
+        response = await self.client.chat.completions.create(
+            model=self.model, messages=messages, max_tokens=max_tokens, temperature=temperature
+        )
+        usage = response.usage
+        return Completion(
+            text=response.choices[0].message.content or "",
+            provider=self.name,
+            seconds=0.0,
+            prompt_tokens=usage.prompt_tokens if usage else None,
+            completion_tokens=usage.completion_tokens if usage else None
+        )
+
+    async def stream(self, messages, max_tokens, temperature) -> AsyncIterator[str]:
+        stream = await self.client.chat.completions.create(
+            model=self.model, messages=messages, max_tokens=max_tokens, temperature=temperature, stream=True
+        )
+        async for chunk in stream:
+            text = chunk.choices[0].delta.content if chunk.choices else None
+            if text:
+                yield text
+
+    async def aclose(self):
+        await self.client.close()
+
+
+def make_provider(spec: str, timeout: float = LLM_TIMEOUT) -> Provider:
+    """Build a provider from a "kind:model" spec."""
+    kind, _, model = spec.strip().partition(":")
+    if kind == "hf":
+        return HuggingFaceProvider(model, timeout)
+    if kind == "gemini":
+        return OpenAICompatibleProvider(spec, model, GEMINI_OPENAI_URL, os.getenv("GEMINI_API_KEY", ""), timeout)
+    if kind == "ollama":
+        return OpenAICompatibleProvider(spec, model, OLLAMA_URL, "ollama", timeout)
+    raise ValueError(f"Unknown LLM provider '{spec}' (expected hf:, gemini: or ollama:)")
+
+
+class LLMRouter:
+    """Hedged, circuit-broken requests across providers in preference order."""
+
+    def __init__(
+        self,
+        providers: List[Provider],
+        hedge_percentile: float = HEDGE_PERCENTILE,
+        max_hedges: int = MAX_HEDGES
+    ):
+        """
+        Initialize the router.
+
+        Args:
+            providers: Backends in preference order (the first healthy one is tried first)
+            hedge_percentile: Latency percentile after which a hedged request is sent
+            max_hedges: Hedged requests per call (failures always fall back)
+        """
+        if not providers:
+            raise ValueError("LLMRouter needs at least one provider")
+        self.providers = providers
+        self.hedge_percentile = hedge_percentile
+        self.max_hedges = max_hedges
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._loop_lock = threading.Lock()
+
+    def _candidates(self, window: str) -> List[Provider]:
+        """Healthy providers: the preferred one, then the rest fastest first."""
+        healthy = [p for p in self.providers if p.breaker.allow()]
+        if len(healthy) < 2:
+            return healthy
+
+        def p95(provider: Provider) -> float:
+            value = getattr(provider, window).percentile(self.hedge_percentile)
+            return float("inf") if value is None else value
+
+        return healthy[:1] + sorted(healthy[1:], key=p95)
+
+    def hedge_delay(self, provider: Provider, window: str) -> float:
+        """Seconds to wait on a provider before hedging: its recent p95, once known."""
+        latencies: LatencyWindow = getattr(provider, window)
+        if len(latencies) < HEDGE_MIN_SAMPLES:
+            return HEDGE_DEFAULT_DELAY
+        return max(HEDGE_MIN_DELAY, latencies.percentile(self.hedge_percentile))
+
+    async def _attempt(self, provider: Provider, window: str, call: Callable[[Provider], Awaitable]):
+        provider.requests += 1
+        provider.breaker.start()
+        started = time.perf_counter()
+        try:
+            result = await call(provider)
+        except asyncio.CancelledError:
+            provider.breaker.release()
+            raise
+        except Exception:
+            provider.failures += 1
+            provider.breaker.record_failure()
+            raise
+        getattr(provider, window).add(time.perf_counter() - started)
+        provider.breaker.record_success()
+        return result
+
+    async def _race(self, window: str, call: Callable[[Provider], Awaitable]) -> tuple:
+        """
+        Run `call` on the preferred provider, hedging and falling back as needed.
+
+        Returns:
+            (result, provider, hedged) for the first attempt to succeed
+
+        Raises:
+            NoProviderAvailable: If every circuit is open
+            Exception: The last provider error, if every attempt failed
+        """
+        candidates = self._candidates(window)
+        if not candidates:
+            raise NoProviderAvailable("every LLM provider's circuit breaker is open")
+        # With a single provider, hedge and fall back against it again
+        backups = candidates[1:] or candidates[:1]
+
+        pending = {}
+        hedges = 0
+        last_error: Optional[BaseException] = None
+
+        def launch(provider: Provider, hedge: bool = False):
+            task = asyncio.create_task(self._attempt(provider, window, call))
+            pending[task] = (provider, time.monotonic(), hedge)
+
+        launch(candidates[0])
+        try:
+            while pending:
+                latest, launched_at, _ = list(pending.values())[-1]
+                timeout = None
+                if backups and hedges < self.max_hedges:
+                    timeout = max(0.0, launched_at + self.hedge_delay(latest, window) - time.monotonic())
+                done, _ = await asyncio.wait(pending, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+
+                if not done:
+                    # Slower than its p95: hedge on the next backup
+                    hedges += 1
+                    latest.hedges += 1
+                    launch(backups.pop(0), hedge=True)
+                    continue
+
+                for task in done:
+                    provider, _, hedge = pending.pop(task)
+                    if task.exception() is None:
+                        if hedge:
+                            provider.hedge_wins += 1
+                        return task.result(), provider, bool(hedges)
+                    last_error = task.exception()
+                    print(f"⚠️ LLM provider {provider.name} failed: {last_error!r}")
+
+                # Every attempt in flight failed: fall back to the next backup
+                if not pending and backups:
+                    launch(backups.pop(0))
+        finally:
+            for task in pending:
+                task.cancel()
+            if pending:
+                await asyncio.gather(*pending, return_exceptions=True)
+        raise last_error
+
+    async def complete(self, messages: List[dict], max_tokens: int = 512, temperature: float = 0.7) -> Completion:
+        """
+        Generate a full answer.
+
+        Args:
+            messages: Chat messages ({"role", "content"} dicts)
+            max_tokens: Maximum tokens to generate
+            temperature: Sampling temperature
+
+        Returns:
+            Completion: The first answer to arrive, with the provider that produced it
+        """
+        started = time.perf_counter()
+        completion, _, hedged = await self._race(
+            "latency", lambda provider: provider.complete(messages, max_tokens, temperature)
+        )
+        completion.seconds = time.perf_counter() - started
+        completion.hedged = hedged
+        return completion
+
+    def complete_sync(self, messages: List[dict], max_tokens: int = 512, temperature: float = 0.7) -> Completion:
+        """
+        complete() for synchronous callers, from any thread.
+
+        Calls run on one background event loop, so the providers' async
+        clients (and their connection pools) are shared by every thread.
+        """
+        with self._loop_lock:
+            if self._loop is None:
+                self._loop = asyncio.new_event_loop()
+                threading.Thread(target=self._loop.run_forever, name="llm-router", daemon=True).start()
+        return asyncio.run_coroutine_threadsafe(self.complete(messages, max_tokens, temperature), self._loop).result()
+
+    async def stream(self, messages: List[dict], max_tokens: int = 512, temperature: float = 0.7) -> AsyncIterator[str]:
+        """
+        Stream an answer as text deltas.
+
+        Providers race for the first token (hedging past the p95 time to first
+        token); the winner's stream is relayed to the end. A failure after the
+        first token cannot fall back and is raised.
+        """
+        async def first_token(provider: Provider) -> tuple:
+            tokens = provider.stream(messages, max_tokens, temperature)
+            try:
+                return await tokens.__anext__(), tokens
+            except StopAsyncIteration:
+                return "", tokens
+            except BaseException:
+                await tokens.aclose()
+                raise
+
+        (first, tokens), provider, _ = await self._race("ttft", first_token)
+        try:
+            if first:
+                yield first
+            async for text in tokens:
+                yield text
+        except Exception:
+            provider.failures += 1
+            provider.breaker.record_failure()
+            raise
+        finally:
+            await tokens.aclose()
+
+    async def aclose(self):
+        for provider in self.providers:
+            await provider.aclose()
+
+    def stats(self) -> dict:
+        """Per-provider latency, hedging and circuit breaker state."""
+        return {provider.name: provider.stats() for provider in self.providers}
+
+
+def get_llm_router(default: str, timeout: float = LLM_TIMEOUT) -> LLMRouter:
+    """
+    Router over the LLM_PROVIDERS specs, or `default` if it is not set.
+
+    Args:
+        default: Comma-separated "kind:model" specs in preference order
+        timeout: Per-request timeout of each provider's client
+    """
+    specs = [spec for spec in (os.getenv("LLM_PROVIDERS") or default).split(",") if spec.strip()]
+    return LLMRouter([make_provider(spec, timeout) for spec in specs])
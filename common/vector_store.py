@@ -0,0 +1,960 @@
+"""
+Embedded, in-process vector store and backend selection.
+
+LocalVectorStore is a drop-in LangChain VectorStore for collections that fit in
+RAM, so retrieval does not need a network round trip to Qdrant. A store is a
+directory holding:
+- meta.json       dimension, row count and generation (bumped by clear()),
+                  rewritten after every write
+- vectors.f32     memory-mapped float32 matrix of L2-normalized vectors
+- payloads.jsonl  one {"id", "page_content", "metadata"} record per row,
+                  {"id", "metadata_update"} partial updates and
+                  {"id", "deleted": true} tombstones
+- ivf.npz         centroids and row assignments, if IVF mode was built
+- quantized.npz   int8 or binary codes, if quantization is enabled
+
+Search is exact cosine top-k (one matmul plus argpartition) by default. After
+build_ivf(), only the rows of the `n_probe` closest centroids are scored.
+After quantize("int8" | "binary"), candidates are first ranked on the compact
+codes held in RAM, oversampled, and rescored with the full-precision vectors,
+which stay on disk behind the memory map.
+Writers in several processes take turns on a file lock (.lock) and catch up
+on each other's rows before appending; readers in other processes pick up new
+rows on their next search, and reload from scratch when the store was cleared.
+
+get_vector_store() picks the backend from VECTOR_BACKEND (qdrant | local),
+asimilarity_search_by_vector() searches either one without blocking an event
+loop, and import_from_qdrant() / export_to_qdrant() move a collection between the two:
+
+    python -m common.vector_store import rag
+    python -m common.vector_store build-ivf rag --lists 256
+    python -m common.vector_store quantize rag --mode int8
+    python -m common.vector_store export rag
+
+Qdrant collections created by this repo get the same scheme natively when
+VECTOR_QUANTIZATION is set (see quantization_config() and search_params()).
+"""
+import argparse
+import asyncio
+import bisect
+import fcntl
+import json
+import os
+import threading
+import uuid
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+from langchain_core.vectorstores import VectorStore
+from qdrant_client import QdrantClient, models
+
+# ================================
+# Configuration
+# ================================
+VECTOR_BACKEND = os.getenv("VECTOR_BACKEND", "qdrant")
+QDRANT_URL = os.getenv("QDRANT_URL", "http://localhost:6333")
+LOCAL_VECTOR_DIR = Path(os.getenv(
+    "LOCAL_VECTOR_DIR",
+    Path(__file__).resolve().parent.parent / ".cache" / "vectors"
+))
+
+# Opt-in vector quantization: none | int8 | binary
+VECTOR_QUANTIZATION = os.getenv("VECTOR_QUANTIZATION", "none")
+# Candidates scored on quantized vectors per result, before full-precision rescoring
+QUANTIZATION_OVERSAMPLING = float(os.getenv("QUANTIZATION_OVERSAMPLING", "3.0"))
+
+INITIAL_CAPACITY = 1024     # rows preallocated in a new vectors file
+KMEANS_SAMPLE_PER_LIST = 64  # training rows per IVF list
+ASSIGN_BATCH_SIZE = 65536    # rows assigned to centroids per matmul
+
+
+def match_filter(**conditions) -> models.Filter:
+    """Equality filter on metadata fields, understood by both backends."""
+    return models.Filter(must=[
+        models.FieldCondition(key=f"metadata.{key}", match=models.MatchValue(value=value))
+        for key, value in conditions.items()
+    ])
+
+
+def quantization_config(mode: str = VECTOR_QUANTIZATION):
+    """Qdrant quantization config for new collections, or None."""
+    if mode == "int8":
+        return models.ScalarQuantization(
+            scalar=models.ScalarQuantizationConfig(
+                type=models.ScalarType.INT8,
+                quantile=0.99,
+                always_ram=True
+            )
+        )
+    if mode == "binary":
+        return models.BinaryQuantization(
+            binary=models.BinaryQuantizationConfig(always_ram=True)
+        )
+    if mode != "none":
+        raise ValueError(f"Unknown quantization mode: {mode}")
+    return None
+
+
+def search_params(
+    mode: str = VECTOR_QUANTIZATION,
+    oversampling: float = QUANTIZATION_OVERSAMPLING
+) -> Optional[models.SearchParams]:
+    """Qdrant search params that oversample quantized candidates and rescore them, or None."""
+    if mode == "none":
+        return None
+    return models.SearchParams(
+        quantization=models.QuantizationSearchParams(rescore=True, oversampling=oversampling)
+    )
+
+
+def _normalize(vectors) -> np.ndarray:
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return vectors / np.where(norms == 0, 1, norms)
+
+
+class LocalVectorStore(VectorStore):
+    """LangChain vector store backed by a memory-mapped NumPy matrix."""
+
+    def __init__(self, path, embedding: Optional[Embeddings], collection_name: Optional[str] = None):
+        """
+        Open (or create) a local store.
+
+        Args:
+            path: Store directory
+            embedding: Embeddings used for text queries and add_texts
+            collection_name: Name reported in document metadata (defaults to the directory name)
+        """
+        self.path = Path(path)
+        self.path.mkdir(parents=True, exist_ok=True)
+        self.collection_name = collection_name or self.path.name
+        self._embedding = embedding
+
+        self.meta_path = self.path / "meta.json"
+        self.vectors_path = self.path / "vectors.f32"
+        self.payloads_path = self.path / "payloads.jsonl"
+        self.ivf_path = self.path / "ivf.npz"
+        self.quantized_path = self.path / "quantized.npz"
+        self.lock_path = self.path / ".lock"
+
+        self._lock = threading.RLock()
+        self._reset()
+        self.refresh()
+
+    def _reset(self):
+        self._dim: Optional[int] = None
+        self._vectors: Optional[np.memmap] = None
+        self._live = np.zeros(0, dtype=bool)
+        self._ids: List[str] = []
+        self._texts: List[str] = []
+        self._metadatas: List[dict] = []
+        self._rows: Dict[str, int] = {}                  # id -> live row
+        self._postings: Dict[str, Dict[Any, List[int]]] = {}  # metadata key -> value -> rows
+        self._payload_offset = 0
+        self._meta_mtime = None
+        self._ivf_mtime = None
+        self._centroids: Optional[np.ndarray] = None
+        self._assignments = np.zeros(0, dtype=np.int32)
+        self.n_probe = 1
+        self._quantized_mtime = None
+        self._generation: Optional[int] = None
+        self.quantization = "none"
+        self.oversampling = QUANTIZATION_OVERSAMPLING
+        self._codes: Optional[np.ndarray] = None   # (capacity, dim) int8 or (capacity, dim / 8) uint8
+        self._scales: Optional[np.ndarray] = None  # per-dimension int8 scales
+
+    @property
+    def embeddings(self) -> Optional[Embeddings]:
+        return self._embedding
+
+    def __len__(self) -> int:
+        return len(self._rows)
+
+    # ---------- persistence ----------
+
+    def _map(self):
+        """(Re)map the vectors file at its current size."""
+        size = self.vectors_path.stat().st_size if self.vectors_path.exists() else 0
+        capacity = size // (self._dim * 4)
+        self._vectors = None
+        if capacity:
+            self._vectors = np.memmap(
+                self.vectors_path, dtype=np.float32, mode="r+", shape=(capacity, self._dim)
+            )
+
+    @contextmanager
+    def _writing(self):
+        """Hold the store's file lock, so writes from other processes take turns."""
+        with self._lock, open(self.lock_path, "a") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _read_meta(self) -> dict:
+        if not self.meta_path.exists():
+            return {}
+        with open(self.meta_path, "r", encoding="utf-8") as f:
+            return json.load(f)
+
+    def _write_meta(self):
+        tmp_path = self.meta_path.with_suffix(".tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({
+                "dim": self._dim,
+                "rows": len(self._ids),
+                "collection": self.collection_name,
+                "generation": self._generation or 0
+            }, f)
+        tmp_path.replace(self.meta_path)
+        self._meta_mtime = self.meta_path.stat().st_mtime_ns
+
+    def refresh(self):
+        """Load rows, IVF data and codes written since the last refresh (e.g. by another process)."""
+        with self._lock:
+            if not self.meta_path.exists():
+                return
+            mtime = self.meta_path.stat().st_mtime_ns
+            payloads_size = self.payloads_path.stat().st_size if self.payloads_path.exists() else 0
+            if mtime == self._meta_mtime and payloads_size == self._payload_offset:
+                return
+            meta = self._read_meta()
+
+            # Cleared (and maybe rebuilt) by another process: the loaded rows, the
+            # payload offset and the vector map all belong to the old contents
+            generation = meta.get("generation", 0)
+            if self._generation is not None and (
+                generation != self._generation or payloads_size < self._payload_offset
+            ):
+                self._reset()
+            self._generation = generation
+            self._meta_mtime = mtime
+
+            if self._dim is None:
+                self._dim = meta["dim"]
+            if self._dim is None or not self.payloads_path.exists():
+                return  # cleared, nothing written since
+            self._map()
+
+            start = len(self._ids)
+            with open(self.payloads_path, "rb") as f:
+                f.seek(self._payload_offset)
+                for line in f:
+                    if not line.endswith(b"\n"):
+                        break  # partially written by the writer
+                    self._payload_offset += len(line)
+                    self._apply(json.loads(line))
+            self._load_ivf()
+            self._assign(start, len(self._ids))
+            self._load_quantized()
+            self._encode(start, len(self._ids))
+
+    def _load_ivf(self):
+        if not self.ivf_path.exists():
+            return
+        mtime = self.ivf_path.stat().st_mtime_ns
+        if mtime == self._ivf_mtime:
+            return
+        self._ivf_mtime = mtime
+        with np.load(self.ivf_path) as data:
+            self._centroids = data["centroids"]
+            self.n_probe = int(data["n_probe"])
+            assigned = data["assignments"]
+        self._grow_rows(len(self._ids))
+        self._assignments[:len(assigned)] = assigned
+        self._assign(len(assigned), len(self._ids))
+
+    # ---------- row bookkeeping ----------
+
+    def _grow_rows(self, needed: int):
+        """Grow the per-row arrays geometrically."""
+        if needed <= len(self._live):
+            return
+        capacity = max(needed, len(self._live) * 2, INITIAL_CAPACITY)
+        live = np.zeros(capacity, dtype=bool)
+        live[:len(self._live)] = self._live
+        assignments = np.zeros(capacity, dtype=np.int32)
+        assignments[:len(self._assignments)] = self._assignments
+        self._live, self._assignments = live, assignments
+        if self._codes is not None:
+            codes = np.zeros((capacity, self._codes.shape[1]), dtype=self._codes.dtype)
+            codes[:len(self._codes)] = self._codes
+            self._codes = codes
+
+    def _apply(self, record: dict):
+        """Apply one payload record to the in-memory state."""
+        if record.get("deleted"):
+            row = self._rows.pop(record["id"], None)
+            if row is not None:
+                self._live[row] = False
+            return
+        if "metadata_update" in record:
+            row = self._rows.get(record["id"])
+            if row is not None:
+                self._update_metadata(row, record["metadata_update"])
+            return
+
+        row = len(self._ids)
+        self._grow_rows(row + 1)
+        previous = self._rows.get(record["id"])
+        if previous is not None:
+            self._live[previous] = False  # upsert replaces the old row
+
+        metadata = record["metadata"]
+        self._ids.append(record["id"])
+        self._texts.append(record["page_content"])
+        self._metadatas.append(metadata)
+        self._rows[record["id"]] = row
+        self._live[row] = True
+
+        for key, postings in self._postings.items():
+            try:
+                postings.setdefault(metadata.get(key), []).append(row)
+            except TypeError:
+                pass  # unhashable values can't be filtered on
+
+    def _update_metadata(self, row: int, updates: dict):
+        metadata = self._metadatas[row]
+        for key, postings in self._postings.items():
+            if key not in updates:
+                continue
+            try:
+                old = postings.get(metadata.get(key))
+                if old is not None and row in old:
+                    old.remove(row)
+                bisect.insort(postings.setdefault(updates[key], []), row)  # keep posting lists sorted
+            except TypeError:
+                pass
+        metadata.update(updates)
+
+    def _assign(self, start: int, end: int):
+        """Assign rows [start, end) to their nearest IVF centroid."""
+        if self._centroids is None or start >= end:
+            return
+        for batch_start in range(start, end, ASSIGN_BATCH_SIZE):
+            batch_end = min(batch_start + ASSIGN_BATCH_SIZE, end)
+            scores = self._vectors[batch_start:batch_end] @ self._centroids.T
+            self._assignments[batch_start:batch_end] = np.argmax(scores, axis=1)
+
+    # ---------- writes ----------
+
+    def add_embeddings(
+        self,
+        texts: List[str],
+        embeddings: List[List[float]],
+        metadatas: Optional[List[dict]] = None,
+        ids: Optional[List[str]] = None
+    ) -> List[str]:
+        """
+        Add precomputed embeddings. Existing IDs are replaced (upsert).
+
+        Returns:
+            List[str]: IDs of the added rows
+        """
+        if not texts:
+            return []
+        vectors = _normalize(embeddings)
+        metadatas = metadatas or [{} for _ in texts]
+        ids = [str(i) for i in ids] if ids else [str(uuid.uuid4()) for _ in texts]
+
+        with self._writing():
+            # Rows appended by other processes first: new rows go after them
+            self.refresh()
+            if self._dim is None:
+                self._dim = vectors.shape[1]
+
+            start = len(self._ids)
+            needed = start + len(texts)
+            capacity = 0 if self._vectors is None else self._vectors.shape[0]
+            if needed > capacity:
+                capacity = max(needed, capacity * 2, INITIAL_CAPACITY)
+                if self._vectors is not None:
+                    self._vectors.flush()
+                with open(self.vectors_path, "ab") as f:
+                    f.truncate(capacity * self._dim * 4)
+                self._map()
+
+            # Vectors first, then payloads, then meta: readers never see a row without its vector
+            self._vectors[start:needed] = vectors
+            self._vectors.flush()
+
+            records = [
+                {"id": i, "page_content": text, "metadata": metadata}
+                for i, text, metadata in zip(ids, texts, metadatas)
+            ]
+            self._append_records(records)
+            self._assign(start, needed)
+            self._encode(start, needed)
+            self._write_meta()
+        return ids
+
+    def _append_records(self, records: List[dict]):
+        with open(self.payloads_path, "ab") as f:
+            f.write(b"".join(json.dumps(r).encode("utf-8") + b"\n" for r in records))
+            self._payload_offset = f.tell()
+        for record in records:
+            self._apply(record)
+
+    def add_texts(
+        self,
+        texts: Iterable[str],
+        metadatas: Optional[List[dict]] = None,
+        ids: Optional[List[str]] = None,
+        **kwargs: Any
+    ) -> List[str]:
+        texts = list(texts)
+        return self.add_embeddings(texts, self._embedding.embed_documents(texts), metadatas, ids)
+
+    def set_metadata(self, ids: List[str], updates: List[dict]):
+        """Merge metadata updates into existing rows (vectors are untouched)."""
+        if not ids:
+            return
+        with self._writing():
+            self.refresh()
+            self._append_records([
+                {"id": str(i), "metadata_update": update} for i, update in zip(ids, updates)
+            ])
+            self._write_meta()
+
+    def delete(self, ids: Optional[List[str]] = None, **kwargs: Any) -> Optional[bool]:
+        if not ids:
+            return False
+        with self._writing():
+            self.refresh()
+            self._append_records([{"id": str(i), "deleted": True} for i in ids])
+            self._write_meta()
+        return True
+
+    def clear(self):
+        """Delete every row and the IVF index."""
+        with self._writing():
+            generation = self._read_meta().get("generation", 0) + 1
+            # Everything but the lock file, which other processes may be waiting on
+            for path in self.path.iterdir():
+                if path != self.lock_path:
+                    path.unlink(missing_ok=True)
+            self._reset()
+            # Readers in other processes see the new generation and drop what they loaded
+            self._generation = generation
+            self._write_meta()
+
+    # ---------- search ----------
+
+    def _filter_rows(self, filter) -> np.ndarray:
+        """Sorted rows matching an equality filter (a dict or a match_filter() Filter)."""
+        if isinstance(filter, dict):
+            conditions = list(filter.items())
+        elif isinstance(filter, models.Filter) and not (filter.should or filter.must_not):
+            conditions = []
+            for condition in filter.must or []:
+                if not isinstance(condition, models.FieldCondition) or not isinstance(condition.match, models.MatchValue):
+                    raise ValueError("LocalVectorStore only supports equality filters")
+                conditions.append((condition.key.removeprefix("metadata."), condition.match.value))
+        else:
+            raise ValueError("LocalVectorStore only supports equality filters")
+
+        rows = None
+        for key, value in conditions:
+            postings = self._postings.get(key)
+            if postings is None:
+                # Build the inverted index for this key on first use, then maintain it
+                postings = {}
+                for row, metadata in enumerate(self._metadatas):
+                    try:
+                        postings.setdefault(metadata.get(key), []).append(row)
+                    except TypeError:
+                        pass
+                self._postings[key] = postings
+            # Rows are appended in order, so each posting list is already sorted
+            matches = np.asarray(postings.get(value, []), dtype=np.int64)
+            rows = matches if rows is None else np.intersect1d(rows, matches, assume_unique=True)
+        if rows is None:
+            return np.flatnonzero(self._live[:len(self._ids)])
+        return rows
+
+    def _search(self, vector, k: int, filter=None) -> List[Tuple[int, float]]:
+        """Top-k rows by cosine similarity as (row, score) pairs."""
+        n = len(self._ids)
+        if n == 0 or self._vectors is None or k <= 0:
+            return []
+        query = _normalize(vector)
+
+        if filter is not None:
+            # Only the matching posting lists are read, so a selective filter
+            # (one user's rows) costs the same however large the store grows
+            candidates = self._filter_rows(filter)
+            candidates = candidates[self._live[candidates]]
+        else:
+            candidates = np.flatnonzero(self._live[:n])
+        if self._centroids is not None:
+            n_probe = min(self.n_probe, len(self._centroids))
+            probe = np.argpartition(-(self._centroids @ query), n_probe - 1)[:n_probe]
+            candidates = candidates[np.isin(self._assignments[candidates], probe)]
+
+        if candidates.size == 0:
+            return []
+
+        if self._codes is not None:
+            # Rank on the quantized codes, keep an oversampled shortlist for rescoring
+            shortlist = min(candidates.size, max(k, int(np.ceil(k * self.oversampling))))
+            if shortlist < candidates.size:
+                approx = self._approx_scores(query, candidates)
+                candidates = candidates[np.argpartition(-approx, shortlist - 1)[:shortlist]]
+
+        # Score everything when most rows qualify, otherwise gather the candidates
+        dense = candidates.size * 2 >= n
+        if dense:
+            mask = np.zeros(n, dtype=bool)
+            mask[candidates] = True
+            scores = np.where(mask, self._vectors[:n] @ query, -np.inf)
+        else:
+            scores = self._vectors[candidates] @ query
+
+        k = min(k, candidates.size)
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        rows = top if dense else candidates[top]
+        return [(int(row), float(scores[i])) for row, i in zip(rows, top)]
+
+    def _document(self, row: int) -> Document:
+        metadata = dict(self._metadatas[row])
+        metadata["_id"] = self._ids[row]
+        metadata["_collection_name"] = self.collection_name
+        return Document(page_content=self._texts[row], metadata=metadata)
+
+    def similarity_search_with_score_by_vector(
+        self, embedding: List[float], k: int = 4, filter=None, **kwargs: Any
+    ) -> List[Tuple[Document, float]]:
+        self.refresh()
+        with self._lock:
+            return [(self._document(row), score) for row, score in self._search(embedding, k, filter)]
+
+    def similarity_search_by_vector(
+        self, embedding: List[float], k: int = 4, filter=None, **kwargs: Any
+    ) -> List[Document]:
+        return [doc for doc, _ in self.similarity_search_with_score_by_vector(embedding, k, filter, **kwargs)]
+
+    def similarity_search_with_score(
+        self, query: str, k: int = 4, filter=None, **kwargs: Any
+    ) -> List[Tuple[Document, float]]:
+        return self.similarity_search_with_score_by_vector(
+            self._embedding.embed_query(query), k, filter, **kwargs
+        )
+
+    def similarity_search(self, query: str, k: int = 4, filter=None, **kwargs: Any) -> List[Document]:
+        return [doc for doc, _ in self.similarity_search_with_score(query, k, filter, **kwargs)]
+
+    def _select_relevance_score_fn(self):
+        # Cosine similarity in [-1, 1] -> relevance in [0, 1]
+        return lambda score: (score + 1) / 2
+
+    def iter_rows(self, batch_size: int = 256, filter=None):
+        """Yield (ids, texts, vectors, metadatas) batches of live rows, optionally filtered."""
+        with self._lock:
+            if filter is None:
+                live_rows = np.flatnonzero(self._live[:len(self._ids)])
+            else:
+                live_rows = self._filter_rows(filter)
+                live_rows = live_rows[self._live[live_rows]]
+        for start in range(0, len(live_rows), batch_size):
+            rows = live_rows[start:start + batch_size]
+            yield (
+                [self._ids[r] for r in rows],
+                [self._texts[r] for r in rows],
+                np.asarray(self._vectors[rows]),
+                [self._metadatas[r] for r in rows]
+            )
+
+    # ---------- IVF ----------
+
+    def build_ivf(self, n_lists: Optional[int] = None, n_probe: Optional[int] = None, iterations: int = 10, seed: int = 0):
+        """
+        Build a coarse quantizer (spherical k-means) for approximate search.
+
+        Args:
+            n_lists: Number of centroids (defaults to sqrt of the row count)
+            n_probe: Lists scored per query (defaults to n_lists / 8)
+            iterations: k-means iterations
+            seed: Random seed for sampling and initialization
+        """
+        with self._writing():
+            self.refresh()
+            live_rows = np.flatnonzero(self._live[:len(self._ids)])
+            if live_rows.size == 0:
+                raise ValueError("Cannot build an IVF index on an empty store")
+            n_lists = min(n_lists or max(1, int(np.sqrt(live_rows.size))), live_rows.size)
+            rng = np.random.default_rng(seed)
+
+            sample_size = min(live_rows.size, n_lists * KMEANS_SAMPLE_PER_LIST)
+            sample = np.sort(rng.choice(live_rows, sample_size, replace=False))
+            data = np.asarray(self._vectors[sample])
+            centroids = data[rng.choice(len(data), n_lists, replace=False)].copy()
+
+            for _ in range(iterations):
+                assign = np.argmax(data @ centroids.T, axis=1)
+                sums = np.zeros_like(centroids)
+                np.add.at(sums, assign, data)
+                counts = np.bincount(assign, minlength=n_lists)
+                empty = counts == 0
+                # Re-seed empty lists with random points
+                sums[empty] = data[rng.integers(len(data), size=int(empty.sum()))]
+                centroids = _normalize(sums)
+
+            self._centroids = centroids
+            self.n_probe = n_probe or max(1, n_lists // 8)
+            self._assign(0, len(self._ids))
+
+            np.savez(
+                self.ivf_path,
+                centroids=centroids,
+                assignments=self._assignments[:len(self._ids)],
+                n_probe=self.n_probe
+            )
+            self._ivf_mtime = self.ivf_path.stat().st_mtime_ns
+
+    def drop_ivf(self):
+        """Go back to exact search."""
+        with self._writing():
+            self.ivf_path.unlink(missing_ok=True)
+            self._centroids = None
+            self._ivf_mtime = None
+
+    # ---------- quantization ----------
+
+    def quantize(self, mode: str, oversampling: float = QUANTIZATION_OVERSAMPLING):
+        """
+        Enable int8 (4x smaller) or binary (32x smaller) codes for the first search pass.
+
+        Args:
+            mode: "int8", "binary" or "none" to go back to full precision only
+            oversampling: Shortlist size per requested result before rescoring
+        """
+        with self._writing():
+            self.refresh()
+            if mode == "none":
+                self.quantized_path.unlink(missing_ok=True)
+                self._codes = self._scales = None
+                self.quantization = "none"
+                self._quantized_mtime = None
+                return
+            if mode not in ("int8", "binary"):
+                raise ValueError(f"Unknown quantization mode: {mode}")
+            if self._dim is None:
+                raise ValueError("Cannot quantize an empty store")
+
+            n = len(self._ids)
+            self.quantization = mode
+            self.oversampling = oversampling
+            self._scales = None
+            if mode == "int8":
+                # Per-dimension scale from the 99th percentile, like Qdrant's quantile=0.99
+                live_rows = np.flatnonzero(self._live[:n])
+                sample = live_rows[:: max(1, live_rows.size // 100_000)]
+                bound = np.quantile(np.abs(np.asarray(self._vectors[sample])), 0.99, axis=0)
+                self._scales = (np.maximum(bound, 1e-6) / 127).astype(np.float32)
+                width, dtype = self._dim, np.int8
+            else:
+                width, dtype = (self._dim + 7) // 8, np.uint8
+            self._codes = np.zeros((len(self._live), width), dtype=dtype)
+            self._encode(0, n)
+
+            np.savez(
+                self.quantized_path,
+                mode=mode,
+                oversampling=oversampling,
+                codes=self._codes[:n],
+                scales=self._scales if self._scales is not None else np.zeros(0, dtype=np.float32)
+            )
+            self._quantized_mtime = self.quantized_path.stat().st_mtime_ns
+
+    def _load_quantized(self):
+        if not self.quantized_path.exists():
+            return
+        mtime = self.quantized_path.stat().st_mtime_ns
+        if mtime == self._quantized_mtime:
+            return
+        self._quantized_mtime = mtime
+        with np.load(self.quantized_path) as data:
+            self.quantization = str(data["mode"])
+            self.oversampling = float(data["oversampling"])
+            codes = data["codes"]
+            self._scales = data["scales"] if self.quantization == "int8" else None
+        self._codes = np.zeros((len(self._live), codes.shape[1]), dtype=codes.dtype)
+        self._codes[:len(codes)] = codes
+        self._encode(len(codes), len(self._ids))
+
+    def _encode(self, start: int, end: int):
+        """Quantize rows [start, end)."""
+        if self._codes is None or start >= end:
+            return
+        for batch_start in range(start, end, ASSIGN_BATCH_SIZE):
+            batch_end = min(batch_start + ASSIGN_BATCH_SIZE, end)
+            vectors = np.asarray(self._vectors[batch_start:batch_end])
+            if self.quantization == "int8":
+                codes = np.clip(np.rint(vectors / self._scales), -127, 127).astype(np.int8)
+            else:
+                codes = np.packbits(vectors > 0, axis=1)
+            self._codes[batch_start:batch_end] = codes
+
+    def _approx_scores(self, query: np.ndarray, rows: np.ndarray) -> np.ndarray:
+        """Scores from the quantized codes (only their ranking is meaningful)."""
+        scores = np.empty(rows.size, dtype=np.float32)
+        scaled_query = query * self._scales if self.quantization == "int8" else None
+        query_bits = np.packbits(query > 0)
+        # Contiguous rows (no filter / IVF) can be sliced instead of gathered
+        contiguous = rows.size and rows[-1] - rows[0] + 1 == rows.size
+        # Blocks keep the temporary float copy of int8 codes small
+        for start in range(0, rows.size, ASSIGN_BATCH_SIZE):
+            if contiguous:
+                first = rows[0] + start
+                codes = self._codes[first:first + min(ASSIGN_BATCH_SIZE, rows.size - start)]
+            else:
+                codes = self._codes[rows[start:start + ASSIGN_BATCH_SIZE]]
+            if scaled_query is not None:
+                block = codes.astype(np.float32) @ scaled_query
+            else:
+                # Fewer differing signs = closer
+                block = -np.bitwise_count(codes ^ query_bits).sum(axis=1, dtype=np.int32)
+            scores[start:start + len(codes)] = block
+        return scores
+
+    def vector_memory(self) -> dict:
+        """Bytes held by full-precision vectors vs the codes used in the first pass."""
+        n = len(self._ids)
+        full = n * (self._dim or 0) * 4
+        quantized = 0 if self._codes is None else n * self._codes.shape[1]
+        return {"full_precision_bytes": full, "quantized_bytes": quantized, "quantization": self.quantization}
+
+    @classmethod
+    def from_texts(
+        cls,
+        texts: List[str],
+        embedding: Embeddings,
+        metadatas: Optional[List[dict]] = None,
+        ids: Optional[List[str]] = None,
+        path=None,
+        collection_name: str = "default",
+        **kwargs: Any
+    ) -> "LocalVectorStore":
+        store = cls(path or LOCAL_VECTOR_DIR / collection_name, embedding, collection_name)
+        store.add_texts(texts, metadatas, ids)
+        return store
+
+
+# ================================
+# Backend selection
+# ================================
+_local_stores: Dict[str, LocalVectorStore] = {}
+_local_lock = threading.Lock()
+
+
+def get_vector_store(
+    collection_name: str,
+    embedding: Embeddings,
+    client: Optional[QdrantClient] = None,
+    backend: str = VECTOR_BACKEND
+) -> VectorStore:
+    """
+    Vector store for a collection on the configured backend.
+
+    Args:
+        collection_name: Collection (or local store directory) name
+        embedding: Embeddings for text queries
+        client: Qdrant client to reuse (qdrant backend only)
+        backend: "qdrant" or "local"
+    """
+    if backend == "local":
+        with _local_lock:
+            store = _local_stores.get(collection_name)
+            if store is None:
+                store = LocalVectorStore(LOCAL_VECTOR_DIR / collection_name, embedding, collection_name)
+                _local_stores[collection_name] = store
+            return store
+
+    from langchain_qdrant import QdrantVectorStore
+    return QdrantVectorStore(
+        client=client or QdrantClient(url=QDRANT_URL),
+        collection_name=collection_name,
+        embedding=embedding
+    )
+
+
+async def asimilarity_search_by_vector(
+    vector_store: VectorStore,
+    embedding: List[float],
+    k: int = 4,
+    filter=None,
+    search_params=None,
+    async_client=None
+) -> List[Document]:
+    """
+    Non-blocking similarity search for asyncio request paths.
+
+    Qdrant collections are queried through an AsyncQdrantClient, so the event
+    loop is never blocked on the network. A LocalVectorStore search is CPU-bound
+    and runs in a worker thread instead.
+
+    Args:
+        vector_store: Store returned by get_vector_store()
+        embedding: Query vector
+        k: Number of documents to return
+        filter: Qdrant Filter (or dict filter for a local store)
+        search_params: Qdrant SearchParams (see search_params())
+        async_client: AsyncQdrantClient to use (qdrant backend only)
+    """
+    if isinstance(vector_store, LocalVectorStore):
+        return await asyncio.to_thread(vector_store.similarity_search_by_vector, embedding, k, filter)
+
+    response = await async_client.query_points(
+        collection_name=vector_store.collection_name,
+        query=list(embedding),
+        query_filter=filter,
+        search_params=search_params,
+        limit=k,
+        with_payload=True
+    )
+    docs = []
+    for point in response.points:
+        payload = point.payload or {}
+        metadata = dict(payload.get("metadata") or {})
+        metadata["_id"] = point.id
+        metadata["_collection_name"] = vector_store.collection_name
+        docs.append(Document(page_content=payload.get("page_content") or "", metadata=metadata))
+    return docs
+
+
+def upsert_embeddings(
+    vector_store: VectorStore,
+    ids: List[str],
+    texts: List[str],
+    embeddings: List[List[float]],
+    metadatas: List[dict]
+):
+    """Upsert precomputed embeddings into either backend."""
+    if isinstance(vector_store, LocalVectorStore):
+        vector_store.add_embeddings(texts, embeddings, metadatas, ids)
+        return
+    vector_store.client.upsert(
+        collection_name=vector_store.collection_name,
+        points=[
+            models.PointStruct(
+                id=point_id,
+                vector=list(vector),
+                payload={
+                    vector_store.content_payload_key: text,
+                    vector_store.metadata_payload_key: metadata
+                }
+            )
+            for point_id, text, vector, metadata in zip(ids, texts, embeddings, metadatas)
+        ]
+    )
+
+
+def set_metadata(vector_store: VectorStore, ids: List[str], updates: List[dict]):
+    """Merge metadata updates into existing points of either backend."""
+    if isinstance(vector_store, LocalVectorStore):
+        vector_store.set_metadata(ids, updates)
+        return
+    vector_store.client.batch_update_points(
+        collection_name=vector_store.collection_name,
+        update_operations=[
+            models.SetPayloadOperation(set_payload=models.SetPayload(
+                payload=update, points=[point_id], key=vector_store.metadata_payload_key
+            ))
+            for point_id, update in zip(ids, updates)
+        ],
+        wait=False
+    )
+
+
+def import_from_qdrant(client: QdrantClient, collection_name: str, store: LocalVectorStore, batch_size: int = 256) -> int:
+    """Copy every point of a Qdrant collection into a local store."""
+    imported = 0
+    offset = None
+    while True:
+        points, offset = client.scroll(
+            collection_name=collection_name,
+            limit=batch_size,
+            offset=offset,
+            with_payload=True,
+            with_vectors=True
+        )
+        if points:
+            store.add_embeddings(
+                texts=[(p.payload or {}).get("page_content", "") for p in points],
+                embeddings=[p.vector for p in points],
+                metadatas=[(p.payload or {}).get("metadata") or {} for p in points],
+                ids=[str(p.id) for p in points]
+            )
+            imported += len(points)
+        if offset is None:
+            return imported
+
+
+def export_to_qdrant(store: LocalVectorStore, client: QdrantClient, collection_name: str, batch_size: int = 256) -> int:
+    """Copy every live row of a local store into a Qdrant collection."""
+    store.refresh()
+    if store._dim is None:
+        return 0
+    if not client.collection_exists(collection_name):
+        client.create_collection(
+            collection_name=collection_name,
+            vectors_config=models.VectorParams(size=store._dim, distance=models.Distance.COSINE)
+        )
+
+    exported = 0
+    for ids, texts, vectors, metadatas in store.iter_rows(batch_size):
+        client.upsert(
+            collection_name=collection_name,
+            points=[
+                models.PointStruct(
+                    id=point_id,
+                    vector=vector.tolist(),
+                    payload={"page_content": text, "metadata": metadata}
+                )
+                for point_id, text, vector, metadata in zip(ids, texts, vectors, metadatas)
+            ]
+        )
+        exported += len(ids)
+    return exported
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Manage local vector stores")
+    parser.add_argument("command", choices=["import", "export", "build-ivf", "drop-ivf", "quantize"])
+    parser.add_argument("collection")
+    parser.add_argument("--lists", type=int, default=None, help="IVF lists (build-ivf)")
+    parser.add_argument("--probe", type=int, default=None, help="IVF lists probed per query (build-ivf)")
+    parser.add_argument("--mode", choices=["none", "int8", "binary"], default=VECTOR_QUANTIZATION, help="quantization mode (quantize)")
+    parser.add_argument("--oversampling", type=float, default=QUANTIZATION_OVERSAMPLING, help="rescoring shortlist factor (quantize)")
+    args = parser.parse_args()
+
+    store = LocalVectorStore(LOCAL_VECTOR_DIR / args.collection, None, args.collection)
+    if args.command == "import":
+        count = import_from_qdrant(QdrantClient(url=QDRANT_URL), args.collection, store)
+        print(f"📥 Imported {count} points from Qdrant into {store.path}")
+    elif args.command == "export":
+        count = export_to_qdrant(store, QdrantClient(url=QDRANT_URL), args.collection)
+        print(f"📤 Exported {count} points from {store.path} to Qdrant")
+    elif args.command == "build-ivf":
+        store.build_ivf(n_lists=args.lists, n_probe=args.probe)
+        print(f"🧭 Built IVF index: {len(store._centroids)} lists, probing {store.n_probe}")
+    elif args.command == "drop-ivf":
+        store.drop_ivf()
+        print("🧭 Dropped IVF index, using exact search")
+    else:
+        store.quantize(args.mode, args.oversampling)
+        memory = store.vector_memory()
+        print(
+            f"🗜️ Quantization: {memory['quantization']} "
+            f"({memory['quantized_bytes']} bytes of codes vs {memory['full_precision_bytes']} full precision)"
+        )
+
+
+if __name__ == "__main__":
+    main()
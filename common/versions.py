@@ -0,0 +1,59 @@
+"""
+Collection versions.
+
+A collection's version changes whenever its content changes: rag/index.py bumps
+it after upserting or deleting points. Caches of anything derived from a
+collection (such as answers) tag their entries with the version they were
+computed against, so a re-index invalidates them without an explicit flush.
+
+Versions live in Redis so every server and worker process sees the same value.
+If Redis is unreachable the last known version (or 0) is used.
+"""
+import os
+import threading
+import time
+
+from redis import Redis
+from redis.exceptions import RedisError
+
+REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379/0")
+VERSION_KEY = "rag:collection_version:{}"
+
+
+class CollectionVersions:
+    """Reads and bumps per-collection version counters stored in Redis."""
+
+    def __init__(self, redis_url: str = REDIS_URL, refresh_seconds: float = 1.0):
+        """
+        Initialize the version reader.
+
+        Args:
+            redis_url: Redis/Valkey URL holding the counters
+            refresh_seconds: How long a fetched version is reused before re-reading it
+        """
+        self.redis = Redis.from_url(redis_url, socket_timeout=0.5, socket_connect_timeout=0.5)
+        self.refresh_seconds = refresh_seconds
+        self._cached = {}  # collection -> (version, fetched_at)
+        self._lock = threading.Lock()
+
+    def get(self, collection: str) -> int:
+        """Current version of a collection."""
+        with self._lock:
+            version, fetched_at = self._cached.get(collection, (0, None))
+        if fetched_at is not None and time.monotonic() - fetched_at < self.refresh_seconds:
+            return version
+
+        try:
+            version = int(self.redis.get(VERSION_KEY.format(collection)) or 0)
+        except RedisError:
+            pass
+        with self._lock:
+            self._cached[collection] = (version, time.monotonic())
+        return version
+
+    def bump(self, collection: str) -> int:
+        """Mark a collection as changed and return its new version."""
+        version = int(self.redis.incr(VERSION_KEY.format(collection)))
+        with self._lock:
+            self._cached[collection] = (version, time.monotonic())
+        return version
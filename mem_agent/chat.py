@@ -1,30 +1,35 @@
+import asyncio
 import os
+import sys
+import threading
 import uuid
 from datetime import datetime
+from pathlib import Path
+from typing import Optional
 from dotenv import load_dotenv
-from langchain_huggingface import HuggingFaceEmbeddings, HuggingFaceEndpoint, ChatHuggingFace
-from langchain_qdrant import QdrantVectorStore
+from langchain_huggingface import HuggingFaceEndpoint, ChatHuggingFace
 from qdrant_client import QdrantClient
-from qdrant_client.models import Distance, VectorParams
 from langchain_core.documents import Document
 
+# Make the shared `common` package importable when run from this directory
+sys.path.append(str(Path(__file__).resolve().parent.parent))
+from common import ShortTermMemory, get_embedding_model, get_token_counter
+from store import MemoryStore
+from writer import MemoryWriter
+
 load_dotenv()
 
 # ================================
 # Configuration
 # ================================
 QDRANT_URL = "http://localhost:6333"
-COLLECTION_NAME = "mem_agent"
-EMBEDDING_DIM = 384  # all-MiniLM-L6-v2 produces 384-dim vectors
 
 # ================================
 # Initialize Components
 # ================================
 
-# Embeddings
-embedding = HuggingFaceEmbeddings(
-    model_name="sentence-transformers/all-MiniLM-L6-v2"
-)
+# Embeddings (shared disk + LRU cache)
+embedding = get_embedding_model()
 
 # LLM
 hf_llm = HuggingFaceEndpoint(
@@ -35,42 +40,62 @@ hf_llm = HuggingFaceEndpoint(
 )
 llm = ChatHuggingFace(llm=hf_llm)
 
+# Short-term history is trimmed by tokens of the chat model
+count_tokens = get_token_counter("Qwen/Qwen2.5-72B-Instruct")
+
 # Qdrant Client
 qdrant_client = QdrantClient(url=QDRANT_URL)
 
+# Memory collections (layout and payload indexes, see store.py)
+memory_store = MemoryStore(embedding, client=qdrant_client)
+
+SYSTEM_PROMPT = """You are a helpful AI assistant with memory capabilities. 
+You can remember past conversations and use them to provide more personalized responses.
+
+If relevant memories are provided, use them to:
+1. Maintain continuity in conversations
+2. Remember user preferences and details
+3. Provide more personalized responses
+
+Be natural and conversational. Don't explicitly mention "memories" unless asked."""
+
+# Long-term memories are persisted write-behind, in batches, by one writer
+# shared by every agent in the process
+_memory_writer: Optional[MemoryWriter] = None
+_memory_writer_lock = threading.Lock()
+
+
+def get_memory_writer() -> MemoryWriter:
+    """The process-wide memory writer, created for the first agent."""
+    global _memory_writer
+    with _memory_writer_lock:
+        if _memory_writer is None:
+            _memory_writer = MemoryWriter(memory_store)
+        return _memory_writer
+
 
 class MemoryAgent:
     """AI Agent with long-term memory using Qdrant vector store."""
     
     def __init__(self, user_id: str = "default_user"):
         self.user_id = user_id
-        self.conversation_history = []  # Short-term memory
-        self._init_collection()
-        self.vector_store = QdrantVectorStore(
-            client=qdrant_client,
-            collection_name=COLLECTION_NAME,
-            embedding=embedding
+        # Short-term memory: recent turns within a token budget, plus a summary of older ones
+        self.conversation_history = ShortTermMemory(
+            count_tokens, complete=lambda messages: llm.invoke(messages).content
         )
+        self.memory_store = memory_store
+        self.collection_name = memory_store.collection_for(user_id)
+        self._init_collection()
+        self.writer = get_memory_writer()
     
     def _init_collection(self):
-        """Initialize Qdrant collection if it doesn't exist."""
-        collections = qdrant_client.get_collections().collections
-        collection_names = [c.name for c in collections]
-        
-        if COLLECTION_NAME not in collection_names:
-            qdrant_client.create_collection(
-                collection_name=COLLECTION_NAME,
-                vectors_config=VectorParams(
-                    size=EMBEDDING_DIM,
-                    distance=Distance.COSINE
-                )
-            )
-            print(f"✅ Created collection: {COLLECTION_NAME}")
-        else:
-            print(f"📦 Using existing collection: {COLLECTION_NAME}")
+        """Create this user's collection, or the missing payload indexes of an existing one."""
+        if memory_store.layout == "per_tenant":
+            return  # created with the user's first memory
+        memory_store.ensure(self.collection_name)  # checked once per process, not per agent
     
     def store_memory(self, user_message: str, ai_response: str):
-        """Store conversation exchange in long-term memory."""
+        """Queue a conversation exchange for long-term memory (persisted in the background)."""
         memory_content = f"User: {user_message}\nAssistant: {ai_response}"
         
         doc = Document(
@@ -83,20 +108,37 @@ class MemoryAgent:
             }
         )
         
-        self.vector_store.add_documents([doc])
+        self.writer.write(doc)
     
-    def retrieve_memories(self, query: str, k: int = 3) -> list:
-        """Retrieve relevant memories based on current query."""
+    def retrieve_memories(self, query: str, k: int = 3, fresh: bool = False) -> list:
+        """
+        Retrieve relevant memories based on current query.
+
+        Args:
+            query: Text the memories are matched against
+            k: Memories returned from the store
+            fresh: Wait for this user's queued exchanges to be persisted, so the
+                search itself ranks them (otherwise they are added unranked)
+        """
+        if fresh and not self.writer.wait_for(self.user_id):
+            print("⚠️ Memory writes still pending; recent exchanges may be missing")
         try:
-            results = self.vector_store.similarity_search(
-                query=query,
-                k=k,
-                filter={"user_id": self.user_id}
-            )
-            return results
+            results = self.memory_store.search(self.user_id, query, k=k)
         except Exception as e:
             print(f"⚠️ Memory retrieval error: {e}")
             return []
+        if not fresh:
+            # Queued exchanges that already left the short-term history (or were
+            # made by an earlier agent of this user) are not in the store yet
+            in_history = {m["content"] for m in self.conversation_history.messages() if m["role"] == "user"}
+            found = {doc.page_content for doc in results}
+            results += [
+                doc for doc in self.writer.pending(self.user_id)[-k:]
+                if doc.metadata.get("user_message") not in in_history and doc.page_content not in found
+            ]
+        # Usage counts steer the compaction job's eviction (see compact.py); stored in the background
+        self.writer.record_recall(self.user_id, results)
+        return results
     
     def build_context(self, user_message: str) -> str:
         """Build context from long-term memories."""
@@ -111,23 +153,9 @@ class MemoryAgent:
         
         return context
     
-    def chat(self, user_message: str) -> str:
-        """Process user message and generate response with memory."""
-        
-        # Retrieve relevant memories
-        memory_context = self.build_context(user_message)
-        
-        # Build system prompt with memory
-        system_prompt = """You are a helpful AI assistant with memory capabilities. 
-You can remember past conversations and use them to provide more personalized responses.
-
-If relevant memories are provided, use them to:
-1. Maintain continuity in conversations
-2. Remember user preferences and details
-3. Provide more personalized responses
-
-Be natural and conversational. Don't explicitly mention "memories" unless asked."""
-
+    def build_messages(self, user_message: str, memory_context: str) -> list:
+        """Build the LLM messages: system prompt with memories, short-term history, new message."""
+        system_prompt = SYSTEM_PROMPT
         if memory_context:
             system_prompt += f"\n\n{memory_context}"
         
@@ -135,38 +163,56 @@ Be natural and conversational. Don't explicitly mention "memories" unless asked.
         messages = [{"role": "system", "content": system_prompt}]
         
         # Add recent conversation history (short-term memory)
-        for entry in self.conversation_history[-5:]:  # Last 5 exchanges
-            messages.append({"role": "user", "content": entry["user"]})
-            messages.append({"role": "assistant", "content": entry["assistant"]})
+        messages.extend(self.conversation_history.messages())
         
         # Add current message
         messages.append({"role": "user", "content": user_message})
+        return messages
+    
+    def remember(self, user_message: str, ai_response: str):
+        """Record a finished exchange in short-term and long-term memory."""
+        self.conversation_history.add_turn(user_message, ai_response)
+        self.store_memory(user_message, ai_response)
+    
+    def chat(self, user_message: str) -> str:
+        """Process user message and generate response with memory."""
+        
+        # Retrieve relevant memories
+        memory_context = self.build_context(user_message)
+        messages = self.build_messages(user_message, memory_context)
         
         # Generate response
         response = llm.invoke(messages)
         ai_response = response.content
         
-        # Update short-term memory
-        self.conversation_history.append({
-            "user": user_message,
-            "assistant": ai_response
-        })
+        # Update short-term and long-term memory
+        self.remember(user_message, ai_response)
         
-        # Store in long-term memory
-        self.store_memory(user_message, ai_response)
+        return ai_response
+    
+    async def achat(self, user_message: str) -> str:
+        """chat() for asyncio servers: the LLM call is awaited, blocking store calls run in threads."""
+        memory_context = await asyncio.to_thread(self.build_context, user_message)
+        messages = self.build_messages(user_message, memory_context)
+        
+        response = await llm.ainvoke(messages)
+        ai_response = response.content
+        
+        # May summarize evicted turns (an LLM call) or wait on writer backpressure
+        await asyncio.to_thread(self.remember, user_message, ai_response)
         
         return ai_response
     
     def clear_conversation(self):
         """Clear short-term conversation history."""
-        self.conversation_history = []
+        self.conversation_history.clear()
         print("🗑️ Conversation history cleared.")
     
     def get_memory_count(self) -> int:
         """Get total number of stored memories."""
+        self.writer.flush()
         try:
-            collection_info = qdrant_client.get_collection(COLLECTION_NAME)
-            return collection_info.points_count
+            return self.memory_store.count()
         except:
             return 0
 
@@ -188,6 +234,7 @@ def main():
         user_id = "default_user"
     
     agent = MemoryAgent(user_id=user_id)
+    print(f"📦 Using collection: {agent.collection_name} ({memory_store.layout} layout)")
     print(f"\n✨ Hello {user_id}! I remember our past conversations.\n")
     
     while True:
@@ -199,6 +246,7 @@ def main():
             
             # Handle commands
             if user_input.lower() == "/quit":
+                agent.writer.close()
                 print("\n👋 Goodbye! Your memories are saved.")
                 break
             elif user_input.lower() == "/clear":
@@ -215,6 +263,7 @@ def main():
             print(f"\n🤖 Assistant: {response}\n")
             
         except KeyboardInterrupt:
+            agent.writer.close()
             print("\n\n👋 Goodbye! Your memories are saved.")
             break
         except Exception as e:
@@ -0,0 +1,347 @@
+"""
+Offline consolidation and compaction of the long-term memories.
+
+Every exchange is stored as its own memory, so each user's memories grow
+without bound and searches return near-duplicates that waste prompt tokens.
+For every user (or the ones given with --user) this job:
+
+1. Merges near-duplicates: memories whose embeddings are at least
+   MEMORY_DEDUP_THRESHOLD similar keep only the newest, which inherits the
+   others' usage counts.
+2. Consolidates old memories: memories older than
+   MEMORY_CONSOLIDATE_AFTER_DAYS are clustered by similarity, and every
+   cluster of MEMORY_MIN_CLUSTER or more is summarized by the LLM into one
+   consolidated memory that replaces it.
+3. Enforces MEMORY_CAP memories per user, evicting the lowest scoring ones:
+   recency (halving every MEMORY_RECENCY_HALF_LIFE_DAYS since the memory was
+   stored or last recalled) plus MEMORY_USAGE_WEIGHT * log(1 + recall_count).
+
+Memories written while the job runs are left alone; with VECTOR_BACKEND=local
+the job's writes and the agents' take turns on each store's file lock (see
+common/vector_store.py). Before/after point counts of every run are appended
+to MEMORY_COMPACTION_LOG.
+
+Usage:
+    python mem_agent/compact.py
+    python mem_agent/compact.py --user alice --dry-run
+    python mem_agent/compact.py --cap 200 --no-summarize
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import List, Optional
+
+import numpy as np
+from langchain_core.documents import Document
+from qdrant_client import QdrantClient
+
+# Make the shared `common` package importable when run from this directory
+sys.path.append(str(Path(__file__).resolve().parent.parent))
+from common import get_embedding_model, get_llm_router
+from common.vector_store import QDRANT_URL, VECTOR_BACKEND
+from store import MemoryStore
+
+MEMORY_CAP = int(os.getenv("MEMORY_CAP", "500"))
+DEDUP_THRESHOLD = float(os.getenv("MEMORY_DEDUP_THRESHOLD", "0.95"))
+CLUSTER_THRESHOLD = float(os.getenv("MEMORY_CLUSTER_THRESHOLD", "0.8"))
+CONSOLIDATE_AFTER_DAYS = float(os.getenv("MEMORY_CONSOLIDATE_AFTER_DAYS", "7"))
+MIN_CLUSTER = int(os.getenv("MEMORY_MIN_CLUSTER", "3"))
+RECENCY_HALF_LIFE_DAYS = float(os.getenv("MEMORY_RECENCY_HALF_LIFE_DAYS", "30"))
+USAGE_WEIGHT = float(os.getenv("MEMORY_USAGE_WEIGHT", "0.5"))
+COMPACTION_LOG = Path(os.getenv(
+    "MEMORY_COMPACTION_LOG",
+    Path(__file__).resolve().parent.parent / ".cache" / "memory_compaction.jsonl"
+))
+
+MAX_CLUSTER_PROMPT = 20  # memories summarized per LLM call; larger clusters are split
+
+SUMMARY_PROMPT = """Below are past conversation exchanges between one user and an AI assistant.
+Consolidate them into a single memory of at most 150 words. Keep every fact about the
+user, their preferences, plans and decisions, and any conclusions reached. Drop small
+talk and repetition. Write it as notes about the user, not as a dialogue.
+
+{memories}
+
+Consolidated memory:"""
+
+
+@dataclass
+class Memory:
+    """One stored memory, loaded with its vector for compaction."""
+    id: str
+    text: str
+    vector: np.ndarray
+    metadata: dict
+    absorbed: List["Memory"] = field(default_factory=list)  # near-duplicates merged into this one
+
+    @property
+    def timestamp(self) -> datetime:
+        return _parse_time(self.metadata.get("timestamp"))
+
+    @property
+    def first_timestamp(self) -> datetime:
+        """When the oldest exchange behind this memory happened."""
+        own = _parse_time(self.metadata["first_timestamp"]) if self.metadata.get("first_timestamp") else self.timestamp
+        return min([own] + [m.first_timestamp for m in self.absorbed])
+
+    @property
+    def last_used(self) -> datetime:
+        return max(self.timestamp, _parse_time(self.metadata.get("last_recalled")))
+
+    @property
+    def recall_count(self) -> int:
+        return self.metadata.get("recall_count", 0) + sum(m.recall_count for m in self.absorbed)
+
+    @property
+    def source_count(self) -> int:
+        """Exchanges this memory stands for."""
+        return self.metadata.get("source_count", 1) + sum(m.source_count for m in self.absorbed)
+
+
+@dataclass
+class UserReport:
+    """What compaction did to one user's memories."""
+    user_id: str
+    before: int = 0
+    merged: int = 0
+    consolidated: int = 0   # memories replaced by summaries
+    summaries: int = 0      # summaries written
+    evicted: int = 0
+
+    @property
+    def after(self) -> int:
+        return self.before - self.merged - self.consolidated + self.summaries - self.evicted
+
+
+def _parse_time(value: Optional[str]) -> datetime:
+    try:
+        return datetime.fromisoformat(value)
+    except (TypeError, ValueError):
+        return datetime.min
+
+
+def load_memories(store: MemoryStore, user_id: str) -> List[Memory]:
+    ids, texts, vectors, metadatas = store.user_points(user_id)
+    if not ids:
+        return []
+    matrix = np.asarray(vectors, dtype=np.float32)
+    matrix /= np.maximum(np.linalg.norm(matrix, axis=1, keepdims=True), 1e-12)
+    return [Memory(str(i), text, vector, dict(metadata)) for i, text, vector, metadata in zip(ids, texts, matrix, metadatas)]
+
+
+def merge_duplicates(memories: List[Memory], threshold: float = DEDUP_THRESHOLD) -> List[Memory]:
+    """
+    Fold near-duplicate memories into the newest of them.
+
+    Returns:
+        List[Memory]: The surviving memories, newest first
+    """
+    memories = sorted(memories, key=lambda m: m.timestamp, reverse=True)
+    vectors = np.stack([m.vector for m in memories])
+    similarity = vectors @ vectors.T
+    survivors = []
+    absorbed = np.zeros(len(memories), dtype=bool)
+    for i, memory in enumerate(memories):
+        if absorbed[i]:
+            continue
+        survivors.append(memory)
+        duplicates = np.flatnonzero((similarity[i, i + 1:] >= threshold) & ~absorbed[i + 1:]) + i + 1
+        absorbed[duplicates] = True
+        memory.absorbed.extend(memories[j] for j in duplicates)
+    return survivors
+
+
+def cluster(memories: List[Memory], threshold: float = CLUSTER_THRESHOLD) -> List[List[Memory]]:
+    """Greedy clustering: each memory joins the closest cluster centroid at least `threshold` similar."""
+    clusters: List[List[Memory]] = []
+    centroids: List[np.ndarray] = []
+    for memory in sorted(memories, key=lambda m: m.timestamp):
+        if centroids:
+            scores = np.stack(centroids) @ memory.vector
+            best = int(np.argmax(scores))
+            if scores[best] >= threshold:
+                clusters[best].append(memory)
+                centroid = np.mean([m.vector for m in clusters[best]], axis=0)
+                centroids[best] = centroid / max(np.linalg.norm(centroid), 1e-12)
+                continue
+        clusters.append([memory])
+        centroids.append(memory.vector)
+    return clusters
+
+
+def summarize(llm, memories: List[Memory]) -> str:
+    """Consolidate a cluster of memories into one with the LLM."""
+    listing = "\n\n".join(
+        f"[{m.timestamp:%Y-%m-%d}]\n{m.text}" for m in sorted(memories, key=lambda m: m.timestamp)
+    )
+    completion = llm.complete_sync(
+        [{"role": "user", "content": SUMMARY_PROMPT.format(memories=listing)}],
+        max_tokens=300,
+        temperature=0.2
+    )
+    return completion.text.strip()
+
+
+def consolidated_memory(user_id: str, summary: str, members: List[Memory]) -> Document:
+    recalled = [m.metadata.get("last_recalled") for m in members if m.metadata.get("last_recalled")]
+    return Document(
+        page_content=summary,
+        metadata={
+            "user_id": user_id,
+            "timestamp": max(m.timestamp for m in members).isoformat(),
+            "first_timestamp": min(m.first_timestamp for m in members).isoformat(),
+            "user_message": "",
+            "ai_response": summary[:500],
+            "consolidated": True,
+            "source_count": sum(m.source_count for m in members),
+            "recall_count": sum(m.recall_count for m in members),
+            **({"last_recalled": max(recalled)} if recalled else {})
+        }
+    )
+
+
+def eviction_scores(memories: List[Memory], now: datetime) -> np.ndarray:
+    """Higher is worth keeping: recency decay plus weighted log usage."""
+    age_days = np.array([max((now - m.last_used).total_seconds(), 0) / 86400 for m in memories])
+    recency = np.power(0.5, age_days / RECENCY_HALF_LIFE_DAYS)
+    usage = np.log1p([m.recall_count for m in memories])
+    return recency + USAGE_WEIGHT * usage
+
+
+def compact_user(store: MemoryStore, user_id: str, llm=None, cap: int = MEMORY_CAP, dry_run: bool = False) -> UserReport:
+    """
+    Merge, consolidate and cap one user's memories.
+
+    Args:
+        store: Memory store in the current layout
+        user_id: User to compact
+        llm: LLM router for summaries (None skips consolidation)
+        cap: Most memories kept for the user
+        dry_run: Report what would change without writing
+
+    Returns:
+        UserReport: Counts before and after
+    """
+    report = UserReport(user_id)
+    memories = load_memories(store, user_id)
+    report.before = len(memories)
+    if not memories:
+        return report
+    collection_name = store.collection_for(user_id)
+    now = datetime.now()
+
+    # Step 1: Near-duplicates
+    memories = merge_duplicates(memories)
+    deleted = [d.id for m in memories for d in m.absorbed]
+    report.merged = len(deleted)
+    updates = {
+        m.id: {"recall_count": m.recall_count, "source_count": m.source_count}
+        for m in memories if m.absorbed
+    }
+
+    # Step 2: Old clusters -> one consolidated memory each
+    new_docs = []
+    if llm is not None:
+        cutoff = now - timedelta(days=CONSOLIDATE_AFTER_DAYS)
+        old = [m for m in memories if m.timestamp < cutoff]
+        for group in cluster(old):
+            for start in range(0, len(group), MAX_CLUSTER_PROMPT):
+                members = group[start:start + MAX_CLUSTER_PROMPT]
+                if len(members) < MIN_CLUSTER:
+                    continue
+                summary = "" if dry_run else summarize(llm, members)
+                new_docs.append(consolidated_memory(user_id, summary, members))
+                replaced = {m.id for m in members}
+                memories = [m for m in memories if m.id not in replaced]
+                deleted.extend(replaced)
+                for memory_id in replaced:
+                    updates.pop(memory_id, None)
+                report.consolidated += len(members)
+                report.summaries += 1
+
+    # Step 3: Per-user cap, counting the new summaries as fresh memories
+    excess = len(memories) + len(new_docs) - cap
+    if excess > 0:
+        evicted = [memories[i] for i in np.argsort(eviction_scores(memories, now))[:excess]]
+        deleted.extend(m.id for m in evicted)
+        report.evicted = len(evicted)
+        for m in evicted:
+            updates.pop(m.id, None)
+
+    if dry_run or not (deleted or updates):
+        return report
+    # Summaries first: a crash in between leaves duplicates, never lost memories
+    if new_docs:
+        store.add_documents(new_docs)
+    if updates:
+        store.set_metadata(collection_name, list(updates), list(updates.values()))
+    if deleted:
+        store.delete(collection_name, deleted)
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Consolidate and compact long-term memories")
+    parser.add_argument("--user", action="append", help="user to compact (repeatable, default: everyone)")
+    parser.add_argument("--cap", type=int, default=MEMORY_CAP, help="memories kept per user")
+    parser.add_argument("--min-memories", type=int, default=10, help="skip users with fewer memories")
+    parser.add_argument("--no-summarize", action="store_true", help="only merge duplicates and enforce the cap")
+    parser.add_argument("--dry-run", action="store_true", help="report without writing")
+    args = parser.parse_args()
+
+    client = QdrantClient(url=QDRANT_URL) if VECTOR_BACKEND == "qdrant" else None
+    store = MemoryStore(get_embedding_model(), client)
+    llm = None if args.no_summarize else get_llm_router("hf:Qwen/Qwen2.5-72B-Instruct")
+
+    started = time.perf_counter()
+    points_before = store.count()
+    counts = store.users()
+    users = args.user or sorted(user for user, count in counts.items() if count >= args.min_memories)
+    print(f"🧹 Compacting {len(users)} of {len(counts)} users ({points_before} memories, {store.layout} layout)")
+
+    reports = []
+    for user_id in users:
+        try:
+            report = compact_user(store, user_id, llm, args.cap, args.dry_run)
+        except Exception as e:
+            print(f"⚠️ {user_id}: compaction failed: {e}")
+            continue
+        reports.append(report)
+        if report.after != report.before:
+            print(
+                f"  {user_id}: {report.before} -> {report.after} "
+                f"({report.merged} merged, {report.consolidated} into {report.summaries} summaries, {report.evicted} evicted)"
+            )
+
+    points_after = points_before if args.dry_run else store.count()
+    record = {
+        "finished_at": datetime.now().isoformat(),
+        "layout": store.layout,
+        "dry_run": args.dry_run,
+        "users": len(reports),
+        "points_before": points_before,
+        "points_after": points_after,
+        "merged": sum(r.merged for r in reports),
+        "consolidated": sum(r.consolidated for r in reports),
+        "summaries": sum(r.summaries for r in reports),
+        "evicted": sum(r.evicted for r in reports),
+        "projected_after": points_before - sum(r.before - r.after for r in reports),
+        "seconds": round(time.perf_counter() - started, 1)
+    }
+    COMPACTION_LOG.parent.mkdir(parents=True, exist_ok=True)
+    with open(COMPACTION_LOG, "a", encoding="utf-8") as f:
+        f.write(json.dumps(record) + "\n")
+    print(
+        f"✅ {record['points_before']} -> {record['projected_after'] if args.dry_run else record['points_after']} memories "
+        f"({record['merged']} merged, {record['consolidated']} consolidated into {record['summaries']}, "
+        f"{record['evicted']} evicted){' [dry run]' if args.dry_run else ''}"
+    )
+
+
+if __name__ == "__main__":
+    main()
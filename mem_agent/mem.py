@@ -1,9 +1,14 @@
 import os
+import sys
+from pathlib import Path
 from dotenv import load_dotenv
-from langchain_huggingface import HuggingFaceEmbeddings, HuggingFaceEndpoint, ChatHuggingFace
-from langchain_qdrant import QdrantVectorStore
+from langchain_huggingface import HuggingFaceEndpoint, ChatHuggingFace
 from qdrant_client import QdrantClient
 
+# Make the shared `common` package importable when run from this directory
+sys.path.append(str(Path(__file__).resolve().parent.parent))
+from common import get_embedding_model, get_vector_store
+
 load_dotenv()
 
 # ================================
@@ -17,10 +22,8 @@ COLLECTION_NAME = "mem_agent"
 # ================================
 # Embeddings Configuration
 # ================================
-# Using HuggingFace embeddings (sentence-transformers)
-embedding = HuggingFaceEmbeddings(
-    model_name="sentence-transformers/all-MiniLM-L6-v2"
-)
+# Using HuggingFace embeddings (sentence-transformers), cached on disk
+embedding = get_embedding_model()
 
 # ================================
 # LLM Configuration
@@ -41,8 +44,4 @@ llm = ChatHuggingFace(llm=hf_llm)
 qdrant_client = QdrantClient(url=QDRANT_URL)
 
 # Initialize vector store
-vector_store = QdrantVectorStore(
-    client=qdrant_client,
-    collection_name=COLLECTION_NAME,
-    embedding=embedding
-)
\ No newline at end of file
+vector_store = get_vector_store(COLLECTION_NAME, embedding, client=qdrant_client)
\ No newline at end of file
@@ -0,0 +1,122 @@
+"""
+Maintenance for the memory collections (see store.py).
+
+- index: add the user_id / timestamp payload indexes (and per-user HNSW
+  graphs) to collections created before they existed
+- move:  copy every memory, with its stored vector, from one layout to another
+  and drop the old collections (nothing is re-embedded)
+
+Usage:
+    python mem_agent/migrate.py index
+    python mem_agent/migrate.py move --from shared --to sharded --shards 32
+    python mem_agent/migrate.py move --from sharded --to per_tenant --keep-source
+
+Stop the memory agents first: memories written during a move may land in the
+old layout after their collection was copied.
+"""
+import argparse
+import sys
+from pathlib import Path
+
+from qdrant_client import QdrantClient
+
+# Make the shared `common` package importable when run from this directory
+sys.path.append(str(Path(__file__).resolve().parent.parent))
+from common import get_embedding_model
+from common.vector_store import QDRANT_URL, VECTOR_BACKEND
+from store import COLLECTION_NAME, LAYOUTS, MEMORY_LAYOUT, MEMORY_SHARDS, MemoryStore
+
+
+def index(store: MemoryStore):
+    """Index every existing collection of a layout."""
+    if store.backend == "local":
+        print("📇 Local stores index user_id in memory; nothing to do")
+        return
+    collections = store.collections()
+    for collection_name in collections:
+        created = store.upgrade(collection_name)
+        print(f"📇 {collection_name}: {'indexed ' + ', '.join(created) if created else 'already indexed'}")
+    print(f"✅ {len(collections)} collection(s) ready")
+
+
+def move(source: MemoryStore, target: MemoryStore, batch_size: int = 256, keep_source: bool = False) -> int:
+    """
+    Copy every memory from the source layout into the target layout.
+
+    Args:
+        source: Store in the current layout
+        target: Store in the new layout
+        batch_size: Points read and upserted at once
+        keep_source: Leave the old collections in place
+
+    Returns:
+        int: Memories moved
+    """
+    moved = 0
+    for collection_name in source.collections():
+        # Resharding can map a user to the collection they are already in
+        reused = _routes_to(target, collection_name)
+        copied = 0
+        for ids, texts, vectors, metadatas in source.iter_points(collection_name, batch_size):
+            staying = {
+                point_id for point_id, metadata in zip(ids, metadatas)
+                if target.collection_for(metadata.get("user_id", "")) == collection_name
+            }
+            rows = [i for i, point_id in enumerate(ids) if point_id not in staying]
+            if not rows:
+                continue
+            target.upsert(
+                [ids[i] for i in rows], [texts[i] for i in rows],
+                [vectors[i] for i in rows], [metadatas[i] for i in rows]
+            )
+            if reused and not keep_source:
+                source.delete(collection_name, [ids[i] for i in rows])
+            copied += len(rows)
+        moved += copied
+        print(f"📦 {collection_name}: moved {copied} memories")
+        if not reused and not keep_source:
+            source.drop(collection_name)
+            print(f"🗑️ Dropped {collection_name}")
+    return moved
+
+
+def _routes_to(target: MemoryStore, collection_name: str) -> bool:
+    """Whether the target layout can put users in this collection."""
+    if target.layout == "per_tenant":
+        return collection_name.startswith(f"{target.base_name}_user_")
+    return collection_name in target.fixed_collections()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Index or re-layout the memory collections")
+    parser.add_argument("command", choices=["index", "move"])
+    parser.add_argument("--from", dest="source", choices=LAYOUTS, default=MEMORY_LAYOUT, help="current layout")
+    parser.add_argument("--to", dest="target", choices=LAYOUTS, default=None, help="new layout (move)")
+    parser.add_argument("--shards", type=int, default=MEMORY_SHARDS, help="collections in the new sharded layout")
+    parser.add_argument("--source-shards", type=int, default=MEMORY_SHARDS, help="collections in the current sharded layout")
+    parser.add_argument("--collection", default=COLLECTION_NAME, help="collection name / prefix")
+    parser.add_argument("--batch-size", type=int, default=256)
+    parser.add_argument("--keep-source", action="store_true", help="don't drop the old collections (move)")
+    args = parser.parse_args()
+
+    client = QdrantClient(url=QDRANT_URL) if VECTOR_BACKEND == "qdrant" else None
+    embedding = get_embedding_model()
+    source = MemoryStore(embedding, client, layout=args.source, shards=args.source_shards, base_name=args.collection)
+
+    if args.command == "index":
+        index(source)
+        return
+
+    if args.target is None:
+        parser.error("move needs --to")
+    if args.target == args.source and (args.source != "sharded" or args.shards == args.source_shards):
+        parser.error("source and target layouts are the same")
+    target = MemoryStore(embedding, client, layout=args.target, shards=args.shards, base_name=args.collection)
+    moved = move(source, target, args.batch_size, args.keep_source)
+    print(f"✅ Moved {moved} memories from the {args.source} to the {args.target} layout")
+    if args.target != MEMORY_LAYOUT:
+        print(f"👉 Set MEMORY_LAYOUT={args.target}" + (f" MEMORY_SHARDS={args.shards}" if args.target == "sharded" else ""))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,133 @@
+"""
+LRU pool of per-user agents for the memory agent service.
+
+Creating an agent is cheap (the embedding model, Qdrant client, memory store
+and writer are shared by all of them), but its short-term history lives only
+in the agent. The pool keeps the most recently active MEMORY_MAX_AGENTS
+agents and drops the least recently used beyond that, or after
+MEMORY_AGENT_IDLE_SECONDS without a turn. A user whose agent was dropped gets
+a fresh one; their long-term memories are in the store either way.
+
+Each user's turns run one at a time (their agent's history is not safe to
+update concurrently). Turns of different users run concurrently, up to
+MEMORY_MAX_CONCURRENT_TURNS. An agent in the middle of a turn is never
+dropped.
+"""
+import asyncio
+import os
+import time
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+from typing import Any, Callable, Dict
+
+MAX_AGENTS = int(os.getenv("MEMORY_MAX_AGENTS", "10000"))
+AGENT_IDLE_SECONDS = float(os.getenv("MEMORY_AGENT_IDLE_SECONDS", "1800"))
+MAX_CONCURRENT_TURNS = int(os.getenv("MEMORY_MAX_CONCURRENT_TURNS", "64"))
+
+
+class _Entry:
+    __slots__ = ("agent", "lock", "last_used", "turns")
+
+    def __init__(self, agent):
+        self.agent = agent
+        self.lock = asyncio.Lock()
+        self.last_used = time.monotonic()
+        self.turns = 0  # running or waiting for the lock
+
+
+class AgentPool:
+    """Per-user agents, least recently used evicted first."""
+
+    def __init__(
+        self,
+        factory: Callable[[str], Any],
+        max_agents: int = MAX_AGENTS,
+        idle_seconds: float = AGENT_IDLE_SECONDS,
+        max_concurrency: int = MAX_CONCURRENT_TURNS
+    ):
+        """
+        Initialize an empty pool.
+
+        Args:
+            factory: Creates the agent for a user ID
+            max_agents: Agents kept at most (busy ones are never evicted)
+            idle_seconds: Agents unused this long are evicted
+            max_concurrency: Turns running at once, across users
+        """
+        self.factory = factory
+        self.max_agents = max_agents
+        self.idle_seconds = idle_seconds
+        self.max_concurrency = max_concurrency
+        self.semaphore = asyncio.Semaphore(max_concurrency)
+        self.created = 0
+        self.evicted = 0
+        self.hits = 0
+        self._entries: "OrderedDict[str, _Entry]" = OrderedDict()
+
+    def _entry(self, user_id: str) -> _Entry:
+        entry = self._entries.get(user_id)
+        if entry is not None:
+            self._entries.move_to_end(user_id)
+            self.hits += 1
+        else:
+            entry = _Entry(self.factory(user_id))
+            self._entries[user_id] = entry
+            self.created += 1
+        entry.last_used = time.monotonic()
+        self._evict()
+        return entry
+
+    def _evict(self):
+        """Drop idle agents and the least recently used beyond max_agents, skipping busy ones."""
+        now = time.monotonic()
+        for user_id, entry in list(self._entries.items())[:-1]:  # never the one just requested
+            over = len(self._entries) > self.max_agents
+            idle = now - entry.last_used > self.idle_seconds
+            if not (over or idle):
+                break  # ordered by last use: the rest are newer
+            if not entry.turns:
+                del self._entries[user_id]
+                self.evicted += 1
+
+    @asynccontextmanager
+    async def session(self, user_id: str):
+        """Hold a user's agent for one turn (waiting for the user's previous turn to finish)."""
+        entry = self._entry(user_id)
+        entry.turns += 1
+        try:
+            # The user's lock first: a queued second turn must not hold a concurrency slot
+            async with entry.lock, self.semaphore:
+                entry.last_used = time.monotonic()
+                yield entry.agent
+        finally:
+            entry.turns -= 1
+
+    def get(self, user_id: str):
+        """A user's agent, for reads that don't change its state."""
+        return self._entry(user_id).agent
+
+    def drop(self, user_id: str) -> bool:
+        """Forget a user's agent. Returns False if it wasn't pooled or is busy."""
+        entry = self._entries.get(user_id)
+        if entry is None or entry.turns:
+            return False
+        del self._entries[user_id]
+        return True
+
+    def __contains__(self, user_id: str) -> bool:
+        return user_id in self._entries
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def stats(self) -> Dict[str, Any]:
+        """Pool counters for monitoring."""
+        return {
+            "agents": len(self._entries),
+            "busy": sum(1 for entry in self._entries.values() if entry.turns),
+            "max_agents": self.max_agents,
+            "created": self.created,
+            "hits": self.hits,
+            "evicted": self.evicted,
+            "max_concurrency": self.max_concurrency
+        }
@@ -0,0 +1,123 @@
+"""
+FastAPI service running the memory agent for many users.
+
+One process shares a single embedding model, Qdrant client, memory store and
+write-behind writer between every user. The memory collections are checked
+(created and indexed) once at startup. Per-user agents, holding each user's
+short-term history, live in an LRU pool (see pool.py). Turns run concurrently
+on the event loop: the LLM call is awaited, and blocking memory reads and
+writes run in worker threads.
+
+Short-term history is per process, so run several workers behind a proxy
+that routes each user to the same worker (e.g. hashing on user_id).
+
+Endpoints:
+- POST /chat: Send a user's message and get the agent's reply
+- GET /users/{user_id}/memories: Search a user's long-term memories
+- DELETE /users/{user_id}/history: Clear a user's short-term history
+- GET /stats: Pool, writer and store counters
+
+Usage:
+    uvicorn service:app --host 0.0.0.0 --port 8001   (from mem_agent/)
+"""
+import asyncio
+from contextlib import asynccontextmanager
+
+from fastapi import FastAPI, HTTPException, Query
+from pydantic import BaseModel, Field
+
+from chat import MemoryAgent, get_memory_writer, memory_store
+from pool import AgentPool
+
+MAX_MESSAGE_CHARS = 8000
+
+# Per-user agents, least recently used dropped first
+pool = AgentPool(MemoryAgent)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Create and index the memory collections once, not per agent
+    await asyncio.to_thread(memory_store.prepare)
+    writer = get_memory_writer()
+    print(f"📦 Memory store ready ({memory_store.layout} layout)")
+    yield
+    # Persist memories still queued for the background writer
+    await asyncio.to_thread(writer.close)
+
+
+app = FastAPI(title="Memory Agent API", lifespan=lifespan)
+
+
+class ChatRequest(BaseModel):
+    user_id: str = Field(..., min_length=1, max_length=256)
+    message: str = Field(..., min_length=1, max_length=MAX_MESSAGE_CHARS)
+
+
+class ChatReply(BaseModel):
+    user_id: str
+    response: str
+    history_tokens: int
+
+
+@app.post("/chat", response_model=ChatReply)
+async def chat(payload: ChatRequest):
+    """
+    Run one turn of the user's agent.
+
+    A user's turns are answered one at a time, in order; different users'
+    turns run concurrently.
+    """
+    async with pool.session(payload.user_id) as agent:
+        try:
+            response = await agent.achat(payload.message)
+        except Exception as e:
+            print(f"❌ Turn failed for {payload.user_id}: {e}")
+            raise HTTPException(status_code=502, detail=f"LLM call failed: {type(e).__name__}")
+        return ChatReply(
+            user_id=payload.user_id,
+            response=response,
+            history_tokens=agent.conversation_history.tokens
+        )
+
+
+@app.get("/users/{user_id}/memories")
+async def search_memories(user_id: str, query: str = Query(..., min_length=1), k: int = Query(3, ge=1, le=50)):
+    """Long-term memories of a user most relevant to a query."""
+    docs = await asyncio.to_thread(memory_store.search, user_id, query, k)
+    return {
+        "user_id": user_id,
+        "memories": [
+            {
+                "content": doc.page_content,
+                "timestamp": doc.metadata.get("timestamp"),
+                "consolidated": doc.metadata.get("consolidated", False)
+            }
+            for doc in docs
+        ]
+    }
+
+
+@app.delete("/users/{user_id}/history")
+async def clear_history(user_id: str):
+    """Forget a user's short-term history (long-term memories are kept)."""
+    if user_id not in pool:
+        return {"user_id": user_id, "cleared": False}
+    async with pool.session(user_id) as agent:
+        agent.conversation_history.clear()
+    return {"user_id": user_id, "cleared": True}
+
+
+@app.get("/stats")
+async def stats():
+    """Agent pool, memory writer and store counters."""
+    return {
+        "agents": pool.stats(),
+        "writer": get_memory_writer().stats(),
+        "store": memory_store.stats()
+    }
+
+
+if __name__ == "__main__":
+    import uvicorn
+    uvicorn.run(app, host="0.0.0.0", port=8001)
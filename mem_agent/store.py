@@ -0,0 +1,393 @@
+"""
+Tenant-aware layout of the long-term memory collections.
+
+Every memory search is scoped to one user, so the store is laid out for
+per-user recall. MEMORY_LAYOUT picks where a user's memories live:
+- shared      one `mem_agent` collection, filtered on metadata.user_id
+- sharded     MEMORY_SHARDS collections (`mem_agent_shard_<n>`), picked by a
+              stable hash of the user ID, each filtered on metadata.user_id
+- per_tenant  one collection per user (`mem_agent_user_<hash>`), no filter
+              (Qdrant only)
+
+Qdrant collections are created (and existing ones upgraded, see ensure()) with
+payload indexes on metadata.user_id (keyword, marked as the tenant key so
+points are stored grouped by user) and metadata.timestamp (datetime). Shared
+and sharded collections build their HNSW graph per user (payload_m) instead of
+across all users, since no search ever crosses users. A filtered search then
+only touches the user's own points, however many users share the collection.
+Local stores keep an equivalent inverted index on user_id in memory.
+
+Existing points are moved between layouts with mem_agent/migrate.py.
+"""
+import hashlib
+import json
+import os
+import sys
+import threading
+import zlib
+from collections import OrderedDict, defaultdict
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+from langchain_core.vectorstores import VectorStore
+from qdrant_client import QdrantClient, models
+
+# Make the shared `common` package importable when run from this directory
+sys.path.append(str(Path(__file__).resolve().parent.parent))
+from common import get_vector_store, match_filter, quantization_config, search_params
+from common.vector_store import LOCAL_VECTOR_DIR, VECTOR_BACKEND, set_metadata, upsert_embeddings
+
+COLLECTION_NAME = "mem_agent"
+EMBEDDING_DIM = 384  # all-MiniLM-L6-v2 produces 384-dim vectors
+
+MEMORY_LAYOUT = os.getenv("MEMORY_LAYOUT", "shared")
+MEMORY_SHARDS = int(os.getenv("MEMORY_SHARDS", "16"))
+# Open per-collection vector stores kept around (per_tenant has one per user)
+MEMORY_STORE_CACHE = int(os.getenv("MEMORY_STORE_CACHE", "1024"))
+# Per-user HNSW graph degree in shared and sharded collections
+TENANT_HNSW_M = 16
+
+LAYOUTS = ("shared", "sharded", "per_tenant")
+INDEXED_FIELDS = {
+    "metadata.user_id": models.KeywordIndexParams(type=models.KeywordIndexType.KEYWORD, is_tenant=True),
+    "metadata.timestamp": models.DatetimeIndexParams(type=models.DatetimeIndexType.DATETIME),
+}
+
+
+def _local_exists(collection_name: str) -> bool:
+    """Whether a local store holds a collection (clear() leaves an empty meta.json behind)."""
+    meta_path = LOCAL_VECTOR_DIR / collection_name / "meta.json"
+    if not meta_path.exists():
+        return False
+    with open(meta_path, "r", encoding="utf-8") as f:
+        return json.load(f).get("dim") is not None
+
+
+class MemoryStore:
+    """Routes each user's memories to their collection and keeps it indexed."""
+
+    def __init__(
+        self,
+        embedding: Optional[Embeddings],
+        client: Optional[QdrantClient] = None,
+        layout: str = MEMORY_LAYOUT,
+        shards: int = MEMORY_SHARDS,
+        backend: str = VECTOR_BACKEND,
+        base_name: str = COLLECTION_NAME,
+        indexed: bool = True
+    ):
+        """
+        Initialize the store.
+
+        Args:
+            embedding: Embeddings for queries and new memories
+            client: Qdrant client (qdrant backend only)
+            layout: "shared", "sharded" or "per_tenant"
+            shards: Collections in the sharded layout
+            backend: "qdrant" or "local"
+            base_name: Collection name, or prefix of the sharded / per-tenant names
+            indexed: Create payload indexes on new collections (False only for benchmarks)
+        """
+        if layout not in LAYOUTS:
+            raise ValueError(f"Unknown memory layout: {layout} (expected one of {', '.join(LAYOUTS)})")
+        if layout == "per_tenant" and backend == "local":
+            # Every local store keeps its vectors memory-mapped: one open file per user
+            raise ValueError("The per_tenant memory layout needs VECTOR_BACKEND=qdrant")
+        self.embedding = embedding
+        self.client = client
+        self.layout = layout
+        self.shards = shards
+        self.backend = backend
+        self.base_name = base_name
+        self.indexed = indexed
+
+        self._ensured = set()
+        self._stores: "OrderedDict[str, VectorStore]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    # ---------- routing ----------
+
+    def collection_for(self, user_id: str) -> str:
+        """Name of the collection holding a user's memories."""
+        if self.layout == "shared":
+            return self.base_name
+        if self.layout == "sharded":
+            # crc32 is stable across processes, unlike hash()
+            return self._shard_name(zlib.crc32(user_id.encode("utf-8")) % self.shards)
+        # User IDs may contain anything, collection names may not
+        return f"{self.base_name}_user_{hashlib.sha1(user_id.encode('utf-8')).hexdigest()[:20]}"
+
+    def _shard_name(self, shard: int) -> str:
+        return f"{self.base_name}_shard_{shard}"
+
+    def fixed_collections(self) -> List[str]:
+        """Every collection the shared / sharded layouts route to (per-tenant ones aren't known up front)."""
+        if self.layout == "shared":
+            return [self.base_name]
+        if self.layout == "sharded":
+            return [self._shard_name(shard) for shard in range(self.shards)]
+        return []
+
+    def filter_for(self, user_id: str) -> Optional[models.Filter]:
+        """Search filter for a user (none needed when the collection is theirs alone)."""
+        if self.layout == "per_tenant":
+            return None
+        return match_filter(user_id=user_id)
+
+    def collections(self) -> List[str]:
+        """Existing collections that belong to this layout."""
+        if self.backend == "local":
+            names = [p.name for p in LOCAL_VECTOR_DIR.glob(f"{self.base_name}*") if _local_exists(p.name)]
+        else:
+            names = [c.name for c in self.client.get_collections().collections]
+        if self.layout == "shared":
+            return [name for name in names if name == self.base_name]
+        prefix = f"{self.base_name}_shard_" if self.layout == "sharded" else f"{self.base_name}_user_"
+        return sorted(name for name in names if name.startswith(prefix))
+
+    # ---------- collections ----------
+
+    def ensure(self, collection_name: str):
+        """Create a collection with its payload indexes, or add missing indexes to an existing one."""
+        if self.backend == "local" or collection_name in self._ensured:
+            return  # local stores are created on first write and index user_id on first search
+
+        if not self.client.collection_exists(collection_name):
+            try:
+                self.client.create_collection(
+                    collection_name=collection_name,
+                    vectors_config=models.VectorParams(size=EMBEDDING_DIM, distance=models.Distance.COSINE),
+                    hnsw_config=self._hnsw_config(),
+                    quantization_config=quantization_config()
+                )
+                if self.layout != "per_tenant":
+                    print(f"✅ Created collection: {collection_name}")
+            except Exception:
+                if not self.client.collection_exists(collection_name):
+                    raise  # not just another process creating it first
+        if self.indexed:
+            self.create_indexes(collection_name)
+        self._ensured.add(collection_name)
+
+    def prepare(self):
+        """Create and index the layout's fixed collections once, e.g. at service startup."""
+        for collection_name in self.fixed_collections():
+            self.ensure(collection_name)
+
+    def _hnsw_config(self) -> Optional[models.HnswConfigDiff]:
+        if self.layout == "per_tenant" or not self.indexed:
+            return None
+        # Per-user graphs only: every search is filtered to one user
+        return models.HnswConfigDiff(payload_m=TENANT_HNSW_M, m=0)
+
+    def create_indexes(self, collection_name: str) -> List[str]:
+        """
+        Create the payload indexes a collection is missing.
+
+        Returns:
+            List[str]: Fields that were indexed
+        """
+        schema = self.client.get_collection(collection_name).payload_schema or {}
+        created = []
+        for field, params in INDEXED_FIELDS.items():
+            if field in schema:
+                continue
+            self.client.create_payload_index(
+                collection_name=collection_name,
+                field_name=field,
+                field_schema=params,
+                wait=True
+            )
+            created.append(field)
+        return created
+
+    def upgrade(self, collection_name: str) -> List[str]:
+        """Index an existing collection and switch it to per-user HNSW graphs."""
+        created = self.create_indexes(collection_name)
+        hnsw_config = self._hnsw_config()
+        if hnsw_config is not None:
+            current = self.client.get_collection(collection_name).config.hnsw_config
+            if current.m != hnsw_config.m or current.payload_m != hnsw_config.payload_m:
+                # The graph is rebuilt in the background; searches keep working meanwhile
+                self.client.update_collection(collection_name=collection_name, hnsw_config=hnsw_config)
+        self._ensured.add(collection_name)
+        return created
+
+    def vector_store(self, collection_name: str) -> VectorStore:
+        """LangChain store for a collection (created and indexed if needed)."""
+        with self._lock:
+            store = self._stores.get(collection_name)
+            if store is not None:
+                self._stores.move_to_end(collection_name)
+                return store
+        self.ensure(collection_name)
+        store = get_vector_store(collection_name, self.embedding, client=self.client, backend=self.backend)
+        with self._lock:
+            self._stores[collection_name] = store
+            while len(self._stores) > MEMORY_STORE_CACHE:
+                self._stores.popitem(last=False)
+        return store
+
+    # ---------- reads and writes ----------
+
+    def add_documents(self, documents: List[Document], batch_size: int = 64) -> List[str]:
+        """Add memories, each to its user's collection (MemoryWriter calls this per batch)."""
+        by_collection: Dict[str, List[Document]] = defaultdict(list)
+        for doc in documents:
+            by_collection[self.collection_for(doc.metadata.get("user_id", ""))].append(doc)
+        ids = []
+        for collection_name, docs in by_collection.items():
+            ids.extend(self.vector_store(collection_name).add_documents(docs, batch_size=batch_size))
+        return ids
+
+    def search(self, user_id: str, query: str, k: int = 3) -> List[Document]:
+        """A user's memories most similar to the query."""
+        return self.search_by_vector(user_id, self.embedding.embed_query(query), k)
+
+    def search_by_vector(self, user_id: str, vector: List[float], k: int = 3) -> List[Document]:
+        """A user's memories most similar to an embedded query."""
+        collection_name = self.collection_for(user_id)
+        if self.layout == "per_tenant" and collection_name not in self._stores and not self._exists(collection_name):
+            return []  # no memories yet: don't create an empty collection just to search it
+        return self.vector_store(collection_name).similarity_search_by_vector(
+            vector,
+            k=k,
+            filter=self.filter_for(user_id),
+            search_params=search_params()
+        )
+
+    def _exists(self, collection_name: str) -> bool:
+        if self.backend == "local":
+            return _local_exists(collection_name)
+        return self.client.collection_exists(collection_name)
+
+    def count(self) -> int:
+        """Memories stored across every collection of the layout."""
+        total = 0
+        for collection_name in self.collections():
+            if self.backend == "local":
+                store = self.vector_store(collection_name)
+                store.refresh()
+                total += len(store)
+            else:
+                total += self.client.count(collection_name=collection_name, exact=True).count
+        return total
+
+    def record_recalls(self, recalls: Dict[Tuple[str, Any], Tuple[int, str]]):
+        """
+        Store search hit counters for eviction, one metadata update per collection.
+
+        Args:
+            recalls: (user_id, point ID) -> (recall_count, last_recalled) of each recalled memory
+        """
+        updates: Dict[str, Tuple[List, List[dict]]] = defaultdict(lambda: ([], []))
+        for (user_id, point_id), (recall_count, last_recalled) in recalls.items():
+            ids, metadata = updates[self.collection_for(user_id)]
+            ids.append(point_id)
+            metadata.append({"recall_count": recall_count, "last_recalled": last_recalled})
+        for collection_name, (ids, metadata) in updates.items():
+            self.set_metadata(collection_name, ids, metadata)
+
+    def set_metadata(self, collection_name: str, ids: List, updates: List[dict]):
+        """Merge metadata updates into existing memories."""
+        set_metadata(self.vector_store(collection_name), ids, updates)
+
+    def users(self) -> Dict[str, int]:
+        """Memory count per user, across every collection of the layout."""
+        counts: Dict[str, int] = defaultdict(int)
+        for collection_name in self.collections():
+            if self.backend == "local":
+                for _, _, _, metadatas in self.iter_points(collection_name, 4096):
+                    for metadata in metadatas:
+                        counts[metadata.get("user_id", "")] += 1
+                continue
+            # Answered from the user_id keyword index
+            response = self.client.facet(
+                collection_name=collection_name,
+                key="metadata.user_id",
+                limit=2**31 - 1,
+                exact=True
+            )
+            for hit in response.hits:
+                counts[str(hit.value)] += hit.count
+        return dict(counts)
+
+    def user_points(self, user_id: str) -> tuple:
+        """(ids, texts, vectors, metadatas) of every memory of a user."""
+        collection_name = self.collection_for(user_id)
+        columns = ([], [], [], [])
+        if not self._exists(collection_name):
+            return columns
+        for batch in self.iter_points(collection_name, filter=self.filter_for(user_id)):
+            for column, values in zip(columns, batch):
+                column.extend(values)
+        return columns
+
+    def iter_points(self, collection_name: str, batch_size: int = 256, filter=None) -> Iterator[tuple]:
+        """Yield (ids, texts, vectors, metadatas) batches of every point in a collection, optionally filtered."""
+        if self.backend == "local":
+            store = self.vector_store(collection_name)
+            store.refresh()
+            for ids, texts, vectors, metadatas in store.iter_rows(batch_size, filter):
+                yield ids, texts, vectors.tolist(), metadatas
+            return
+        offset = None
+        while True:
+            points, offset = self.client.scroll(
+                collection_name=collection_name,
+                scroll_filter=filter,
+                limit=batch_size,
+                offset=offset,
+                with_payload=True,
+                with_vectors=True
+            )
+            if points:
+                yield (
+                    [p.id for p in points],
+                    [(p.payload or {}).get("page_content", "") for p in points],
+                    [p.vector for p in points],
+                    [(p.payload or {}).get("metadata") or {} for p in points]
+                )
+            if offset is None:
+                return
+
+    def upsert(self, ids: List, texts: List[str], vectors: List[List[float]], metadatas: List[dict]):
+        """Upsert already-embedded memories, each into its user's collection."""
+        groups: Dict[str, list] = defaultdict(lambda: ([], [], [], []))
+        for point in zip(ids, texts, vectors, metadatas):
+            group = groups[self.collection_for(point[3].get("user_id", ""))]
+            for column, value in zip(group, point):
+                column.append(value)
+        for collection_name, (group_ids, group_texts, group_vectors, group_metadatas) in groups.items():
+            upsert_embeddings(
+                self.vector_store(collection_name), group_ids, group_texts, group_vectors, group_metadatas
+            )
+
+    def delete(self, collection_name: str, ids: List):
+        """Delete points from a collection by ID."""
+        if self.backend == "local":
+            get_vector_store(collection_name, self.embedding, backend="local").delete([str(i) for i in ids])
+        else:
+            self.client.delete(collection_name=collection_name, points_selector=models.PointIdsList(points=ids))
+
+    def drop(self, collection_name: str):
+        """Delete a collection (after its points were migrated elsewhere)."""
+        with self._lock:
+            self._stores.pop(collection_name, None)
+        self._ensured.discard(collection_name)
+        if self.backend == "local":
+            # Emptied in place: the process-wide store object for this directory stays valid
+            get_vector_store(collection_name, self.embedding, backend="local").clear()
+        else:
+            self.client.delete_collection(collection_name)
+
+    def stats(self) -> dict:
+        """Layout summary for monitoring."""
+        return {
+            "layout": self.layout,
+            "backend": self.backend,
+            "shards": self.shards if self.layout == "sharded" else None,
+            "open_collections": len(self._stores),
+        }
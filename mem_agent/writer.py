@@ -0,0 +1,257 @@
+"""
+Write-behind persistence for long-term memories.
+
+Storing a memory costs an embedding forward pass and a vector store upsert.
+MemoryWriter takes both off the conversational turn: write() only queues the
+exchange, and a background thread embeds and upserts queued memories in
+batches, once `batch_size` have accumulated or `flush_seconds` after the first
+one arrived. Everything still queued is flushed at interpreter exit.
+
+Reads need not wait for the writer: pending(user_id) returns the memories
+still queued for a user, which a reader can merge into its search results.
+When a search must find them through the store itself, wait_for(user_id)
+returns once every memory queued for that user is in the store
+(read-your-writes), at the cost of an embed and upsert on the read path.
+
+Search hit counters (recall_count, last_recalled, used by compact.py to pick
+what to evict) go the same way: record_recall() only adds to an in-memory
+tally, and the background thread stores the tally with one metadata update
+per collection at most every `flush_seconds`.
+"""
+import atexit
+import os
+import queue
+import threading
+import time
+from collections import OrderedDict, defaultdict
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+from langchain_core.documents import Document
+
+BATCH_SIZE = int(os.getenv("MEMORY_BATCH_SIZE", "32"))
+FLUSH_SECONDS = float(os.getenv("MEMORY_FLUSH_SECONDS", "1.0"))
+MAX_PENDING = int(os.getenv("MEMORY_MAX_PENDING", "1000"))
+SYNC_TIMEOUT = float(os.getenv("MEMORY_SYNC_TIMEOUT", "10"))
+WRITE_RETRIES = int(os.getenv("MEMORY_WRITE_RETRIES", "3"))
+RECALL_MEMO_SIZE = 10000  # last stored recall counts, for searches that read a stale count
+
+# Queue markers: persist everything queued so far now / stop the thread /
+# search hits were recorded (store them within flush_seconds)
+_FLUSH = object()
+_STOP = object()
+_RECALLS = object()
+
+
+class MemoryWriter:
+    """Queues memories and persists them in batches from a background thread."""
+
+    def __init__(
+        self,
+        vector_store,
+        batch_size: int = BATCH_SIZE,
+        flush_seconds: float = FLUSH_SECONDS,
+        max_pending: int = MAX_PENDING
+    ):
+        """
+        Initialize the writer and start its background thread.
+
+        Args:
+            vector_store: VectorStore or MemoryStore the memories are added to (it embeds them in one call per batch;
+                          record_recall() needs a MemoryStore)
+            batch_size: Memories persisted together
+            flush_seconds: Longest a memory waits for its batch to fill
+            max_pending: Queued memories before write() blocks (backpressure)
+        """
+        self.vector_store = vector_store
+        self.batch_size = batch_size
+        self.flush_seconds = flush_seconds
+        self.batches = 0
+        self.written = 0
+        self.failed = 0
+        self.recall_updates = 0
+
+        self._queue: "queue.Queue" = queue.Queue(maxsize=max_pending)
+        # user_id -> queued, not yet persisted memories (by id(), in queue order)
+        self._pending: Dict[str, Dict[int, Document]] = defaultdict(dict)
+        # (user_id, point ID) -> [recall_count, last_recalled] not stored yet
+        self._recalls: Dict[Tuple[str, Any], list] = {}
+        self._stored_recalls: "OrderedDict[Tuple[str, Any], int]" = OrderedDict()
+        self._persisted = threading.Condition()
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, name="memory-writer", daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    def write(self, doc: Document):
+        """Queue a memory; its metadata's user_id is tracked for wait_for()."""
+        if self._closed:
+            raise RuntimeError("MemoryWriter is closed")
+        with self._persisted:
+            self._pending[doc.metadata.get("user_id", "")][id(doc)] = doc
+        self._queue.put(doc)
+
+    def record_recall(self, user_id: str, docs: List[Document]):
+        """Count a search hit on each returned memory; stored in the background."""
+        now = datetime.now().isoformat()
+        with self._persisted:
+            wake = not self._recalls
+            for doc in docs:
+                point_id = doc.metadata.get("_id")
+                if point_id is None:
+                    continue  # still queued, not in the store
+                key = (user_id, point_id)
+                tally = self._recalls.get(key)
+                if tally is None:
+                    # The search may predate the last (unacknowledged) counter update
+                    count = max(doc.metadata.get("recall_count", 0), self._stored_recalls.get(key, 0))
+                    self._recalls[key] = [count + 1, now]
+                else:
+                    tally[0] += 1
+                    tally[1] = now
+            wake = wake and bool(self._recalls)
+        if wake:
+            try:
+                self._queue.put_nowait(_RECALLS)
+            except queue.Full:
+                pass  # the thread is busy with a backlog and stores them after its next batch
+
+    def pending(self, user_id: str) -> List[Document]:
+        """Memories queued for a user but not persisted yet, oldest first."""
+        with self._persisted:
+            return list(self._pending.get(user_id, {}).values())
+
+    def wait_for(self, user_id: str, timeout: float = SYNC_TIMEOUT) -> bool:
+        """
+        Block until every memory queued for a user is persisted.
+
+        Returns:
+            bool: False if the timeout passed first
+        """
+        with self._persisted:
+            if not self._pending.get(user_id):
+                return True
+        self._queue.put(_FLUSH)
+        with self._persisted:
+            return self._persisted.wait_for(lambda: not self._pending.get(user_id), timeout)
+
+    def flush(self, timeout: Optional[float] = SYNC_TIMEOUT) -> bool:
+        """Block until every queued memory is persisted. Returns False on timeout."""
+        self._queue.put(_FLUSH)
+        with self._persisted:
+            return self._persisted.wait_for(lambda: not any(self._pending.values()), timeout)
+
+    def close(self, timeout: Optional[float] = SYNC_TIMEOUT):
+        """Persist what is queued and stop the background thread."""
+        if self._closed:
+            return
+        self._closed = True
+        self._queue.put(_STOP)
+        self._thread.join(timeout)
+
+    def _collect(self) -> tuple:
+        """
+        Block for the first memory, then gather more until the batch is full,
+        the flush window ends or a flush is requested.
+
+        Returns:
+            (batch, stop)
+        """
+        batch: List[Document] = []
+        deadline = None
+        while len(batch) < self.batch_size:
+            timeout = None if deadline is None else deadline - time.monotonic()
+            if timeout is not None and timeout <= 0:
+                break
+            try:
+                item = self._queue.get(timeout=timeout)
+            except queue.Empty:
+                break
+            if item is _STOP:
+                return batch + self._drain(), True
+            if item is _FLUSH:
+                if batch or not self._queue.empty():
+                    return batch + self._drain(), False
+                continue
+            if item is _RECALLS:
+                if deadline is None:
+                    deadline = time.monotonic() + self.flush_seconds
+                continue
+            batch.append(item)
+            if deadline is None:
+                deadline = time.monotonic() + self.flush_seconds
+        return batch, False
+
+    def _drain(self) -> List[Document]:
+        """Everything queued right now, skipping markers."""
+        docs = []
+        while True:
+            try:
+                item = self._queue.get_nowait()
+            except queue.Empty:
+                return docs
+            if isinstance(item, Document):
+                docs.append(item)
+
+    def _persist(self, batch: List[Document]):
+        for start in range(0, len(batch), self.batch_size):
+            chunk = batch[start:start + self.batch_size]
+            for attempt in range(WRITE_RETRIES):
+                try:
+                    self.vector_store.add_documents(chunk, batch_size=len(chunk))
+                    self.batches += 1
+                    self.written += len(chunk)
+                    break
+                except Exception as e:
+                    if attempt == WRITE_RETRIES - 1:
+                        self.failed += len(chunk)
+                        print(f"⚠️ Dropped {len(chunk)} memories after {WRITE_RETRIES} attempts: {e}")
+                    else:
+                        time.sleep(0.5 * 2 ** attempt)
+
+            with self._persisted:
+                for doc in chunk:
+                    user_id = doc.metadata.get("user_id", "")
+                    self._pending[user_id].pop(id(doc), None)
+                    if not self._pending[user_id]:
+                        del self._pending[user_id]
+                self._persisted.notify_all()
+
+    def _persist_recalls(self):
+        with self._persisted:
+            recalls, self._recalls = self._recalls, {}
+        if not recalls:
+            return
+        try:
+            self.vector_store.record_recalls({key: tuple(tally) for key, tally in recalls.items()})
+            self.recall_updates += len(recalls)
+            with self._persisted:
+                for key, (count, _) in recalls.items():
+                    self._stored_recalls[key] = count
+                    self._stored_recalls.move_to_end(key)
+                while len(self._stored_recalls) > RECALL_MEMO_SIZE:
+                    self._stored_recalls.popitem(last=False)
+        except Exception as e:
+            print(f"⚠️ Failed to record memory usage for {len(recalls)} memories: {e}")
+
+    def _run(self):
+        while True:
+            batch, stop = self._collect()
+            if batch:
+                self._persist(batch)
+            self._persist_recalls()
+            if stop:
+                return
+
+    def stats(self) -> dict:
+        """Write-behind counters for monitoring."""
+        with self._persisted:
+            pending = sum(len(docs) for docs in self._pending.values())
+        return {
+            "pending": pending,
+            "written": self.written,
+            "failed": self.failed,
+            "batches": self.batches,
+            "avg_batch_size": self.written / self.batches if self.batches else 0.0,
+            "recall_updates": self.recall_updates
+        }
@@ -1,9 +1,18 @@
 import os
+import sys
 import json
+from pathlib import Path
 from openai import OpenAI
 from dotenv import load_dotenv
+
+# Make the shared `common` package importable when run from this directory
+sys.path.append(str(Path(__file__).resolve().parent.parent))
+from common import ShortTermMemory, get_token_counter
+
 load_dotenv()
 
+MODEL = "gemini-2.0-flash"
+
 client = OpenAI(
   api_key=os.getenv("GEMINI_API_KEY"), 
   base_url="https://generativelanguage.googleapis.com/v1beta/"
@@ -42,8 +51,11 @@ Response:
 IMPORTANT: Your entire response must be valid JSON. Do not include any text outside the JSON array.
 """
 
-# Initialize message history with system prompt
-messages = [{"role": "system", "content": SYSTEM_PROMPT}]
+# Conversation history within a token budget; older turns are summarized
+history = ShortTermMemory(
+    get_token_counter(MODEL),
+    complete=lambda messages: client.chat.completions.create(model=MODEL, messages=messages).choices[0].message.content
+)
 
 while True:
     # Get user input
@@ -59,20 +71,19 @@ while True:
         continue
     
     # Add user message to history
-    messages.append({"role": "user", "content": user_input})
+    history.add("user", user_input)
     
     # Get response from API
     response = client.chat.completions.create(
-        model = "gemini-2.0-flash"
-,
-        messages=messages
+        model=MODEL,
+        messages=[{"role": "system", "content": SYSTEM_PROMPT}] + history.messages()
     )
     
     # Extract assistant's reply
     assistant_reply = response.choices[0].message.content
     
     # Add assistant's reply to history
-    messages.append({"role": "assistant", "content": assistant_reply})
+    history.add("assistant", assistant_reply)
     
     # Print the response in JSON format
     try:
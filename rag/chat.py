@@ -1,44 +1,53 @@
-from langchain_huggingface import HuggingFaceEmbeddings
-from langchain_qdrant import QdrantVectorStore
-from qdrant_client import QdrantClient
-import google.generativeai as genai
+import sys
+from pathlib import Path
 from dotenv import load_dotenv
-import os
+
+# Make the shared `common` package importable when run from this directory
+sys.path.append(str(Path(__file__).resolve().parent.parent))
+from common import (
+    get_embedding_model,
+    get_llm_router,
+    get_token_counter,
+    get_vector_store,
+    pack_context,
+    search_params
+)
 
 load_dotenv()
 
-# Configure Gemini
-genai.configure(api_key=os.getenv("GEMINI_API_KEY"))
+GEMINI_MODEL = "gemini-2.0-flash"
 
-# Initialize the same embedding model used during indexing
-embedding_model = HuggingFaceEmbeddings(
-    model_name="sentence-transformers/all-MiniLM-L6-v2"
-)
+# Gemini first, hedged onto HuggingFace Qwen when slower than its recent p95
+# (LLM_PROVIDERS overrides the list)
+llm = get_llm_router(f"gemini:{GEMINI_MODEL},hf:Qwen/Qwen2.5-72B-Instruct")
 
-# Connect to existing Qdrant collection
-client = QdrantClient(url="http://localhost:6333")
-vector_store = QdrantVectorStore(
-    client=client,
-    collection_name="rag",
-    embedding=embedding_model
-)
+# Gemini's tokenizer isn't public, so this falls back to an approximate count
+count_tokens = get_token_counter(GEMINI_MODEL)
+
+# Initialize the same (cached) embedding model used during indexing
+embedding_model = get_embedding_model()
+
+# Connect to the existing collection (Qdrant, or the local store with VECTOR_BACKEND=local)
+vector_store = get_vector_store("rag", embedding_model)
 
 # Create a retriever
 retriever = vector_store.as_retriever(
     search_type="similarity",
-    search_kwargs={"k": 5}  # Return top 5 most similar chunks
+    # Return top 5 most similar chunks (quantized collections oversample and rescore)
+    search_kwargs={"k": 5, "search_params": search_params()}
 )
 
 
 def get_response(query: str) -> str:
     """
-    Retrieve relevant context and generate a response using Gemini.
+    Retrieve relevant context and generate a response using Gemini (hedged across providers).
     """
     # Step 1: Retrieve relevant documents
     docs = retriever.invoke(query)
     
-    # Step 2: Build context from retrieved documents
-    context = "\n\n---\n\n".join([doc.page_content for doc in docs])
+    # Step 2: Build context from retrieved documents, without overlapping
+    # text and within the token budget
+    context = pack_context(docs, count_tokens).text
     
     # Step 3: Create prompt with context
     prompt = f"""You are a helpful assistant. Answer the user's question based on the provided context.
@@ -51,11 +60,10 @@ Question: {query}
 
 Answer:"""
 
-    # Step 4: Generate response using Gemini
-    model = genai.GenerativeModel("gemini-2.0-flash")
-    response = model.generate_content(prompt)
+    # Step 4: Generate response (Gemini, or the faster provider on a slow request)
+    completion = llm.complete_sync([{"role": "user", "content": prompt}])
     
-    return response.text
+    return completion.text
 
 
 def main():
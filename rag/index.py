@@ -1,46 +1,434 @@
+"""
+Index PDFs into the Qdrant "rag" collection.
+
+Every chunk gets a deterministic point ID derived from its source and a hash of
+its content, and a local manifest records which chunks are already embedded.
+Re-running the script only embeds and upserts new or changed chunks and deletes
+the ones that are gone, instead of re-embedding the whole corpus.
+
+PDFs are parsed in a process pool, pages are streamed through the splitter,
+chunks are embedded in fixed-size batches and upserted in bounded batches, so
+peak memory stays flat regardless of corpus size.
+
+Set VECTOR_BACKEND=local to index into the embedded local store instead of Qdrant,
+and VECTOR_QUANTIZATION=int8|binary to keep quantized vectors for the first
+search pass (rescored with full precision).
+
+Usage:
+    python index.py                          # incremental index of llms.pdf
+    python index.py docs/ "papers/**/*.pdf"  # directories and globs of PDFs
+    python index.py docs/ --workers 8        # parse with 8 processes
+    python index.py --full                   # drop the collection and re-embed everything
+"""
+import argparse
+import glob
+import hashlib
+import json
+import os
+import sys
+import time
+import uuid
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from itertools import islice
 from pathlib import Path
 from langchain_community.document_loaders import PyPDFLoader
 from langchain_text_splitters import RecursiveCharacterTextSplitter
-from langchain_huggingface import HuggingFaceEmbeddings
-from langchain_qdrant import QdrantVectorStore
+from langchain_core.vectorstores import VectorStore
+from qdrant_client import QdrantClient
+from qdrant_client.models import Distance, VectorParams
 from dotenv import load_dotenv
 
+# Make the shared `common` package importable when run from this directory
+sys.path.append(str(Path(__file__).resolve().parent.parent))
+from common import EMBEDDING_MODEL, CollectionVersions, get_embedding_model
+from common.vector_store import (
+    QDRANT_URL,
+    VECTOR_BACKEND,
+    VECTOR_QUANTIZATION,
+    get_vector_store,
+    quantization_config,
+    upsert_embeddings
+)
+from redis.exceptions import RedisError
+
 load_dotenv()
 
+# ================================
+# Configuration
+# ================================
 BASE_DIR = Path(__file__).parent
+PDF_PATH = BASE_DIR / "llms.pdf"
+MANIFEST_PATH = BASE_DIR / ".index_manifest.json"
 
-pdf_path = BASE_DIR / ("llms.pdf")
+COLLECTION_NAME = "rag"
+EMBEDDING_DIM = 384  # all-MiniLM-L6-v2 produces 384-dim vectors
 
-print("PDF exists:", pdf_path.exists())  # should print True
+CHUNK_SIZE = 1000
+CHUNK_OVERLAP = 400
 
-loader = PyPDFLoader(str(pdf_path))
-docs = loader.load()
+EMBED_BATCH_SIZE = 64    # chunks per embedding forward pass
+UPSERT_BATCH_SIZE = 256  # points per Qdrant upsert
 
-print(docs[7])
+# Namespace for chunk point IDs, so the same chunk always maps to the same point
+CHUNK_NAMESPACE = uuid.UUID("6f1c3f0e-5b7a-4d4e-9a53-0c2f1f6a8b21")
 
-## splittinh
-## splitting
-splitter = RecursiveCharacterTextSplitter(
-    chunk_size=1000,
-    chunk_overlap=400
-)
 
-chunks = splitter.split_documents(docs)
+def file_sha256(path: Path) -> str:
+    """Hash a file's bytes so unchanged PDFs can be skipped without parsing."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
 
-print(f"Total chunks created: {len(chunks)}")
 
-#embedding - using HuggingFace (free, no API key required)
-embedding_model = HuggingFaceEmbeddings(
-    model_name="sentence-transformers/all-MiniLM-L6-v2"
-)
+def chunk_id(source: str, content: str) -> str:
+    """
+    Build a deterministic point ID for a chunk.
 
-vector_store = QdrantVectorStore.from_documents(
-    documents = chunks ,
-    embedding = embedding_model,
-    url="http://localhost:6333",
-    collection_name  = "rag"
+    The page number is deliberately left out so that inserting a page does not
+    change the IDs (and force a re-embed) of every chunk after it.
+    """
+    content_hash = hashlib.sha256(content.encode("utf-8")).hexdigest()
+    return str(uuid.uuid5(CHUNK_NAMESPACE, f"{source}\x00{content_hash}"))
 
-)
-print("Indexing completed")
+
+def load_manifest(path: Path = MANIFEST_PATH) -> dict:
+    """Load the manifest of already-indexed chunks, or an empty one."""
+    if path.exists():
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    return new_manifest()
+
+
+def new_manifest() -> dict:
+    return {
+        "model": EMBEDDING_MODEL,
+        "collection": COLLECTION_NAME,
+        "backend": VECTOR_BACKEND,
+        "sources": {}
+    }
+
+
+def save_manifest(manifest: dict, path: Path = MANIFEST_PATH):
+    """Write the manifest atomically so an interrupted run cannot corrupt it."""
+    tmp_path = path.with_suffix(".tmp")
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f)
+    tmp_path.replace(path)
+
+
+def ensure_collection(client: QdrantClient, recreate: bool = False):
+    """Create the collection if it doesn't exist (or drop and recreate it)."""
+    if recreate and client.collection_exists(COLLECTION_NAME):
+        client.delete_collection(COLLECTION_NAME)
+        print(f"🗑️ Dropped collection: {COLLECTION_NAME}")
+
+    if not client.collection_exists(COLLECTION_NAME):
+        client.create_collection(
+            collection_name=COLLECTION_NAME,
+            vectors_config=VectorParams(
+                size=EMBEDDING_DIM,
+                distance=Distance.COSINE
+            ),
+            quantization_config=quantization_config()
+        )
+        print(f"✅ Created collection: {COLLECTION_NAME}")
+    elif VECTOR_QUANTIZATION != "none" and client.get_collection(COLLECTION_NAME).config.quantization_config is None:
+        client.update_collection(
+            collection_name=COLLECTION_NAME,
+            quantization_config=quantization_config()
+        )
+        print(f"🗜️ Enabled {VECTOR_QUANTIZATION} quantization on: {COLLECTION_NAME}")
+
+
+def expand_paths(patterns: list) -> list:
+    """Expand files, directories (searched recursively) and globs into PDF paths."""
+    paths = []
+    for pattern in patterns:
+        path = Path(pattern)
+        if path.is_dir():
+            paths.extend(sorted(path.rglob("*.pdf")))
+        elif path.is_file():
+            paths.append(path)
+        else:
+            matches = sorted(Path(p) for p in glob.glob(pattern, recursive=True))
+            if not matches:
+                print(f"❌ No PDFs match: {pattern}")
+            paths.extend(p for p in matches if p.is_file())
+
+    # Deduplicate while keeping order
+    unique = {}
+    for path in paths:
+        unique.setdefault(str(path.resolve()), path)
+    return list(unique.values())
+
+
+def parse_pdf(source: str, known_hash) -> tuple:
+    """
+    Parse one PDF into pages. Runs inside the process pool.
+
+    Args:
+        source: Absolute path of the PDF
+        known_hash: File hash recorded in the manifest, if any
+
+    Returns:
+        tuple: (source, file hash, pages) where pages is None if the file is unchanged
+    """
+    file_hash = file_sha256(Path(source))
+    if file_hash == known_hash:
+        return source, file_hash, None
+    return source, file_hash, PyPDFLoader(source).load()
+
+
+def parse_in_pool(sources: list, manifest: dict, workers: int):
+    """
+    Parse PDFs in a process pool and yield results as they complete.
+
+    At most two files per worker are in flight, so parsed pages never pile up
+    faster than the embedding stage can consume them.
+    """
+    pending = iter(sources)
+    in_flight = set()
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        def submit(n):
+            for source in islice(pending, n):
+                known_hash = manifest["sources"].get(source, {}).get("sha256")
+                in_flight.add(executor.submit(parse_pdf, source, known_hash))
+
+        submit(workers * 2)
+        while in_flight:
+            done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+            for future in done:
+                in_flight.discard(future)
+                yield future.result()
+            submit(len(done))
+
+
+def iter_chunks(pages: list, splitter: RecursiveCharacterTextSplitter):
+    """Stream chunks page by page instead of splitting the whole document at once."""
+    for page in pages:
+        yield from splitter.split_documents([page])
+
+
+def batched(iterable, size: int):
+    """Yield lists of up to `size` items."""
+    iterator = iter(iterable)
+    while batch := list(islice(iterator, size)):
+        yield batch
+
+
+class Ingestor:
+    """Embeds chunks in fixed-size batches and upserts them in bounded batches."""
+
+    def __init__(self, vector_store: VectorStore, embedding_model, manifest: dict):
+        self.vector_store = vector_store
+        self.embedding_model = embedding_model
+        self.manifest = manifest
+        self.points = []      # embedded (id, chunk, vector) waiting to be upserted
+        self.finished = []    # (source, entry, stale_ids) waiting on those upserts
+        self.embedded = 0
+        self.deleted = 0
+        self.started = time.perf_counter()
+
+    def embed(self, chunks: list):
+        """Embed a batch of (point_id, chunk) pairs."""
+        vectors = self.embedding_model.embed_documents([chunk.page_content for _, chunk in chunks])
+        for (point_id, chunk), vector in zip(chunks, vectors):
+            self.points.append((point_id, chunk, vector))
+        self.embedded += len(chunks)
+        if len(self.points) >= UPSERT_BATCH_SIZE:
+            self.flush()
+
+    def finish_source(self, source: str, entry: dict, stale_ids: list):
+        """Record a fully-chunked source, committed once its points are upserted."""
+        self.finished.append((source, entry, stale_ids))
+
+    def flush(self):
+        """Upsert buffered points, then commit the sources they completed."""
+        for batch in batched(self.points, UPSERT_BATCH_SIZE):
+            upsert_embeddings(
+                self.vector_store,
+                ids=[point_id for point_id, _, _ in batch],
+                texts=[chunk.page_content for _, chunk, _ in batch],
+                embeddings=[vector for _, _, vector in batch],
+                metadatas=[chunk.metadata for _, chunk, _ in batch]
+            )
+        self.points = []
+
+        for source, entry, stale_ids in self.finished:
+            if stale_ids:
+                self.vector_store.delete(ids=stale_ids)
+                self.deleted += len(stale_ids)
+            self.manifest["sources"][source] = entry
+        self.finished = []
+        self.report()
+
+    def report(self):
+        elapsed = time.perf_counter() - self.started
+        rate = self.embedded / elapsed if elapsed else 0.0
+        print(f"  ⚡ {self.embedded} chunks embedded | {rate:.1f} chunks/sec")
+
+
+def index_source(
+    source: str,
+    file_hash: str,
+    pages: list,
+    splitter: RecursiveCharacterTextSplitter,
+    ingestor: Ingestor
+) -> int:
+    """
+    Stream one parsed PDF through the splitter into the ingestor.
+
+    Returns:
+        int: Number of chunks in the source
+    """
+    entry = ingestor.manifest["sources"].get(source, {"sha256": None, "ids": []})
+    known = set(entry["ids"])
+    current = set()
+    batch = []
+
+    for chunk in iter_chunks(pages, splitter):
+        chunk.metadata["source"] = source
+        point_id = chunk_id(source, chunk.page_content)
+        # Identical chunks collapse onto the same point ID
+        if point_id in current:
+            continue
+        current.add(point_id)
+        if point_id in known:
+            continue
+        batch.append((point_id, chunk))
+        if len(batch) >= EMBED_BATCH_SIZE:
+            ingestor.embed(batch)
+            batch = []
+
+    if batch:
+        ingestor.embed(batch)
+
+    stale_ids = [point_id for point_id in entry["ids"] if point_id not in current]
+    ingestor.finish_source(source, {"sha256": file_hash, "ids": list(current)}, stale_ids)
+    return len(current)
+
+
+def prune_missing_sources(vector_store: VectorStore, manifest: dict, sources: list) -> int:
+    """Delete the points of sources that no longer exist on disk."""
+    deleted = 0
+    for source in list(manifest["sources"]):
+        if source not in sources and not Path(source).exists():
+            stale_ids = manifest["sources"].pop(source)["ids"]
+            if stale_ids:
+                vector_store.delete(ids=stale_ids)
+            deleted += len(stale_ids)
+            print(f"🗑️ Removed {len(stale_ids)} chunks of deleted source: {source}")
+    return deleted
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Index PDFs into Qdrant")
+    parser.add_argument(
+        "paths",
+        nargs="*",
+        default=[str(PDF_PATH)],
+        help="PDF files, directories or glob patterns"
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=os.cpu_count() or 1,
+        help="processes used to parse PDFs"
+    )
+    parser.add_argument(
+        "--full",
+        action="store_true",
+        help="drop the collection and manifest and re-embed everything"
+    )
+    args = parser.parse_args()
+
+    manifest_missing = not MANIFEST_PATH.exists()
+    manifest = load_manifest()
+    full = args.full
+    if (
+        manifest.get("model") != EMBEDDING_MODEL
+        or manifest.get("collection") != COLLECTION_NAME
+        or manifest.get("backend", "qdrant") != VECTOR_BACKEND
+    ):
+        print("⚠️ Embedding model, collection or backend changed since last run, doing a full re-index")
+        full = True
+    if full:
+        manifest = new_manifest()
+
+    sources = [str(path.resolve()) for path in expand_paths(args.paths)]
+    print(f"📚 {len(sources)} PDFs to check with {args.workers} workers")
+
+    #embedding - using HuggingFace (free, no API key required), cached on disk
+    # so chunks embedded by a previous run (or by --full) never hit the model again
+    embedding_model = get_embedding_model()
+
+    # Points in a collection without a manifest were indexed under other (random)
+    # IDs by an earlier version of this script, and would be retrieved next to
+    # their re-indexed copies: rebuild the collection instead
+    if VECTOR_BACKEND == "local":
+        vector_store = get_vector_store(COLLECTION_NAME, embedding_model)
+        if manifest_missing and not full and len(vector_store):
+            print(f"⚠️ {len(vector_store)} points indexed without a manifest, doing a full re-index")
+            full = True
+        if full:
+            vector_store.clear()
+            print(f"🗑️ Cleared local store: {vector_store.path}")
+    else:
+        client = QdrantClient(url=QDRANT_URL)
+        if manifest_missing and not full and client.collection_exists(COLLECTION_NAME):
+            untracked = client.count(collection_name=COLLECTION_NAME, exact=True).count
+            if untracked:
+                print(f"⚠️ {untracked} points indexed without a manifest, doing a full re-index")
+                full = True
+        ensure_collection(client, recreate=full)
+        vector_store = get_vector_store(COLLECTION_NAME, embedding_model, client=client)
+
+    splitter = RecursiveCharacterTextSplitter(
+        chunk_size=CHUNK_SIZE,
+        chunk_overlap=CHUNK_OVERLAP
+    )
+
+    ingestor = Ingestor(vector_store, embedding_model, manifest)
+    files_done = 0
+    try:
+        for source, file_hash, pages in parse_in_pool(sources, manifest, args.workers):
+            files_done += 1
+            name = Path(source).name
+            if pages is None:
+                print(f"⏭️  [{files_done}/{len(sources)}] Unchanged: {name}")
+                continue
+            total = index_source(source, file_hash, pages, splitter, ingestor)
+            print(f"📄 [{files_done}/{len(sources)}] {name}: {total} chunks")
+        ingestor.flush()
+        ingestor.deleted += prune_missing_sources(vector_store, manifest, sources)
+        if VECTOR_BACKEND == "local" and VECTOR_QUANTIZATION != vector_store.quantization and len(vector_store):
+            vector_store.quantize(VECTOR_QUANTIZATION)
+            print(f"🗜️ Local store quantization: {VECTOR_QUANTIZATION}")
+    finally:
+        # Only sources whose points were upserted are in the manifest, so an
+        # interrupted run resumes where it stopped
+        save_manifest(manifest)
+
+    if full or ingestor.embedded or ingestor.deleted:
+        # Invalidate answers cached against the previous contents
+        try:
+            version = CollectionVersions().bump(COLLECTION_NAME)
+            print(f"🔖 Collection version: {version}")
+        except RedisError as e:
+            print(f"⚠️ Could not bump collection version (cached answers may be stale): {e}")
+
+    stats = embedding_model.stats()
+    print(f"🧮 Embedding cache: {stats['hits_memory'] + stats['hits_disk']} hits, {stats['misses']} misses")
+
+    elapsed = time.perf_counter() - ingestor.started
+    print(
+        f"Indexing completed: {ingestor.embedded} chunks embedded, "
+        f"{ingestor.deleted} deleted in {elapsed:.1f}s "
+        f"({ingestor.embedded / elapsed if elapsed else 0:.1f} chunks/sec)"
+    )
 
 
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,182 @@
+"""
+Admission control and backpressure.
+
+Under a spike it is better to turn requests away quickly than to let queues
+(and every user's latency) grow without bound. Requests are admitted in two
+steps:
+
+1. Per-client token buckets: each client gets a steady rate plus a burst, so a
+   single heavy client cannot starve the others.
+2. Queue depth limits per priority: when a queue already holds its maximum,
+   the request is rejected with 429 and a Retry-After estimated from the rate
+   at which that queue has recently been draining.
+
+Priorities are "interactive" (/chat, /chat/stream and single RQ jobs) and
+"batch" (/chat/batch), which RQ workers only take when no interactive job is
+waiting.
+"""
+import math
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Optional
+
+QUEUE_MAX_DEPTH = {
+    "interactive": int(os.getenv("QUEUE_MAX_DEPTH_INTERACTIVE", "1000")),
+    "batch": int(os.getenv("QUEUE_MAX_DEPTH_BATCH", "50000"))
+}
+# Requests per second and burst per client; batch buckets count messages
+CLIENT_RATE = {
+    "interactive": float(os.getenv("CLIENT_RATE", "5")),
+    "batch": float(os.getenv("BATCH_CLIENT_RATE", "200"))
+}
+CLIENT_BURST = {
+    "interactive": float(os.getenv("CLIENT_BURST", "20")),
+    "batch": float(os.getenv("BATCH_CLIENT_BURST", "5000"))
+}
+MAX_RETRY_AFTER = 300
+MAX_TRACKED_CLIENTS = 10000
+
+
+class AdmissionRejected(Exception):
+    """A request was refused; the client should retry after `retry_after` seconds."""
+
+    def __init__(self, reason: str, retry_after: int):
+        super().__init__(reason)
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+def _clamp_retry_after(seconds: float) -> int:
+    return int(min(MAX_RETRY_AFTER, max(1, math.ceil(seconds))))
+
+
+class TokenBuckets:
+    """One token bucket per client, least recently seen clients forgotten first."""
+
+    def __init__(self, rate: float, burst: float, max_clients: int = MAX_TRACKED_CLIENTS):
+        """
+        Initialize the buckets.
+
+        Args:
+            rate: Tokens added per second
+            burst: Bucket capacity (and starting level)
+            max_clients: Buckets kept before the least recently used is dropped
+        """
+        self.rate = rate
+        self.burst = burst
+        self.max_clients = max_clients
+        self._buckets: "OrderedDict[str, list]" = OrderedDict()  # client -> [tokens, updated_at]
+        self._lock = threading.Lock()
+
+    def take(self, client: str, cost: float = 1.0):
+        """
+        Spend `cost` tokens from a client's bucket.
+
+        Raises:
+            AdmissionRejected: If the bucket does not hold enough tokens
+        """
+        if cost > self.burst:
+            raise AdmissionRejected(f"request larger than the per-client burst of {self.burst:g}", MAX_RETRY_AFTER)
+
+        now = time.monotonic()
+        with self._lock:
+            tokens, updated_at = self._buckets.pop(client, (self.burst, now))
+            tokens = min(self.burst, tokens + (now - updated_at) * self.rate)
+            if tokens >= cost:
+                tokens -= cost
+                rejected = None
+            else:
+                rejected = AdmissionRejected("client rate limit exceeded", _clamp_retry_after((cost - tokens) / self.rate))
+            self._buckets[client] = [tokens, now]
+            if len(self._buckets) > self.max_clients:
+                self._buckets.popitem(last=False)
+        if rejected:
+            raise rejected
+
+
+class DrainRate:
+    """Exponentially weighted estimate of how many items per second a queue completes."""
+
+    def __init__(self, half_life: float = 30.0):
+        """
+        Initialize the estimator.
+
+        Args:
+            half_life: Seconds after which an observation has half its weight
+        """
+        self.half_life = half_life
+        self.rate = 0.0
+        self._last: Optional[tuple] = None  # (time, completed_total)
+
+    def observe(self, completed_total: int):
+        """Record the running total of items that have left the queue."""
+        now = time.monotonic()
+        if self._last is not None:
+            elapsed = now - self._last[0]
+            if elapsed < 0.5:
+                return
+            instant = max(0, completed_total - self._last[1]) / elapsed
+            weight = 0.5 ** (elapsed / self.half_life)
+            self.rate = weight * self.rate + (1 - weight) * instant
+        self._last = (now, completed_total)
+
+    def eta(self, items: float) -> int:
+        """Seconds until `items` more have drained, as a Retry-After value."""
+        if self.rate <= 0:
+            return MAX_RETRY_AFTER
+        return _clamp_retry_after(items / self.rate)
+
+
+class AdmissionController:
+    """Per-client rate limits and per-priority queue depth limits."""
+
+    def __init__(
+        self,
+        max_depth: Dict[str, int] = QUEUE_MAX_DEPTH,
+        client_rate: Dict[str, float] = CLIENT_RATE,
+        client_burst: Dict[str, float] = CLIENT_BURST
+    ):
+        self.max_depth = dict(max_depth)
+        self.buckets = {priority: TokenBuckets(client_rate[priority], client_burst[priority]) for priority in max_depth}
+        self.drain = {priority: DrainRate() for priority in max_depth}
+        self.admitted = {priority: 0 for priority in max_depth}
+        self.rejected = {priority: 0 for priority in max_depth}
+
+    def admit(self, priority: str, client: str, depth: int, completed_total: int, incoming: int = 1):
+        """
+        Admit `incoming` requests from a client into a queue, or raise.
+
+        Args:
+            priority: "interactive" or "batch"
+            client: Client identifier for rate limiting
+            depth: Items currently waiting in the queue
+            completed_total: Running total of items that have left the queue
+            incoming: Items this request adds
+
+        Raises:
+            AdmissionRejected: If the client is over its rate or the queue is full
+        """
+        drain = self.drain[priority]
+        drain.observe(completed_total)
+        try:
+            excess = depth + incoming - self.max_depth[priority]
+            if excess > 0:
+                raise AdmissionRejected(f"{priority} queue is full", drain.eta(excess))
+            self.buckets[priority].take(client, incoming)
+        except AdmissionRejected:
+            self.rejected[priority] += 1
+            raise
+        self.admitted[priority] += 1
+
+    def stats(self) -> dict:
+        return {
+            priority: {
+                "max_depth": self.max_depth[priority],
+                "drain_rate": round(self.drain[priority].rate, 3),
+                "admitted": self.admitted[priority],
+                "rejected": self.rejected[priority]
+            }
+            for priority in self.max_depth
+        }
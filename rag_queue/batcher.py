@@ -0,0 +1,113 @@
+"""
+Micro-batching for query embeddings.
+
+Every /chat job needs one query embedding. Instead of N concurrent jobs doing N
+single-sentence forward passes, EmbeddingBatcher collects the queries that
+arrive within a small window (up to a maximum batch size), embeds them with one
+embed_documents call and hands each vector back to the job waiting on it.
+"""
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from typing import List
+
+from langchain_core.embeddings import Embeddings
+
+# How long the first query of a batch waits for company, and the batch size cap
+BATCH_WINDOW_MS = float(os.getenv("EMBED_BATCH_WINDOW_MS", "5"))
+BATCH_MAX_SIZE = int(os.getenv("EMBED_BATCH_MAX_SIZE", "32"))
+
+
+class EmbeddingBatcher(Embeddings):
+    """Embeddings wrapper that coalesces concurrent embed_query calls into batches."""
+
+    def __init__(
+        self,
+        embedding: Embeddings,
+        window_ms: float = BATCH_WINDOW_MS,
+        max_batch_size: int = BATCH_MAX_SIZE
+    ):
+        """
+        Initialize the batcher and start its background thread.
+
+        Args:
+            embedding: Underlying embeddings used for each batch
+            window_ms: Collection window in milliseconds, starting at the first query
+            max_batch_size: Maximum queries per forward pass
+        """
+        self.embedding = embedding
+        self.window = window_ms / 1000
+        self.max_batch_size = max_batch_size
+        self.batches = 0
+        self.queries = 0
+
+        self._queue: "queue.Queue[tuple]" = queue.Queue()
+        self._thread = threading.Thread(target=self._run, name="embedding-batcher", daemon=True)
+        self._thread.start()
+
+    def submit(self, text: str) -> Future:
+        """
+        Queue a query for the next batch.
+
+        Returns:
+            Future: Resolves to the query's embedding vector
+        """
+        future: Future = Future()
+        self._queue.put((text, future))
+        return future
+
+    def embed_query(self, text: str) -> List[float]:
+        """Embed a query as part of a micro-batch (blocks until the batch is done)."""
+        return self.submit(text).result()
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        """Documents already arrive in batches, so they bypass the batcher."""
+        return self.embedding.embed_documents(texts)
+
+    def _collect(self) -> list:
+        """Block for the first query, then gather more until the window or cap is hit."""
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self.window
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            # Skip queries whose callers gave up while waiting
+            batch = [
+                (text, future) for text, future in self._collect()
+                if future.set_running_or_notify_cancel()
+            ]
+            if not batch:
+                continue
+
+            try:
+                vectors = self.embedding.embed_documents([text for text, _ in batch])
+            except Exception as e:
+                for _, future in batch:
+                    future.set_exception(e)
+                continue
+
+            self.batches += 1
+            self.queries += len(batch)
+            for (_, future), vector in zip(batch, vectors):
+                future.set_result(vector)
+
+    def stats(self) -> dict:
+        """Batch counters for monitoring."""
+        return {
+            "batches": self.batches,
+            "queries": self.queries,
+            "avg_batch_size": self.queries / self.batches if self.batches else 0.0,
+            "window_ms": self.window * 1000,
+            "max_batch_size": self.max_batch_size
+        }
@@ -0,0 +1,108 @@
+"""
+Optional HTTP delivery of job results to external consumers.
+
+Workers publish results straight into the shared Redis results store (see
+results.py), which is all the API server needs. Services that want results
+pushed to them over HTTP set RESULT_CALLBACK_URL. CallbackSink then POSTs each
+result from a background thread, so delivery is never on a job's critical
+path, over a pooled keep-alive session that retries transient failures with
+backoff. Results that cannot be delivered are logged, never raised.
+"""
+import os
+import queue
+import threading
+from typing import Optional
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+RESULT_CALLBACK_URL = os.getenv("RESULT_CALLBACK_URL")
+CALLBACK_TIMEOUT = float(os.getenv("RESULT_CALLBACK_TIMEOUT", "5"))
+CALLBACK_RETRIES = int(os.getenv("RESULT_CALLBACK_RETRIES", "3"))
+CALLBACK_QUEUE_SIZE = int(os.getenv("RESULT_CALLBACK_QUEUE_SIZE", "10000"))
+CALLBACK_THREADS = int(os.getenv("RESULT_CALLBACK_THREADS", "2"))
+
+
+class CallbackSink:
+    """Background, retrying HTTP POST of results to one URL."""
+
+    def __init__(
+        self,
+        url: str,
+        timeout: float = CALLBACK_TIMEOUT,
+        retries: int = CALLBACK_RETRIES,
+        max_pending: int = CALLBACK_QUEUE_SIZE,
+        threads: int = CALLBACK_THREADS
+    ):
+        """
+        Initialize the sink and start its delivery threads.
+
+        Args:
+            url: Endpoint receiving each result as a JSON POST
+            timeout: Seconds per attempt
+            retries: Retries on connection errors and 429/5xx responses
+            max_pending: Results buffered before new ones are dropped
+            threads: Concurrent deliveries (and pooled connections)
+        """
+        self.url = url
+        self.timeout = timeout
+        self.delivered = 0
+        self.failed = 0
+        self.dropped = 0
+
+        retry = Retry(
+            total=retries,
+            backoff_factor=0.5,
+            status_forcelist=[429, 500, 502, 503, 504],
+            allowed_methods={"POST"},
+            raise_on_status=False
+        )
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=threads, max_retries=retry)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+        self._queue: "queue.Queue[dict]" = queue.Queue(maxsize=max_pending)
+        for i in range(threads):
+            threading.Thread(target=self._run, name=f"result-callback-{i}", daemon=True).start()
+
+    def send(self, result: dict):
+        """Queue a result for delivery without blocking."""
+        try:
+            self._queue.put_nowait(result)
+        except queue.Full:
+            self.dropped += 1
+            print(f"⚠️ Result callback queue full, dropped result for job {result.get('job_id')}")
+
+    def _run(self):
+        while True:
+            result = self._queue.get()
+            try:
+                response = self.session.post(self.url, json=result, timeout=self.timeout)
+                response.raise_for_status()
+                self.delivered += 1
+            except requests.RequestException as e:
+                self.failed += 1
+                print(f"⚠️ Result callback failed for job {result.get('job_id')}: {e}")
+            finally:
+                self._queue.task_done()
+
+    def flush(self, timeout: Optional[float] = None):
+        """Wait until every queued result has been attempted (used before exiting)."""
+        done = threading.Thread(target=self._queue.join, daemon=True)
+        done.start()
+        done.join(timeout)
+
+    def stats(self) -> dict:
+        return {
+            "pending": self._queue.qsize(),
+            "delivered": self.delivered,
+            "failed": self.failed,
+            "dropped": self.dropped
+        }
+
+
+def get_callback_sink(url: Optional[str] = RESULT_CALLBACK_URL) -> Optional[CallbackSink]:
+    """Callback sink for RESULT_CALLBACK_URL, or None if no callback is configured."""
+    return CallbackSink(url) if url else None
@@ -1,3 +1,3 @@
-from .rq_client import RQClient, rq_client
+from .rq_client import QUEUE_NAMES, RQClient, rq_client
 
-__all__ = ["RQClient", "rq_client"]
+__all__ = ["QUEUE_NAMES", "RQClient", "rq_client"]
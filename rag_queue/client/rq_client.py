@@ -3,7 +3,25 @@ RQ Client for enqueuing jobs to the Redis queue.
 """
 from redis import Redis
 from rq import Queue
+from rq.job import Job, JobStatus
+from typing import List, Optional, Tuple
 import uuid
+import os
+
+from singleflight import claim, claim_many
+
+# Referenced by path so enqueuing never imports the worker (and its models)
+PROCESS_QUERY = "queues.worker.process_query"
+
+# Workers take batch jobs only when no interactive job is waiting
+QUEUE_NAMES = {
+    "interactive": "rag_queries",
+    "batch": "rag_queries_batch"
+}
+# Running total of jobs ever enqueued per queue, for drain-rate estimates
+ENQUEUED_KEY = "rag:enqueued:{}"
+# How long a coalescing key may outlive a job that never released it
+COALESCE_TTL = int(os.getenv("COALESCE_TTL", "300"))
 
 
 class RQClient:
@@ -18,32 +36,101 @@ class RQClient:
             port: Redis/Valkey port
         """
         self.redis_conn = Redis(host=host, port=port)
-        self.queue = Queue("rag_queries", connection=self.redis_conn)
+        self.queues = {
+            priority: Queue(name, connection=self.redis_conn)
+            for priority, name in QUEUE_NAMES.items()
+        }
+        self.queue = self.queues["interactive"]
     
-    def enqueue_query(self, query: str) -> str:
+    def enqueue_query(self, query: str, priority: str = "interactive", coalesce_key: Optional[str] = None) -> str:
         """
         Enqueue a query for processing.
         
         Args:
             query: The user's question/message
+            priority: "interactive" or "batch"
+            coalesce_key: If given (see singleflight.coalesce_key), a job
+                already in flight for the same key is reused instead
             
         Returns:
             str: The job ID for tracking
         """
         job_id = str(uuid.uuid4())
+        queue = self.queues[priority]
         
-        # Import here to avoid circular imports
-        from queues.worker import process_query
+        if coalesce_key:
+            leader = claim(self.redis_conn, coalesce_key, job_id, COALESCE_TTL)
+            if leader:
+                return leader
         
-        job = self.queue.enqueue(
-            process_query,
-            job_id,
-            query,
-            job_id=job_id
-        )
+        with self.redis_conn.pipeline() as pipe:
+            queue.enqueue_call(
+                PROCESS_QUERY,
+                args=(job_id, query, coalesce_key),
+                job_id=job_id,
+                pipeline=pipe
+            )
+            pipe.incr(ENQUEUED_KEY.format(queue.name))
+            pipe.execute()
         
         return job_id
     
+    def enqueue_many(
+        self,
+        queries: List[str],
+        priority: str = "batch",
+        coalesce_keys: Optional[List[str]] = None
+    ) -> List[str]:
+        """
+        Enqueue many queries in a single Redis round trip (two more when coalescing).
+        
+        Args:
+            queries: The user's questions/messages
+            priority: "interactive" or "batch"
+            coalesce_keys: Per-query keys (see singleflight.coalesce_key);
+                queries whose key is already in flight, in Redis or earlier in
+                this batch, reuse that job instead of enqueuing a new one
+            
+        Returns:
+            List[str]: The job IDs, in the same order as the queries
+        """
+        job_ids = [str(uuid.uuid4()) for _ in queries]
+        queue = self.queues[priority]
+        keys = coalesce_keys or [None] * len(queries)
+        
+        new_jobs = list(zip(job_ids, queries, keys))
+        if coalesce_keys:
+            leaders = claim_many(self.redis_conn, coalesce_keys, job_ids, COALESCE_TTL)
+            new_jobs = [job for job, leader in zip(new_jobs, leaders) if leader is None]
+            job_ids = [leader or job_id for job_id, leader in zip(job_ids, leaders)]
+        
+        with self.redis_conn.pipeline() as pipe:
+            queue.enqueue_many(
+                [
+                    Queue.prepare_data(PROCESS_QUERY, (job_id, query, key), job_id=job_id)
+                    for job_id, query, key in new_jobs
+                ],
+                pipeline=pipe
+            )
+            pipe.incrby(ENQUEUED_KEY.format(queue.name), len(new_jobs))
+            pipe.execute()
+        
+        return job_ids
+    
+    def queue_stats(self, priority: str) -> Tuple[int, int]:
+        """
+        Depth of a queue and how many jobs have left it, in one round trip.
+        
+        Returns:
+            (jobs waiting, running total of jobs dequeued)
+        """
+        queue = self.queues[priority]
+        with self.redis_conn.pipeline() as pipe:
+            pipe.llen(queue.key)
+            pipe.get(ENQUEUED_KEY.format(queue.name))
+            depth, enqueued = pipe.execute()
+        return depth, int(enqueued or 0) - depth
+    
     def get_job_status(self, job_id: str) -> dict:
         """
         Get the status of a job.
@@ -54,21 +141,40 @@ class RQClient:
         Returns:
             dict: Job status information
         """
-        from rq.job import Job
-        
         try:
             job = Job.fetch(job_id, connection=self.redis_conn)
-            return {
-                "job_id": job_id,
-                "status": job.get_status(),
-                "result": job.result if job.is_finished else None
-            }
+            return self._job_status(job_id, job)
         except Exception:
+            return self._job_status(job_id, None)
+    
+    def get_jobs_status(self, job_ids: List[str]) -> List[dict]:
+        """
+        Get the status of many jobs in a single Redis round trip (plus one per
+        finished job, to read its return value).
+        
+        Args:
+            job_ids: The job IDs to check
+            
+        Returns:
+            List[dict]: Job status information, in the same order as job_ids
+        """
+        jobs = Job.fetch_many(job_ids, connection=self.redis_conn)
+        return [self._job_status(job_id, job) for job_id, job in zip(job_ids, jobs)]
+    
+    @staticmethod
+    def _job_status(job_id: str, job) -> dict:
+        if job is None:
             return {
                 "job_id": job_id,
                 "status": "not_found",
                 "result": None
             }
+        status = job.get_status(refresh=False)
+        return {
+            "job_id": job_id,
+            "status": status,
+            "result": job.return_value() if status == JobStatus.FINISHED else None
+        }
 
 
 # Singleton instance
@@ -0,0 +1,72 @@
+"""
+Prometheus metrics for the RAG service.
+
+The same metric families are recorded by the API server (scraped at /metrics)
+and by the warm RQ worker pool (pushed to a Prometheus Pushgateway every stats
+interval, see push()), labelled with the component that recorded them. Plain
+`rq worker` processes record each job in a throwaway forked work-horse, so run
+workers through queues.pool to collect their metrics.
+
+- rag_stage_seconds{component, stage}      latency of embedding, cache_lookup,
+                                           retrieval, prompt and generation
+- rag_queue_wait_seconds{component}        time from enqueue to processing
+- rag_jobs_in_flight{component}            jobs currently queued or running
+- rag_jobs_total{component, outcome}       completed / cached / failed / cancelled
+- rag_llm_tokens_total{component, kind}    prompt and completion tokens
+- rag_errors_total{component, error}       failures by exception type
+"""
+import os
+import socket
+import time
+from contextlib import contextmanager
+
+from prometheus_client import REGISTRY, Counter, Gauge, Histogram, pushadd_to_gateway
+
+PUSHGATEWAY_URL = os.getenv("PUSHGATEWAY_URL")
+
+# Up to the LLM timeout: embedding and retrieval land in the low buckets, generation in the high ones
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60, 120)
+
+STAGE_SECONDS = Histogram(
+    "rag_stage_seconds", "Latency of each query processing stage",
+    ["component", "stage"], buckets=LATENCY_BUCKETS
+)
+QUEUE_WAIT_SECONDS = Histogram(
+    "rag_queue_wait_seconds", "Time a job waited before processing started",
+    ["component"], buckets=LATENCY_BUCKETS
+)
+JOBS_IN_FLIGHT = Gauge("rag_jobs_in_flight", "Jobs currently queued or running", ["component"])
+JOBS = Counter("rag_jobs_total", "Finished jobs by outcome", ["component", "outcome"])
+LLM_TOKENS = Counter("rag_llm_tokens_total", "LLM tokens by kind", ["component", "kind"])
+ERRORS = Counter("rag_errors_total", "Failed jobs by exception type", ["component", "error"])
+
+
+@contextmanager
+def timed(component: str, stage: str):
+    """Record the duration of a block as one observation of a stage."""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        STAGE_SECONDS.labels(component, stage).observe(time.perf_counter() - started)
+
+
+def push(job: str = "rag_worker"):
+    """
+    Push this process's metrics to the Pushgateway, if PUSHGATEWAY_URL is set.
+
+    Each process pushes under its own instance label, so workers do not
+    overwrite each other.
+    """
+    if not PUSHGATEWAY_URL:
+        return
+    try:
+        pushadd_to_gateway(
+            PUSHGATEWAY_URL,
+            job=job,
+            grouping_key={"instance": f"{socket.gethostname()}-{os.getpid()}"},
+            registry=REGISTRY,
+            timeout=2
+        )
+    except OSError as e:
+        print(f"⚠️ Failed to push metrics: {e}")
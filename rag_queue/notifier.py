@@ -0,0 +1,96 @@
+"""
+Push notification of job results.
+
+Instead of polling /status, clients long-poll (`GET /status/{job_id}?wait=30`)
+or hold a WebSocket, and the server wakes them as soon as the job's result is
+written. Results written by this process wake waiters directly through
+notify(). Results written elsewhere (other uvicorn workers, the RQ worker) are
+announced by RedisResultsStore on the RESULT_CHANNEL pub/sub channel, which
+listen() relays into notify().
+"""
+import asyncio
+from typing import Awaitable, Callable, Dict, Set
+
+from redis import asyncio as aioredis
+from redis.exceptions import RedisError
+
+from results import RESULT_CHANNEL
+
+TERMINAL_STATUSES = {"completed", "failed", "cancelled"}
+
+
+def is_terminal(result) -> bool:
+    """Whether a stored result is final."""
+    return result is not None and result.get("status") in TERMINAL_STATUSES
+
+
+class CompletionNotifier:
+    """Wakes coroutines waiting on a job when its result changes."""
+
+    def __init__(self):
+        self._waiters: Dict[str, Set[asyncio.Event]] = {}
+        self.notifications = 0
+
+    def notify(self, job_id: str):
+        """Wake everything waiting on a job. Must be called on the event loop."""
+        self.notifications += 1
+        for event in self._waiters.get(job_id, ()):
+            event.set()
+
+    async def wait(self, job_id: str, timeout: float, done: Callable[[], Awaitable[bool]]) -> bool:
+        """
+        Wait until `done()` holds for a job, re-checking it on every notification.
+
+        Args:
+            job_id: Job to watch
+            timeout: Maximum seconds to wait
+            done: Async condition to wait for, e.g. the job's result being final
+
+        Returns:
+            bool: Whether the condition holds (False on timeout)
+        """
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+        event = asyncio.Event()
+        # Register before checking, so a result written in between is not missed
+        self._waiters.setdefault(job_id, set()).add(event)
+        try:
+            while not await done():
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    return False
+                try:
+                    await asyncio.wait_for(event.wait(), remaining)
+                except asyncio.TimeoutError:
+                    return await done()
+                event.clear()
+            return True
+        finally:
+            waiters = self._waiters.get(job_id)
+            if waiters is not None:
+                waiters.discard(event)
+                if not waiters:
+                    del self._waiters[job_id]
+
+    async def listen(self, redis: aioredis.Redis):
+        """Relay result notifications published by other processes, resubscribing after errors."""
+        delay = 1
+        while True:
+            try:
+                async with redis.pubsub() as pubsub:
+                    await pubsub.subscribe(RESULT_CHANNEL)
+                    delay = 1
+                    async for message in pubsub.listen():
+                        if message["type"] == "message":
+                            self.notify(message["data"].decode())
+            except RedisError as e:
+                print(f"⚠️ Result notifications lost ({e}), retrying in {delay}s")
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, 30)
+
+    def stats(self) -> dict:
+        return {
+            "waiting_jobs": len(self._waiters),
+            "waiters": sum(len(waiters) for waiters in self._waiters.values()),
+            "notifications": self.notifications
+        }
@@ -1,3 +1,3 @@
-from .worker import process_query
+from .worker import process_query, warm_up
 
-__all__ = ["process_query"]
+__all__ = ["process_query", "warm_up"]
@@ -0,0 +1,165 @@
+"""
+Warm worker pool for RAG queries.
+
+A default `rq worker` forks a fresh work-horse for every job, and the
+work-horse imports queues.worker again, so the embedding model, vector store
+connection and inference client are rebuilt per job. This entry point imports
+them once, warms them up, and then runs several RQ workers as threads of the
+same long-lived process. Jobs execute in-thread (no fork) and share the loaded
+model and pooled connections.
+
+Each worker's jobs/sec is printed periodically and written to the
+`rag:worker_stats` Redis hash, along with the model warm-up time.
+
+Usage (from the rag_queue directory):
+    python -m queues.pool --concurrency 8
+"""
+import argparse
+import json
+import os
+import signal
+import sys
+import threading
+import time
+from pathlib import Path
+
+from redis import Redis
+from rq import Queue, SimpleWorker
+from rq.timeouts import TimerDeathPenalty
+
+# Make the rag_queue modules importable
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+from client import QUEUE_NAMES
+from metrics import push
+from results import REDIS_URL
+
+WORKER_CONCURRENCY = int(os.getenv("WORKER_CONCURRENCY", "4"))
+STATS_INTERVAL = float(os.getenv("WORKER_STATS_INTERVAL", "30"))
+STATS_KEY = "rag:worker_stats"
+
+
+class WarmWorker(SimpleWorker):
+    """
+    RQ worker that runs jobs in its own thread of a shared process.
+
+    Signals can only be handled by the main thread and SIGALRM-based job
+    timeouts only work there, so the pool owns signal handling and job timeouts
+    use a timer thread instead.
+    """
+
+    death_penalty_class = TimerDeathPenalty
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.started_at = time.time()
+        self.jobs_done = 0
+        self.jobs_failed = 0
+        self.busy_seconds = 0.0
+
+    def _install_signal_handlers(self):
+        pass
+
+    def perform_job(self, job, queue) -> bool:
+        started = time.perf_counter()
+        succeeded = False
+        try:
+            succeeded = super().perform_job(job, queue)
+            return succeeded
+        finally:
+            self.busy_seconds += time.perf_counter() - started
+            if succeeded:
+                self.jobs_done += 1
+            else:
+                self.jobs_failed += 1
+
+    def stats(self) -> dict:
+        """Throughput counters for this worker."""
+        uptime = time.time() - self.started_at
+        jobs = self.jobs_done + self.jobs_failed
+        return {
+            "jobs": jobs,
+            "failed": self.jobs_failed,
+            "jobs_per_sec": jobs / uptime if uptime else 0.0,
+            "avg_job_seconds": self.busy_seconds / jobs if jobs else 0.0,
+            "utilization": self.busy_seconds / uptime if uptime else 0.0
+        }
+
+
+def report(redis: Redis, workers: list, warm_up_timings: dict):
+    """Print per-worker stats, publish them to Redis and push metrics to the Pushgateway."""
+    stats = {worker.name: {**worker.stats(), "warm_up_seconds": warm_up_timings} for worker in workers}
+    total = sum(s["jobs_per_sec"] for s in stats.values())
+    print(f"📊 {sum(s['jobs'] for s in stats.values())} jobs, {total:.2f} jobs/sec across {len(workers)} workers")
+    for name, s in stats.items():
+        print(f"   {name}: {s['jobs']} jobs, {s['jobs_per_sec']:.2f} jobs/sec, {s['utilization']:.0%} busy")
+
+    pipe = redis.pipeline(transaction=False)
+    pipe.hset(STATS_KEY, mapping={name: json.dumps(s) for name, s in stats.items()})
+    pipe.expire(STATS_KEY, int(STATS_INTERVAL * 3))
+    pipe.execute()
+
+    # Worker threads share one metrics registry, pushed to the Pushgateway here
+    push()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Warm, multi-threaded RQ worker pool")
+    parser.add_argument("--concurrency", type=int, default=WORKER_CONCURRENCY)
+    parser.add_argument("--burst", action="store_true", help="exit once the queue is empty")
+    args = parser.parse_args()
+
+    # Step 1: Load models and open connections once, for every worker thread
+    started = time.perf_counter()
+    from queues.worker import callback_sink, warm_up
+    import_seconds = time.perf_counter() - started
+    warm_up_timings = {"import": import_seconds, **warm_up()}
+    print("🔥 Warm-up: " + ", ".join(f"{step} {seconds:.2f}s" for step, seconds in warm_up_timings.items()))
+
+    # Step 2: Start the workers
+    redis = Redis.from_url(REDIS_URL)
+    # Queues in priority order: batch jobs only run when no interactive job waits
+    queues = [Queue(QUEUE_NAMES[priority], connection=redis) for priority in ("interactive", "batch")]
+    workers = [
+        WarmWorker(queues, connection=redis, name=f"warm-{os.getpid()}-{i}")
+        for i in range(args.concurrency)
+    ]
+    threads = [
+        threading.Thread(target=worker.work, kwargs={"burst": args.burst}, name=worker.name, daemon=True)
+        for worker in workers
+    ]
+    for thread in threads:
+        thread.start()
+    print(f"🚀 {len(workers)} workers listening on {', '.join(queue.name for queue in queues)}")
+
+    # Step 3: Stop the workers after their current job on SIGINT/SIGTERM
+    stopping = threading.Event()
+
+    def stop(signum, frame):
+        print("🛑 Stopping after current jobs...")
+        for worker in workers:
+            worker._stop_requested = True
+        stopping.set()
+
+    signal.signal(signal.SIGINT, stop)
+    signal.signal(signal.SIGTERM, stop)
+
+    # Step 4: Report stats until every worker has exited
+    next_report = time.monotonic() + STATS_INTERVAL
+    while any(thread.is_alive() for thread in threads):
+        if stopping.wait(1.0):
+            # Idle workers block on the queue; only wait for the busy ones
+            for worker, thread in zip(workers, threads):
+                if worker.get_current_job_id():
+                    thread.join()
+            break
+        if time.monotonic() >= next_report:
+            report(redis, workers, warm_up_timings)
+            next_report += STATS_INTERVAL
+
+    report(redis, workers, warm_up_timings)
+    if callback_sink is not None:
+        callback_sink.flush(STATS_INTERVAL)
+
+
+if __name__ == "__main__":
+    main()
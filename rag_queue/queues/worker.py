@@ -1,73 +1,137 @@
 """
 Queue Worker for RAG Query Processing
 
-This worker processes messages from the queue and calls the /result endpoint
-with the generated response.
+This worker processes messages from the queue, writes each job's status and
+result to the shared Redis results store (which wakes clients waiting on the
+server's /status?wait= and /ws endpoints) and, if RESULT_CALLBACK_URL is set,
+POSTs it to that URL in the background.
 """
-import requests
-from langchain_huggingface import HuggingFaceEmbeddings
-from langchain_qdrant import QdrantVectorStore
-from qdrant_client import QdrantClient
-from huggingface_hub import InferenceClient
+import sys
+import threading
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Optional
+from rq import get_current_job
 from dotenv import load_dotenv
-import os
+
+# Make the shared `common` package and rag_queue modules importable
+sys.path.append(str(Path(__file__).resolve().parents[2]))
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+from common import (
+    CollectionVersions,
+    get_embedding_model,
+    get_llm_router,
+    get_token_counter,
+    get_vector_store,
+    pack_context,
+    search_params
+)
+from callbacks import CALLBACK_TIMEOUT, get_callback_sink
+from metrics import (
+    ERRORS,
+    JOBS,
+    JOBS_IN_FLIGHT,
+    LLM_TOKENS,
+    QUEUE_WAIT_SECONDS,
+    STAGE_SECONDS,
+    timed
+)
+from results import get_results_store
+from semantic_cache import SemanticCache
+from singleflight import release
 
 load_dotenv()
 
-# Configure HuggingFace Inference API
-hf_client = InferenceClient(
-    model="mistralai/Mistral-7B-Instruct-v0.3",
-    token=os.getenv("HUGGINGFACE_TOKEN")
-)
+COLLECTION_NAME = "rag"
+COMPONENT = "worker"
+# Oversample-and-rescore settings for quantized collections (None if not quantized)
+SEARCH_PARAMS = search_params()
 
-# Initialize the embedding model
-embedding_model = HuggingFaceEmbeddings(
-    model_name="sentence-transformers/all-MiniLM-L6-v2"
-)
+LLM_MODEL = "mistralai/Mistral-7B-Instruct-v0.3"
 
-# Connect to Qdrant vector store
-client = QdrantClient(url="http://localhost:6333")
-vector_store = QdrantVectorStore(
-    client=client,
-    collection_name="rag",
-    embedding=embedding_model
-)
+# Answers come from LLM_MODEL, hedged onto a backup provider when slower than
+# its recent p95 (LLM_PROVIDERS overrides the list)
+llm = get_llm_router(f"hf:{LLM_MODEL},hf:Qwen/Qwen2.5-72B-Instruct")
 
-# Create a retriever
-retriever = vector_store.as_retriever(
-    search_type="similarity",
-    search_kwargs={"k": 5}
-)
+# Context is packed to a token budget measured with the LLM's own tokenizer
+count_tokens = get_token_counter(LLM_MODEL)
 
-# FastAPI server URL for callback
-FASTAPI_SERVER_URL = os.getenv("FASTAPI_SERVER_URL", "http://localhost:8000")
+# Initialize the embedding model (shared disk + LRU cache)
+embedding_model = get_embedding_model()
 
+# Connect to Qdrant vector store (or the local store with VECTOR_BACKEND=local)
+vector_store = get_vector_store(COLLECTION_NAME, embedding_model)
 
-def process_query(job_id: str, query: str) -> dict:
+# Answers to recent (paraphrased) questions, invalidated when the collection is re-indexed
+answer_cache = SemanticCache()
+collection_versions = CollectionVersions()
+
+# Results are shared with the API server through Redis, whatever RESULTS_BACKEND says
+results_store = get_results_store("redis")
+
+# Optional pooled, retrying HTTP delivery to an external consumer
+callback_sink = get_callback_sink()
+
+
+def publish_result(job_id: str, result: dict):
+    """Store a job's result (notifying waiting clients) and hand it to the callback sink."""
+    results_store.set(job_id, result)
+    if callback_sink is None:
+        return
+    callback_sink.send(result)
+    # A job on the main thread may be running in a forked work-horse that exits
+    # right after it, taking the delivery threads with it
+    if threading.current_thread() is threading.main_thread():
+        callback_sink.flush(CALLBACK_TIMEOUT)
+
+
+def warm_up() -> dict:
     """
-    Process a query from the queue.
-    
-    This function:
-    1. Retrieves relevant documents from the vector store
-    2. Generates a response using Gemini LLM
-    3. Calls the /result endpoint with the response
-    
-    Args:
-        job_id: Unique identifier for this job
-        query: The user's question/message
-        
+    Load the embedding model and open the vector store connection before the
+    first job, so no job pays for them.
+
     Returns:
-        dict: The result containing job_id and response
+        dict: Seconds spent on each step
     """
-    try:
-        # Step 1: Retrieve relevant documents
-        docs = retriever.invoke(query)
-        
-        # Step 2: Build context from retrieved documents
-        context = "\n\n---\n\n".join([doc.page_content for doc in docs])
-        
-        # Step 3: Create prompt with context
-        prompt = f"""You are a helpful assistant. Answer the user's question based on the provided context.
+    timings = {}
+
+    started = time.perf_counter()
+    vector = embedding_model.base.embed_query("warm up")
+    timings["embedding_model"] = time.perf_counter() - started
+
+    started = time.perf_counter()
+    vector_store.similarity_search_by_vector(vector, k=1, search_params=SEARCH_PARAMS)
+    timings["vector_store"] = time.perf_counter() - started
+
+    return timings
+
+
+def observe_queue_wait():
+    """Record how long the current RQ job waited in its queue."""
+    job = get_current_job()
+    if job is None or job.enqueued_at is None:
+        return
+    enqueued_at = job.enqueued_at
+    if enqueued_at.tzinfo is None:
+        enqueued_at = enqueued_at.replace(tzinfo=timezone.utc)
+    waited = (datetime.now(timezone.utc) - enqueued_at).total_seconds()
+    QUEUE_WAIT_SECONDS.labels(COMPONENT).observe(max(0.0, waited))
+
+
+def answer_query(job_id: str, query: str, query_vector: list, version: int) -> dict:
+    """Retrieve context and generate a fresh answer, caching it for similar queries."""
+    # Step 2: Retrieve relevant documents
+    with timed(COMPONENT, "retrieval"):
+        docs = vector_store.similarity_search_by_vector(query_vector, k=5, search_params=SEARCH_PARAMS)
+    
+    # Step 3: Build context from retrieved documents, without overlapping
+    # text and within the token budget
+    prompt_started = time.perf_counter()
+    context = pack_context(docs, count_tokens).text
+    
+    # Step 4: Create prompt with context
+    prompt = f"""You are a helpful assistant. Answer the user's question based on the provided context.
 If the context doesn't contain relevant information, say so.
 
 Context:
@@ -76,30 +140,77 @@ Context:
 Question: {query}
 
 Answer:"""
+    STAGE_SECONDS.labels(COMPONENT, "prompt").observe(time.perf_counter() - prompt_started)
 
-        # Step 4: Generate response using HuggingFace
-        response = hf_client.text_generation(
-            prompt,
-            max_new_tokens=512,
+    # Step 5: Generate response through the LLM router
+    with timed(COMPONENT, "generation"):
+        completion = llm.complete_sync(
+            [{"role": "user", "content": prompt}],
+            max_tokens=512,
             temperature=0.7
         )
+    response = completion.text
+    LLM_TOKENS.labels(COMPONENT, "prompt").inc(completion.prompt_tokens or count_tokens(prompt))
+    LLM_TOKENS.labels(COMPONENT, "completion").inc(completion.completion_tokens or count_tokens(response))
+    answer_cache.store(query_vector, query, response, version)
+    
+    return {
+        "job_id": job_id,
+        "query": query,
+        "response": response,
+        "status": "completed",
+        "cache_hit": False
+    }
+
+
+def process_query(job_id: str, query: str, coalesce_key: Optional[str] = None) -> dict:
+    """
+    Process a query from the queue.
+    
+    This function:
+    1. Returns a cached answer if a similar query was answered recently
+    2. Retrieves relevant documents from the vector store
+    3. Generates a response using the HuggingFace LLM
+    4. Publishes the result to the shared results store (and callback URL)
+    
+    Args:
+        job_id: Unique identifier for this job
+        query: The user's question/message
+        coalesce_key: Singleflight key claimed for this job at enqueue time,
+            released once the result is published
         
-        result = {
-            "job_id": job_id,
-            "query": query,
-            "response": response,
-            "status": "completed"
-        }
+    Returns:
+        dict: The result containing job_id and response
+    """
+    observe_queue_wait()
+    JOBS_IN_FLIGHT.labels(COMPONENT).inc()
+    try:
+        results_store.set(job_id, {"job_id": job_id, "query": query, "status": "processing"})
+
+        # Step 1: Embed once and check the semantic answer cache
+        with timed(COMPONENT, "embedding"):
+            query_vector = embedding_model.embed_query(query)
+        with timed(COMPONENT, "cache_lookup"):
+            version = collection_versions.get(COLLECTION_NAME)
+            cached = answer_cache.lookup(query_vector, version)
+        if cached:
+            entry, similarity = cached
+            result = {
+                "job_id": job_id,
+                "query": query,
+                "response": entry.response,
+                "status": "completed",
+                "cache_hit": True,
+                "cache_similarity": round(similarity, 4),
+                "cached_query": entry.query
+            }
+            JOBS.labels(COMPONENT, "cached").inc()
+        else:
+            result = answer_query(job_id, query, query_vector, version)
+            JOBS.labels(COMPONENT, "completed").inc()
         
-        # Step 5: Call the /result endpoint with the response
-        try:
-            requests.post(
-                f"{FASTAPI_SERVER_URL}/result",
-                json=result,
-                timeout=10
-            )
-        except requests.RequestException as e:
-            print(f"Failed to call /result endpoint: {e}")
+        # Step 6: Publish the result
+        publish_result(job_id, result)
         
         return result
         
@@ -110,15 +221,22 @@ Answer:"""
             "error": str(e),
             "status": "failed"
         }
+        JOBS.labels(COMPONENT, "failed").inc()
+        ERRORS.labels(COMPONENT, type(e).__name__).inc()
         
-        # Notify failure to /result endpoint
+        # Record the failure
         try:
-            requests.post(
-                f"{FASTAPI_SERVER_URL}/result",
-                json=error_result,
-                timeout=10
-            )
-        except requests.RequestException:
-            pass
+            publish_result(job_id, error_result)
+        except Exception as publish_error:
+            print(f"Failed to publish result: {publish_error}")
             
-        return error_result
\ No newline at end of file
+        return error_result
+
+    finally:
+        JOBS_IN_FLIGHT.labels(COMPONENT).dec()
+        # Copies of this query enqueued from now on start a fresh job
+        if coalesce_key:
+            try:
+                release(results_store.redis, coalesce_key, job_id)
+            except Exception as release_error:
+                print(f"Failed to release coalescing key: {release_error}")
\ No newline at end of file
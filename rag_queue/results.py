@@ -0,0 +1,367 @@
+"""
+Bounded job results store.
+
+Job results used to live in a plain dict that grew for the life of the process
+and was invisible to other uvicorn workers. get_results_store() returns one of
+two backends, chosen by RESULTS_BACKEND:
+
+- memory: an OrderedDict in LRU order with O(1) get/set. Entries expire after
+  RESULTS_TTL seconds and the least recently used entry is evicted beyond
+  RESULTS_MAX_ENTRIES. A separate index sorted by creation time serves the
+  listing. Per process.
+- redis: one JSON value per job written with SET ... EX (Redis expires it), plus
+  a sorted set of job IDs by creation time for paging and eviction. Writes are
+  pipelined into a single round trip. Shared by every worker and node. Every
+  write is announced on the RESULT_CHANNEL pub/sub channel (see notifier.py).
+
+Async code (the FastAPI server) uses the a-prefixed methods: the Redis backend
+serves them from a redis.asyncio connection, so a round trip never blocks the
+event loop; the memory backend answers them directly.
+
+Both list results newest first, a page at a time, with an opaque cursor.
+"""
+import bisect
+import json
+import os
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from typing import List, Optional, Tuple
+
+from redis import Redis
+from redis import asyncio as aioredis
+
+RESULTS_BACKEND = os.getenv("RESULTS_BACKEND", "memory")
+RESULTS_TTL = int(os.getenv("RESULTS_TTL", "3600"))
+RESULTS_MAX_ENTRIES = int(os.getenv("RESULTS_MAX_ENTRIES", "10000"))
+REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379/0")
+
+RESULT_KEY = "rag:result:{}"
+RESULT_INDEX_KEY = "rag:results"
+RESULT_CHANNEL = "rag:results:updated"
+
+
+class ResultsStore(ABC):
+    """Job results keyed by job ID, with expiry and a size bound."""
+
+    @abstractmethod
+    def get(self, job_id: str) -> Optional[dict]:
+        """Result of a job, or None if unknown or expired."""
+
+    @abstractmethod
+    def set(self, job_id: str, result: dict):
+        """Create or replace a job's result."""
+
+    def get_many(self, job_ids: List[str]) -> List[Optional[dict]]:
+        """Results of many jobs, in order (None where unknown or expired)."""
+        return [self.get(job_id) for job_id in job_ids]
+
+    @abstractmethod
+    def list(self, cursor: Optional[str] = None, limit: int = 50) -> Tuple[List[dict], Optional[str]]:
+        """
+        One page of results, newest first.
+
+        Args:
+            cursor: `next_cursor` from the previous page (None for the first page)
+            limit: Maximum results in the page
+
+        Returns:
+            (results, next_cursor), next_cursor is None on the last page
+        """
+
+    def __contains__(self, job_id: str) -> bool:
+        return self.get(job_id) is not None
+
+    @abstractmethod
+    def stats(self) -> dict:
+        """Store size counters for monitoring."""
+
+    # Async variants, for use on an event loop. The defaults call the methods
+    # above, which is right for stores that never wait on I/O.
+
+    async def aget(self, job_id: str) -> Optional[dict]:
+        return self.get(job_id)
+
+    async def aset(self, job_id: str, result: dict):
+        self.set(job_id, result)
+
+    async def aget_many(self, job_ids: List[str]) -> List[Optional[dict]]:
+        return self.get_many(job_ids)
+
+    async def alist(self, cursor: Optional[str] = None, limit: int = 50) -> Tuple[List[dict], Optional[str]]:
+        return self.list(cursor, limit)
+
+    async def astats(self) -> dict:
+        return self.stats()
+
+    async def aclose(self):
+        """Close connections opened by the async methods."""
+
+
+class MemoryResultsStore(ResultsStore):
+    """In-process LRU + TTL results store."""
+
+    def __init__(self, ttl_seconds: float = RESULTS_TTL, max_entries: int = RESULTS_MAX_ENTRIES):
+        """
+        Initialize the store.
+
+        Args:
+            ttl_seconds: Lifetime of a result after its last write
+            max_entries: Capacity before LRU eviction
+        """
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.evicted = 0
+        # job_id -> (expires_at, created_at, result), in LRU order
+        self._entries: "OrderedDict[str, Tuple[float, float, dict]]" = OrderedDict()
+        # (created_at, job_id) of every entry, sorted: listing order, unaffected by reads
+        self._created: List[Tuple[float, str]] = []
+        self._lock = threading.Lock()
+
+    def get(self, job_id: str) -> Optional[dict]:
+        with self._lock:
+            item = self._entries.get(job_id)
+            if item is None:
+                return None
+            if item[0] <= time.time():
+                self._remove(job_id)
+                return None
+            self._entries.move_to_end(job_id)
+            return item[2]
+
+    def set(self, job_id: str, result: dict):
+        now = time.time()
+        with self._lock:
+            item = self._entries.get(job_id)
+            if item is not None:
+                created_at = item[1]  # keep the creation time, as the Redis index does
+            else:
+                created_at = now
+                bisect.insort(self._created, (created_at, job_id))
+            self._entries[job_id] = (now + self.ttl_seconds, created_at, result)
+            self._entries.move_to_end(job_id)
+
+            # Drop expired entries from the cold end, then enforce the size bound
+            while self._entries:
+                oldest_id, (expires_at, _, _) = next(iter(self._entries.items()))
+                if expires_at > now and len(self._entries) <= self.max_entries:
+                    break
+                self._remove(oldest_id)
+                self.evicted += 1
+
+    def _remove(self, job_id: str):
+        _, created_at, _ = self._entries.pop(job_id)
+        i = bisect.bisect_left(self._created, (created_at, job_id))
+        del self._created[i]
+
+    def list(self, cursor: Optional[str] = None, limit: int = 50) -> Tuple[List[dict], Optional[str]]:
+        # The cursor is (creation time, job ID) of the last result on the previous
+        # page, so reads and new results don't shift the pages
+        after = None
+        if cursor:
+            created_at, _, job_id = cursor.partition(":")
+            after = (float(created_at), job_id)
+        now = time.time()
+        page, last = [], None
+        with self._lock:
+            end = bisect.bisect_left(self._created, after) if after else len(self._created)
+            for i in range(end - 1, -1, -1):
+                key = self._created[i]
+                expires_at, _, result = self._entries[key[1]]
+                if expires_at <= now:
+                    continue
+                if len(page) == limit:
+                    return page, f"{last[0]!r}:{last[1]}"
+                page.append(result)
+                last = key
+        return page, None
+
+    def stats(self) -> dict:
+        return {
+            "backend": "memory",
+            "entries": len(self._entries),
+            "evicted": self.evicted,
+            "max_entries": self.max_entries,
+            "ttl_seconds": self.ttl_seconds
+        }
+
+
+class RedisResultsStore(ResultsStore):
+    """Results shared through Redis, expired by Redis itself."""
+
+    def __init__(
+        self,
+        redis: Redis,
+        ttl_seconds: int = RESULTS_TTL,
+        max_entries: int = RESULTS_MAX_ENTRIES,
+        async_redis: Optional[aioredis.Redis] = None
+    ):
+        """
+        Initialize the store.
+
+        Args:
+            redis: Redis/Valkey connection
+            ttl_seconds: Lifetime of a result after its last write
+            max_entries: Jobs kept in the index before the oldest are deleted
+            async_redis: Connection for the async methods (by default one to
+                REDIS_URL, opened on first use)
+        """
+        self.redis = redis
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self._async_redis = async_redis
+
+    @property
+    def async_redis(self) -> aioredis.Redis:
+        if self._async_redis is None:
+            self._async_redis = aioredis.Redis.from_url(REDIS_URL)
+        return self._async_redis
+
+    @staticmethod
+    def _decode(values) -> List[Optional[dict]]:
+        return [json.loads(value) if value is not None else None for value in values]
+
+    def _write(self, pipe, job_id: str, result: dict):
+        """Queue a result write on a pipeline; its second to last reply is the index size."""
+        now = time.time()
+        pipe.set(RESULT_KEY.format(job_id), json.dumps(result), ex=self.ttl_seconds)
+        pipe.zadd(RESULT_INDEX_KEY, {job_id: now}, nx=True)  # keep the creation time
+        pipe.zremrangebyscore(RESULT_INDEX_KEY, "-inf", now - self.ttl_seconds)
+        pipe.zcard(RESULT_INDEX_KEY)
+        pipe.publish(RESULT_CHANNEL, job_id)
+
+    # Listing: the cursor is (creation time, job ID) of the last job on the
+    # previous page, as in MemoryResultsStore. Jobs created at the same time are
+    # ordered by descending ID (ZREVRANGEBYSCORE's order for equal scores), so a
+    # page starts at the cursor's time, inclusive, after the cursor's job.
+
+    @staticmethod
+    def _parse_cursor(cursor: Optional[str]) -> Tuple[str, Optional[tuple]]:
+        """Upper score bound of the range and the (score, job ID) to skip through."""
+        if not cursor:
+            return "+inf", None
+        created_at, _, job_id = cursor.partition(":")
+        return created_at, (float(created_at), job_id)
+
+    @staticmethod
+    def _after(entries: list, after: Optional[tuple]) -> List[Tuple[str, float]]:
+        """Decoded (job ID, score) entries that come after the cursor."""
+        jobs = [(job.decode(), score) for job, score in entries]
+        if after is None:
+            return jobs
+        return [(job, score) for job, score in jobs if score < after[0] or job < after[1]]
+
+    @staticmethod
+    def _page(jobs: List[Tuple[str, float]], limit: int) -> Tuple[List[str], Optional[str]]:
+        """Job IDs of a page and the cursor of the next one."""
+        if len(jobs) <= limit:
+            return [job for job, _ in jobs], None
+        last_job, last_score = jobs[limit - 1]
+        return [job for job, _ in jobs[:limit]], f"{last_score!r}:{last_job}"
+
+    def get(self, job_id: str) -> Optional[dict]:
+        return self._decode([self.redis.get(RESULT_KEY.format(job_id))])[0]
+
+    def get_many(self, job_ids: List[str]) -> List[Optional[dict]]:
+        if not job_ids:
+            return []
+        return self._decode(self.redis.mget([RESULT_KEY.format(job_id) for job_id in job_ids]))
+
+    def set(self, job_id: str, result: dict):
+        pipe = self.redis.pipeline(transaction=False)
+        self._write(pipe, job_id, result)
+        size = pipe.execute()[-2]
+
+        if size > self.max_entries:
+            oldest = [job for job, _ in self.redis.zpopmin(RESULT_INDEX_KEY, size - self.max_entries)]
+            if oldest:
+                self.redis.delete(*[RESULT_KEY.format(job.decode()) for job in oldest])
+
+    def list(self, cursor: Optional[str] = None, limit: int = 50) -> Tuple[List[dict], Optional[str]]:
+        upper, after = self._parse_cursor(cursor)
+        jobs, start = [], 0
+        # One more than the page, to know whether there is a next one
+        while len(jobs) <= limit:
+            entries = self.redis.zrevrangebyscore(
+                RESULT_INDEX_KEY, upper, "-inf", start=start, num=limit + 1, withscores=True
+            )
+            jobs += self._after(entries, after)
+            if len(entries) <= limit:
+                break
+            start += len(entries)
+        page, next_cursor = self._page(jobs, limit)
+        if not page:
+            return [], None
+
+        values = self.redis.mget([RESULT_KEY.format(job) for job in page])
+        return [result for result in self._decode(values) if result is not None], next_cursor
+
+    def stats(self) -> dict:
+        return self._stats(self.redis.zcard(RESULT_INDEX_KEY))
+
+    def _stats(self, entries: int) -> dict:
+        return {
+            "backend": "redis",
+            "entries": entries,
+            "max_entries": self.max_entries,
+            "ttl_seconds": self.ttl_seconds
+        }
+
+    async def aget(self, job_id: str) -> Optional[dict]:
+        return self._decode([await self.async_redis.get(RESULT_KEY.format(job_id))])[0]
+
+    async def aget_many(self, job_ids: List[str]) -> List[Optional[dict]]:
+        if not job_ids:
+            return []
+        return self._decode(await self.async_redis.mget([RESULT_KEY.format(job_id) for job_id in job_ids]))
+
+    async def aset(self, job_id: str, result: dict):
+        redis = self.async_redis
+        pipe = redis.pipeline(transaction=False)
+        self._write(pipe, job_id, result)
+        size = (await pipe.execute())[-2]
+
+        if size > self.max_entries:
+            oldest = [job for job, _ in await redis.zpopmin(RESULT_INDEX_KEY, size - self.max_entries)]
+            if oldest:
+                await redis.delete(*[RESULT_KEY.format(job.decode()) for job in oldest])
+
+    async def alist(self, cursor: Optional[str] = None, limit: int = 50) -> Tuple[List[dict], Optional[str]]:
+        upper, after = self._parse_cursor(cursor)
+        jobs, start = [], 0
+        while len(jobs) <= limit:
+            entries = await self.async_redis.zrevrangebyscore(
+                RESULT_INDEX_KEY, upper, "-inf", start=start, num=limit + 1, withscores=True
+            )
+            jobs += self._after(entries, after)
+            if len(entries) <= limit:
+                break
+            start += len(entries)
+        page, next_cursor = self._page(jobs, limit)
+        if not page:
+            return [], None
+
+        values = await self.async_redis.mget([RESULT_KEY.format(job) for job in page])
+        return [result for result in self._decode(values) if result is not None], next_cursor
+
+    async def astats(self) -> dict:
+        return self._stats(await self.async_redis.zcard(RESULT_INDEX_KEY))
+
+    async def aclose(self):
+        if self._async_redis is not None:
+            await self._async_redis.aclose()
+            self._async_redis = None
+
+
+def get_results_store(backend: str = RESULTS_BACKEND, redis: Optional[Redis] = None) -> ResultsStore:
+    """
+    Results store for the configured backend.
+
+    Args:
+        backend: "memory" or "redis"
+        redis: Redis connection to reuse (redis backend only)
+    """
+    if backend == "redis":
+        return RedisResultsStore(redis or Redis.from_url(REDIS_URL))
+    return MemoryResultsStore()
@@ -0,0 +1,148 @@
+"""
+Semantic answer cache for RAG queries.
+
+Paraphrases of a recently answered question reuse the cached answer instead of
+retrieving and calling the LLM again. Query embeddings are kept normalized in a
+preallocated NumPy matrix, so a lookup is one matrix-vector product over all
+live entries. Entries expire after a TTL, the least recently used entry is
+evicted when the cache is full, and every entry is tagged with the collection
+version it was answered against so re-indexing invalidates it.
+
+The cache is per process. For the RQ worker it only pays off with a long-lived
+worker process (e.g. `rq worker --worker-class rq.SimpleWorker`), since the
+default worker forks a fresh work-horse for every job.
+"""
+import os
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import List, Optional, Tuple
+
+import numpy as np
+
+SIMILARITY_THRESHOLD = float(os.getenv("SEMANTIC_CACHE_THRESHOLD", "0.92"))
+TTL_SECONDS = float(os.getenv("SEMANTIC_CACHE_TTL", "3600"))
+MAX_ENTRIES = int(os.getenv("SEMANTIC_CACHE_MAX_ENTRIES", "1000"))
+
+
+@dataclass
+class CacheEntry:
+    query: str
+    response: str
+    version: int
+    expires_at: float
+
+
+class SemanticCache:
+    """Answer cache keyed on query-embedding cosine similarity."""
+
+    def __init__(
+        self,
+        threshold: float = SIMILARITY_THRESHOLD,
+        ttl_seconds: float = TTL_SECONDS,
+        max_entries: int = MAX_ENTRIES
+    ):
+        """
+        Initialize the cache.
+
+        Args:
+            threshold: Minimum cosine similarity for a cached answer to be reused
+            ttl_seconds: Lifetime of an entry
+            max_entries: Capacity before LRU eviction
+        """
+        self.threshold = threshold
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+
+        self._vectors: Optional[np.ndarray] = None        # (max_entries, dim), allocated lazily
+        self._live = np.zeros(max_entries, dtype=bool)
+        self._versions = np.zeros(max_entries, dtype=np.int64)
+        self._expires = np.zeros(max_entries, dtype=np.float64)
+        self._entries: "OrderedDict[int, CacheEntry]" = OrderedDict()  # slot -> entry, LRU order
+        self._free: List[int] = list(range(max_entries - 1, -1, -1))
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _normalize(vector) -> np.ndarray:
+        vector = np.asarray(vector, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def _evict(self, slot: int):
+        """Free a slot. Caller holds the lock."""
+        self._live[slot] = False
+        del self._entries[slot]
+        self._free.append(slot)
+
+    def lookup(self, vector, version: int) -> Optional[Tuple[CacheEntry, float]]:
+        """
+        Find a cached answer for a query embedding.
+
+        Args:
+            vector: Query embedding
+            version: Current version of the collection the answer depends on
+
+        Returns:
+            (entry, similarity) for the closest fresh entry above the threshold, else None
+        """
+        query = self._normalize(vector)
+        with self._lock:
+            if not self._entries:
+                self.misses += 1
+                return None
+
+            now = time.time()
+            usable = self._live & (self._versions == version) & (self._expires > now)
+            similarities = np.where(usable, self._vectors @ query, -np.inf)
+            slot = int(np.argmax(similarities))
+            similarity = float(similarities[slot])
+
+            if similarity < self.threshold:
+                self.misses += 1
+                return None
+
+            self._entries.move_to_end(slot)
+            self.hits += 1
+            return self._entries[slot], similarity
+
+    def store(self, vector, query: str, response: str, version: int):
+        """Cache an answer, evicting expired entries first and then the least recently used."""
+        vector = self._normalize(vector)
+        with self._lock:
+            if self._vectors is None:
+                self._vectors = np.zeros((self.max_entries, len(vector)), dtype=np.float32)
+
+            if not self._free:
+                now = time.time()
+                for slot in [s for s, e in self._entries.items() if e.expires_at <= now or e.version != version]:
+                    self._evict(slot)
+            if not self._free:
+                self._evict(next(iter(self._entries)))
+
+            slot = self._free.pop()
+            entry = CacheEntry(
+                query=query,
+                response=response,
+                version=version,
+                expires_at=time.time() + self.ttl_seconds
+            )
+            self._vectors[slot] = vector
+            self._versions[slot] = version
+            self._expires[slot] = entry.expires_at
+            self._live[slot] = True
+            self._entries[slot] = entry
+
+    def stats(self) -> dict:
+        """Hit/miss counters for monitoring."""
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "threshold": self.threshold,
+            "ttl_seconds": self.ttl_seconds
+        }
@@ -1,52 +1,216 @@
 """
-FastAPI Server for RAG with Background Tasks
+FastAPI Server for RAG with Async Background Jobs
+
+Jobs run as asyncio tasks on the event loop (async Qdrant and LLM clients), so
+a single worker keeps hundreds of slow LLM calls in flight. Answers come from
+an LLM router that hedges slow requests across providers.
 
 Endpoints:
 - POST /chat: Process a message asynchronously
-- GET /status/{job_id}: Check job status
+- POST /chat/stream: Process a message, streaming sources and tokens (SSE)
+- POST /chat/batch: Queue many messages for the RQ workers at once
+- GET /status/{job_id}: Check job status (?wait=N long-polls until it is final)
+- POST /status/batch: Check many jobs at once
+- WS /ws/{job_id}: Receive a job's status updates as they happen
+- GET /jobs: Count in-flight jobs
+- DELETE /jobs/{job_id}: Cancel an in-flight job
 """
-from fastapi import FastAPI, BackgroundTasks
-from pydantic import BaseModel
-from typing import Optional, Dict
-from langchain_huggingface import HuggingFaceEmbeddings
-from langchain_qdrant import QdrantVectorStore
-from qdrant_client import QdrantClient
-from huggingface_hub import InferenceClient
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, HTTPException, Query, Request, WebSocket, WebSocketDisconnect
+from fastapi.responses import Response, StreamingResponse
+from prometheus_client import CONTENT_TYPE_LATEST, generate_latest
+from pydantic import BaseModel, Field
+from typing import Dict, List, Optional
+from pathlib import Path
+from qdrant_client import AsyncQdrantClient
+from redis.exceptions import RedisError
 from dotenv import load_dotenv
+import asyncio
+import json
+import time
 import uuid
+import sys
 import os
 
+# Make the shared `common` package importable when run from this directory
+sys.path.append(str(Path(__file__).resolve().parent.parent))
+from common import (
+    CollectionVersions,
+    get_embedding_model,
+    get_llm_router,
+    get_token_counter,
+    get_vector_store,
+    pack_context,
+    search_params
+)
+from common.vector_store import QDRANT_URL, VECTOR_BACKEND, asimilarity_search_by_vector
+from admission import AdmissionController, AdmissionRejected
+from batcher import EmbeddingBatcher
+from client import rq_client
+from metrics import ERRORS, JOBS, JOBS_IN_FLIGHT, LLM_TOKENS, STAGE_SECONDS, timed
+from notifier import CompletionNotifier, is_terminal
+from results import RedisResultsStore, get_results_store
+from semantic_cache import SemanticCache
+from singleflight import InFlight, JobEvents, coalesce_key
+from tasks import EMBED_TIMEOUT, LLM_TIMEOUT, SEARCH_TIMEOUT, JobRegistry, run_stage
+
 load_dotenv()
 
-app = FastAPI(title="RAG API")
+COLLECTION_NAME = "rag"
+# Oversample-and-rescore settings for quantized collections (None if not quantized)
+SEARCH_PARAMS = search_params()
 
-# In-memory store for results
-results_store: Dict[str, dict] = {}
+# Job results with TTL and LRU eviction (RESULTS_BACKEND=redis to share them across workers)
+results_store = get_results_store()
+# The RQ workers always write their results to Redis: jobs not found above are looked up there
+worker_results = results_store if isinstance(results_store, RedisResultsStore) else get_results_store("redis")
 
-# Initialize HuggingFace client
-hf_client = InferenceClient(
-    model="Qwen/Qwen2.5-72B-Instruct",
-    token=os.getenv("HUGGINGFACE_TOKEN")
-)
+# Wakes long-polls and WebSockets when a result is written, here or (through
+# Redis pub/sub) by another worker or the RQ worker
+notifier = CompletionNotifier()
+MAX_WAIT_SECONDS = 60
 
-# Initialize embedding model
-embedding_model = HuggingFaceEmbeddings(
-    model_name="sentence-transformers/all-MiniLM-L6-v2"
-)
+# Per-client rate limits and queue depth limits (429 + Retry-After when exceeded)
+admission = AdmissionController()
 
-# Connect to Qdrant
-qdrant_client = QdrantClient(url="http://localhost:6333")
-vector_store = QdrantVectorStore(
-    client=qdrant_client,
-    collection_name="rag",
-    embedding=embedding_model
-)
+# Largest /chat/batch and /status/batch request
+MAX_BATCH_SIZE = int(os.getenv("CHAT_BATCH_MAX_SIZE", "1000"))
 
-# Create retriever
-retriever = vector_store.as_retriever(
-    search_type="similarity",
-    search_kwargs={"k": 5}
-)
+LLM_MODEL = "Qwen/Qwen2.5-72B-Instruct"
+
+# Answers come from LLM_MODEL, hedged onto a backup provider when slower than
+# its recent p95 (LLM_PROVIDERS overrides the list)
+llm = get_llm_router(f"hf:{LLM_MODEL},hf:mistralai/Mistral-7B-Instruct-v0.3", timeout=LLM_TIMEOUT)
+
+# Context is packed to a token budget measured with the LLM's own tokenizer
+count_tokens = get_token_counter(LLM_MODEL)
+
+# Initialize embedding model (shared disk + LRU cache)
+embedding_model = get_embedding_model()
+
+# Concurrent jobs share forward passes: query embeddings are micro-batched
+query_embedding = EmbeddingBatcher(embedding_model)
+
+# Connect to Qdrant (or the local store with VECTOR_BACKEND=local);
+# searches on the request path go through the async client
+vector_store = get_vector_store(COLLECTION_NAME, query_embedding)
+async_qdrant = AsyncQdrantClient(url=QDRANT_URL) if VECTOR_BACKEND != "local" else None
+
+# Answers to recent (paraphrased) questions, invalidated when the collection is re-indexed
+answer_cache = SemanticCache()
+collection_versions = CollectionVersions()
+
+# In-flight jobs, bounded by MAX_CONCURRENT_JOBS
+COMPONENT = "server"
+jobs = JobRegistry(component=COMPONENT)
+JOBS_IN_FLIGHT.labels(COMPONENT).set_function(lambda: len(jobs))
+
+# Identical queries in flight share one job; streaming jobs fan their events out
+inflight = InFlight()
+stream_events: Dict[str, JobEvents] = {}
+
+
+async def save_result(job_id: str, result: dict):
+    """Store a job's result and wake anything waiting on it."""
+    await results_store.aset(job_id, result)
+    notifier.notify(job_id)
+
+
+async def load_result(job_id: str) -> Optional[dict]:
+    """A job's result, from this server's store or, for jobs run by the RQ workers, from Redis."""
+    result = await results_store.aget(job_id)
+    if result is None and worker_results is not results_store:
+        try:
+            result = await worker_results.aget(job_id)
+        except RedisError:
+            pass  # no RQ results without Redis: the job is reported as not found
+    return result
+
+
+async def is_final(job_id: str) -> bool:
+    """Whether a job's stored result is final (a notifier.wait condition)."""
+    return is_terminal(await load_result(job_id))
+
+
+def admit(request: Request, priority: str, depth: int, completed_total: int, incoming: int = 1):
+    """Apply admission control to a request, rejecting it with 429 and a Retry-After."""
+    client = request.headers.get("X-Client-ID") or (request.client.host if request.client else "unknown")
+    try:
+        admission.admit(priority, client, depth, completed_total, incoming)
+    except AdmissionRejected as e:
+        raise HTTPException(status_code=429, detail=e.reason, headers={"Retry-After": str(e.retry_after)})
+
+
+def admit_interactive(request: Request):
+    """Admission for jobs run in this process: the queue is the jobs waiting for a slot."""
+    admit(request, "interactive", len(jobs) - jobs.running, jobs.completed + jobs.cancelled)
+
+
+async def start_job(query: str, stream: bool = False) -> tuple:
+    """
+    Start a job for a query, or attach to the identical one already in flight.
+
+    Returns:
+        (job_id, coalesced)
+    """
+    version = await asyncio.to_thread(collection_versions.get, COLLECTION_NAME)
+    key = coalesce_key(query, version)
+    job_id = str(uuid.uuid4())
+
+    leader = inflight.join(key, job_id)
+    if leader is not None:
+        return leader, True
+
+    # Run as a task on the event loop; it waits for a slot if MAX_CONCURRENT_JOBS are running
+    events = None
+    if stream:
+        events = stream_events[job_id] = JobEvents()
+    try:
+        await save_result(job_id, {"job_id": job_id, "query": query, "status": "queued"})
+    except BaseException:
+        inflight.leave(key, job_id)
+        if stream_events.pop(job_id, None) is not None:
+            events.close()
+        raise
+    task = jobs.spawn(job_id, process_query, job_id, query, events)
+
+    def finished(_):
+        # Also runs for jobs cancelled before they got a slot
+        inflight.leave(key, job_id)
+        if stream_events.pop(job_id, None) is not None:
+            events.close()
+
+    task.add_done_callback(finished)
+    return job_id, False
+
+
+async def follow_result(job_id: str):
+    """Events for a stream attached to a non-streaming job: its result once final."""
+    await notifier.wait(job_id, MAX_WAIT_SECONDS, lambda: is_final(job_id))
+    result = await load_result(job_id) or {"job_id": job_id, "status": "not_found"}
+    if result.get("status") == "completed":
+        yield sse("sources", {"job_id": job_id, "sources": [], "cache_hit": result.get("cache_hit", False)})
+        yield sse("token", {"text": result["response"]})
+        yield sse("done", result)
+    else:
+        yield sse("error", result)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Results written by the RQ workers (and other servers) are announced through Redis
+    listener = asyncio.create_task(notifier.listen(worker_results.async_redis))
+    yield
+    listener.cancel()
+    await jobs.shutdown()
+    await llm.aclose()
+    if async_qdrant is not None:
+        await async_qdrant.close()
+    await results_store.aclose()
+    await worker_results.aclose()
+
+
+app = FastAPI(title="RAG API", lifespan=lifespan)
 
 
 class ChatMessage(BaseModel):
@@ -56,23 +220,101 @@ class ChatMessage(BaseModel):
 class ChatResponse(BaseModel):
     job_id: str
     status: str
+    coalesced: bool = False
 
 
-def process_query(job_id: str, query: str):
-    """Process a query in the background."""
+class ChatBatch(BaseModel):
+    messages: List[str] = Field(..., min_length=1, max_length=MAX_BATCH_SIZE)
+
+
+class ChatBatchResponse(BaseModel):
+    job_ids: List[str]
+    status: str
+
+
+class StatusBatch(BaseModel):
+    job_ids: List[str] = Field(..., max_length=MAX_BATCH_SIZE)
+
+
+def sse(event: str, data: dict) -> str:
+    """Format one Server-Sent Event."""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+def source_info(doc) -> dict:
+    """Citation for a retrieved chunk, sent before the answer is streamed."""
+    return {
+        "id": doc.metadata.get("_id"),
+        "source": doc.metadata.get("source"),
+        "page": doc.metadata.get("page")
+    }
+
+
+async def process_query(job_id: str, query: str, events: Optional[JobEvents] = None):
+    """
+    Process a query in the background.
+
+    Args:
+        job_id: Unique job ID
+        query: User question
+        events: If given, (event, data) pairs are emitted here as the job
+            progresses (sources, then answer tokens as they are generated)
+    """
     try:
         # Mark as processing
-        results_store[job_id] = {
+        await save_result(job_id, {
             "job_id": job_id,
             "query": query,
             "status": "processing"
-        }
+        })
         
+        # Embed once: the vector serves both the cache lookup and the search
+        with timed(COMPONENT, "embedding"):
+            query_vector = await run_stage(
+                "embedding", asyncio.wrap_future(query_embedding.submit(query)), EMBED_TIMEOUT
+            )
+        with timed(COMPONENT, "cache_lookup"):
+            version = await asyncio.to_thread(collection_versions.get, COLLECTION_NAME)
+            cached = answer_cache.lookup(query_vector, version)
+        if cached:
+            entry, similarity = cached
+            if events is not None:
+                events.emit(("sources", {"job_id": job_id, "sources": [], "cache_hit": True}))
+                events.emit(("token", {"text": entry.response}))
+            result = {
+                "job_id": job_id,
+                "query": query,
+                "response": entry.response,
+                "status": "completed",
+                "cache_hit": True,
+                "cache_similarity": round(similarity, 4),
+                "cached_query": entry.query
+            }
+            await save_result(job_id, result)
+            JOBS.labels(COMPONENT, "cached").inc()
+            if events is not None:
+                events.emit(("done", result))
+            return
+
         # Retrieve relevant documents
-        docs = retriever.invoke(query)
-        context = "\n\n---\n\n".join([doc.page_content for doc in docs])
+        with timed(COMPONENT, "retrieval"):
+            docs = await run_stage(
+                "retrieval",
+                asimilarity_search_by_vector(
+                    vector_store, query_vector, k=5, search_params=SEARCH_PARAMS, async_client=async_qdrant
+                ),
+                SEARCH_TIMEOUT
+            )
+        if events is not None:
+            events.emit(("sources", {
+                "job_id": job_id,
+                "sources": [source_info(doc) for doc in docs],
+                "cache_hit": False
+            }))
         
         # Create prompt
+        prompt_started = time.perf_counter()
+        context = pack_context(docs, count_tokens).text
         prompt = f"""You are a helpful assistant. Answer the user's question based on the provided context.
 If the context doesn't contain relevant information, say so.
 
@@ -83,61 +325,270 @@ Question: {query}
 
 Answer:"""
 
-        # Generate response using HuggingFace chat completion
+        # Generate response through the LLM router
         messages = [
             {"role": "user", "content": prompt}
         ]
-        response = hf_client.chat_completion(
-            messages=messages,
-            max_tokens=512,
-            temperature=0.7
-        )
-        response_text = response.choices[0].message.content
+        STAGE_SECONDS.labels(COMPONENT, "prompt").observe(time.perf_counter() - prompt_started)
+
+        generation_started = time.perf_counter()
+        prompt_tokens = completion_tokens = None
+        if events is None:
+            completion = await run_stage(
+                "generation",
+                llm.complete(messages, max_tokens=512, temperature=0.7),
+                LLM_TIMEOUT
+            )
+            response_text = completion.text
+            prompt_tokens, completion_tokens = completion.prompt_tokens, completion.completion_tokens
+        else:
+            # Relay tokens as they are generated; the timeout covers the whole stream
+            parts = []
+
+            async def relay():
+                async for text in llm.stream(messages, max_tokens=512, temperature=0.7):
+                    parts.append(text)
+                    events.emit(("token", {"text": text}))
+
+            await run_stage("generation", relay(), LLM_TIMEOUT)
+            response_text = "".join(parts)
+        STAGE_SECONDS.labels(COMPONENT, "generation").observe(time.perf_counter() - generation_started)
+        LLM_TOKENS.labels(COMPONENT, "prompt").inc(prompt_tokens or count_tokens(prompt))
+        LLM_TOKENS.labels(COMPONENT, "completion").inc(completion_tokens or count_tokens(response_text))
+        answer_cache.store(query_vector, query, response_text, version)
         
         # Store result
-        results_store[job_id] = {
+        result = {
             "job_id": job_id,
             "query": query,
             "response": response_text,
-            "status": "completed"
+            "status": "completed",
+            "cache_hit": False
         }
+        await save_result(job_id, result)
+        JOBS.labels(COMPONENT, "completed").inc()
+        if events is not None:
+            events.emit(("done", result))
         
+    except asyncio.CancelledError:
+        result = {
+            "job_id": job_id,
+            "query": query,
+            "status": "cancelled"
+        }
+        await save_result(job_id, result)
+        JOBS.labels(COMPONENT, "cancelled").inc()
+        raise
+
     except Exception as e:
-        results_store[job_id] = {
+        result = {
             "job_id": job_id,
             "query": query,
             "error": str(e),
             "status": "failed"
         }
+        await save_result(job_id, result)
+        JOBS.labels(COMPONENT, "failed").inc()
+        ERRORS.labels(COMPONENT, type(e).__name__).inc()
+        if events is not None:
+            events.emit(("error", result))
 
 
 @app.post("/chat", response_model=ChatResponse)
-async def chat(payload: ChatMessage, background_tasks: BackgroundTasks):
+async def chat(payload: ChatMessage, request: Request):
     """
     Submit a message for RAG processing.
     
     Returns a job_id immediately. Use /status/{job_id} to get the result.
+    Returns 429 with Retry-After when the client or the server is over its limit.
     """
-    job_id = str(uuid.uuid4())
-    
-    # Add task to background
-    background_tasks.add_task(process_query, job_id, payload.message)
+    admit_interactive(request)
+    job_id, coalesced = await start_job(payload.message)
+    if coalesced and job_id in stream_events:
+        # A streaming client leaving must not cancel a job this request waits on
+        stream_events[job_id].keep_alive = True
     
-    return ChatResponse(job_id=job_id, status="processing")
+    return ChatResponse(job_id=job_id, status="processing", coalesced=coalesced)
+
+
+@app.post("/chat/stream")
+async def chat_stream(payload: ChatMessage, request: Request):
+    """
+    Submit a message and stream the answer as Server-Sent Events.
+
+    Events: `sources` (retrieved chunks), `token` (answer text as it is
+    generated), then `done` with the stored result, or `error`. The result is
+    also available from /status/{job_id} afterwards. Identical questions in
+    flight share one stream.
+    """
+    admit_interactive(request)
+    job_id, coalesced = await start_job(payload.message, stream=True)
+    events = stream_events.get(job_id)
+
+    async def event_stream():
+        subscription = events.subscribe()
+        try:
+            while True:
+                event = await subscription.get()
+                if event is None:
+                    break
+                yield sse(*event)
+        finally:
+            # Last client went away: stop generating
+            if events.unsubscribe(subscription) == 0 and not events.keep_alive:
+                jobs.cancel(job_id)
+
+    return StreamingResponse(
+        event_stream() if events is not None else follow_result(job_id),
+        media_type="text/event-stream",
+        headers={
+            "Cache-Control": "no-cache",
+            "X-Accel-Buffering": "no",
+            "X-Job-ID": job_id,
+            "X-Coalesced": str(coalesced).lower()
+        }
+    )
+
+
+@app.post("/chat/batch", response_model=ChatBatchResponse)
+async def chat_batch(payload: ChatBatch, request: Request):
+    """
+    Queue many messages for the RQ workers in one Redis round trip.
+
+    Returns the job IDs in the order of the messages. Use /status/batch,
+    /status/{job_id} or /ws/{job_id} to get the results. Batch jobs
+    run only when no interactive job is waiting, and the batch is rejected with
+    429 and a Retry-After when it would overfill the batch queue.
+    """
+    depth, drained = await asyncio.to_thread(rq_client.queue_stats, "batch")
+    admit(request, "batch", depth, drained, len(payload.messages))
+
+    # Repeated questions share one job, within the batch and with jobs already queued
+    version = await asyncio.to_thread(collection_versions.get, COLLECTION_NAME)
+    keys = [coalesce_key(message, version) for message in payload.messages]
+    job_ids = await asyncio.to_thread(rq_client.enqueue_many, payload.messages, "batch", keys)
+    return ChatBatchResponse(job_ids=job_ids, status="queued")
+
+
+@app.post("/status/batch")
+async def get_status_batch(payload: StatusBatch):
+    """
+    Get the status and result of many jobs, in the order given.
+
+    Results are read from the results store in one round trip (one more for
+    those written by the RQ workers, with RESULTS_BACKEND=memory); jobs not
+    there yet (still queued for an RQ worker) are looked up in RQ in one more.
+    """
+    results = await results_store.aget_many(payload.job_ids)
+    missing = [job_id for job_id, result in zip(payload.job_ids, results) if result is None]
+    if missing and worker_results is not results_store:
+        found = dict(zip(missing, await worker_results.aget_many(missing)))
+        results = [result if result is not None else found[job_id] for job_id, result in zip(payload.job_ids, results)]
+        missing = [job_id for job_id in missing if found[job_id] is None]
+    if missing:
+        queued = {
+            status["job_id"]: status["result"] or {"job_id": status["job_id"], "status": status["status"]}
+            for status in await asyncio.to_thread(rq_client.get_jobs_status, missing)
+        }
+        results = [result if result is not None else queued[job_id] for job_id, result in zip(payload.job_ids, results)]
+    return {"results": results}
 
 
 @app.get("/status/{job_id}")
-async def get_status(job_id: str):
-    """Get the status and result of a job."""
-    if job_id in results_store:
-        return results_store[job_id]
+async def get_status(job_id: str, wait: float = Query(0, ge=0, le=MAX_WAIT_SECONDS)):
+    """
+    Get the status and result of a job.
+
+    With `wait`, hold the request for up to that many seconds until the job is
+    completed, failed or cancelled, instead of returning its current status.
+    """
+    if wait:
+        await notifier.wait(job_id, wait, lambda: is_final(job_id))
+    result = await load_result(job_id)
+    if result is not None:
+        return result
+    return {"job_id": job_id, "status": "not_found"}
+
+
+@app.websocket("/ws/{job_id}")
+async def job_updates(websocket: WebSocket, job_id: str):
+    """Send a job's result every time it changes, closing once it is final."""
+    await websocket.accept()
+    placeholder = {"job_id": job_id, "status": "not_found"}
+    last = None
+
+    async def current() -> dict:
+        return await load_result(job_id) or placeholder
+
+    async def changed() -> bool:
+        # Compared as sent: an unknown job must not look changed on every check
+        return await current() != last
+
+    try:
+        while True:
+            result = await current()
+            if result != last:
+                await websocket.send_json(result)
+                last = result
+            if is_terminal(result):
+                break
+            await notifier.wait(job_id, MAX_WAIT_SECONDS, changed)
+        await websocket.close()
+    except WebSocketDisconnect:
+        pass
+
+
+@app.get("/jobs")
+async def list_jobs():
+    """Count in-flight jobs."""
+    return jobs.stats()
+
+
+@app.delete("/jobs/{job_id}")
+async def cancel_job(job_id: str):
+    """Cancel a queued or running job."""
+    if jobs.cancel(job_id):
+        result = {**(await results_store.aget(job_id) or {}), "job_id": job_id, "status": "cancelled"}
+        await save_result(job_id, result)
+        return result
+    result = await load_result(job_id)
+    if result is not None:
+        return result
     return {"job_id": job_id, "status": "not_found"}
 
 
 @app.get("/results")
-async def list_results():
-    """List all results."""
-    return {"results": list(results_store.values())}
+async def list_results(cursor: Optional[str] = None, limit: int = Query(50, ge=1, le=500)):
+    """
+    List results, newest first, one page at a time.
+
+    Pass the returned `next_cursor` to get the next page; it is null on the last one.
+    Results of RQ jobs are listed with RESULTS_BACKEND=redis.
+    """
+    results, next_cursor = await results_store.alist(cursor, limit)
+    return {"results": results, "next_cursor": next_cursor}
+
+
+@app.get("/stats")
+async def stats():
+    """Embedding cache, micro-batching, job and LLM provider counters."""
+    return {
+        "embedding_cache": embedding_model.stats(),
+        "embedding_batcher": query_embedding.stats(),
+        "answer_cache": answer_cache.stats(),
+        "jobs": jobs.stats(),
+        "results": await results_store.astats(),
+        "notifier": notifier.stats(),
+        "admission": admission.stats(),
+        "coalescing": inflight.stats(),
+        "llm": llm.stats()
+    }
+
+
+@app.get("/metrics")
+async def metrics():
+    """Prometheus metrics: per-stage latency, queue wait, in-flight jobs, LLM tokens, errors."""
+    return Response(generate_latest(), media_type=CONTENT_TYPE_LATEST)
 
 
 @app.get("/")
@@ -147,7 +598,15 @@ async def root():
         "message": "RAG API",
         "endpoints": {
             "POST /chat": "Send a message for processing",
-            "GET /status/{job_id}": "Check job status",
+            "POST /chat/stream": "Send a message and stream the answer (SSE)",
+            "POST /chat/batch": "Queue many messages at once",
+            "POST /status/batch": "Check many jobs at once",
+            "GET /status/{job_id}": "Check job status (?wait=30 to long-poll)",
+            "WS /ws/{job_id}": "Job status updates",
+            "GET /jobs": "Count in-flight jobs",
+            "DELETE /jobs/{job_id}": "Cancel an in-flight job",
+            "GET /stats": "Cache and batching statistics",
+            "GET /metrics": "Prometheus metrics",
             "GET /docs": "API documentation"
         }
     }
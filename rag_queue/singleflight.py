@@ -0,0 +1,157 @@
+"""
+Singleflight coalescing of identical in-flight queries.
+
+When the same question arrives many times at once, only the first copy (the
+leader) runs; later copies attach to the leader's job and get its result, so
+the LLM is called once. Queries are keyed on their normalized text and the
+collection version, so a re-index never reuses a job answered against old
+content.
+
+- In the server, InFlight maps keys to the job running in this process, and
+  JobEvents fans a streaming job's events out to every attached stream.
+- For RQ jobs, claim() takes the key in Redis with SET NX (shared by every
+  server and client), and the worker release()s it when the job is done.
+"""
+import asyncio
+import hashlib
+import re
+from typing import Dict, List, Optional, Set
+
+from redis import Redis
+
+INFLIGHT_KEY = "rag:inflight:{}"
+
+
+def normalize_query(query: str) -> str:
+    """Case-, whitespace- and trailing-punctuation-insensitive form of a query."""
+    return re.sub(r"\s+", " ", query).strip().rstrip("?!.").strip().lower()
+
+
+def coalesce_key(query: str, version: int) -> str:
+    """Key shared by every copy of a query against one collection version."""
+    return hashlib.sha256(f"{version}\x00{normalize_query(query)}".encode("utf-8")).hexdigest()
+
+
+class InFlight:
+    """Leader job of each in-flight query key in this process."""
+
+    def __init__(self):
+        self._leaders: Dict[str, str] = {}
+        self.coalesced = 0
+
+    def join(self, key: str, job_id: str) -> Optional[str]:
+        """
+        Become the leader for a key, or find the current one.
+
+        Returns:
+            The leader's job ID if a job for this key is already in flight, else None
+        """
+        leader = self._leaders.get(key)
+        if leader is not None:
+            self.coalesced += 1
+            return leader
+        self._leaders[key] = job_id
+        return None
+
+    def leave(self, key: str, job_id: str):
+        """Release a key once its leader job has finished."""
+        if self._leaders.get(key) == job_id:
+            del self._leaders[key]
+
+    def stats(self) -> dict:
+        return {"in_flight": len(self._leaders), "coalesced": self.coalesced}
+
+
+class JobEvents:
+    """
+    Event fan-out for a streaming job.
+
+    Every subscriber gets the events emitted so far and then each new one, so a
+    duplicate request attaching mid-stream still receives the whole answer.
+    None marks the end of the stream.
+    """
+
+    def __init__(self):
+        self._history: List[tuple] = []
+        self._subscribers: Set[asyncio.Queue] = set()
+        self._closed = False
+        self.keep_alive = False  # set when a non-streaming request depends on the job
+
+    def emit(self, event: tuple):
+        self._history.append(event)
+        for queue in self._subscribers:
+            queue.put_nowait(event)
+
+    def close(self):
+        if self._closed:
+            return
+        self._closed = True
+        for queue in self._subscribers:
+            queue.put_nowait(None)
+
+    def subscribe(self) -> asyncio.Queue:
+        queue: asyncio.Queue = asyncio.Queue()
+        for event in self._history:
+            queue.put_nowait(event)
+        if self._closed:
+            queue.put_nowait(None)
+        self._subscribers.add(queue)
+        return queue
+
+    def unsubscribe(self, queue: asyncio.Queue) -> int:
+        """Detach a subscriber, returning how many remain."""
+        self._subscribers.discard(queue)
+        return len(self._subscribers)
+
+
+def claim(redis: Redis, key: str, job_id: str, ttl: int) -> Optional[str]:
+    """
+    Claim a query key for an RQ job.
+
+    Returns:
+        The job ID already holding the key, or None if `job_id` now holds it
+    """
+    redis_key = INFLIGHT_KEY.format(key)
+    while True:
+        if redis.set(redis_key, job_id, nx=True, ex=ttl):
+            return None
+        leader = redis.get(redis_key)
+        if leader is not None:
+            return leader.decode()
+        # The leader finished between SET and GET: try again to take over, never
+        # run without holding the key (a later copy would run the query again)
+
+
+def claim_many(redis: Redis, keys: List[str], job_ids: List[str], ttl: int) -> List[Optional[str]]:
+    """
+    Claim many query keys in two round trips.
+
+    Duplicates within `keys` coalesce onto their first occurrence.
+
+    Returns:
+        For each key, the job ID already holding it, or None if the given job ID now holds it
+    """
+    with redis.pipeline(transaction=False) as pipe:
+        for key, job_id in zip(keys, job_ids):
+            pipe.set(INFLIGHT_KEY.format(key), job_id, nx=True, ex=ttl)
+        acquired = pipe.execute()
+
+    taken = [i for i, ok in enumerate(acquired) if not ok]
+    leaders: List[Optional[str]] = [None] * len(keys)
+    if taken:
+        values = redis.mget([INFLIGHT_KEY.format(keys[i]) for i in taken])
+        for i, value in zip(taken, values):
+            if value is not None:
+                leaders[i] = value.decode()
+            else:
+                # The leader finished in between: claim the key for this copy (or its new leader)
+                leaders[i] = claim(redis, keys[i], job_ids[i], ttl)
+    return leaders
+
+
+def release(redis: Redis, key: str, job_id: str):
+    """Release a query key held by a finished RQ job."""
+    redis_key = INFLIGHT_KEY.format(key)
+    leader = redis.get(redis_key)
+    if leader is not None and leader.decode() == job_id:
+        redis.delete(redis_key)
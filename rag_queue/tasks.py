@@ -0,0 +1,128 @@
+"""
+In-flight job registry for the async server.
+
+Every /chat job runs as an asyncio task on the server's event loop instead of
+holding a threadpool thread for its whole lifetime. JobRegistry keeps a handle
+on each task so jobs can be counted and cancelled, and a global semaphore caps
+how many run at once (the rest wait their turn without costing a thread).
+Each stage of a job is bounded by its own timeout via run_stage().
+"""
+import asyncio
+import os
+import time
+from typing import Awaitable, Callable, Dict
+
+from metrics import QUEUE_WAIT_SECONDS
+
+MAX_CONCURRENT_JOBS = int(os.getenv("MAX_CONCURRENT_JOBS", "256"))
+
+# Per-stage timeouts in seconds
+EMBED_TIMEOUT = float(os.getenv("EMBED_TIMEOUT", "10"))
+SEARCH_TIMEOUT = float(os.getenv("SEARCH_TIMEOUT", "10"))
+LLM_TIMEOUT = float(os.getenv("LLM_TIMEOUT", "120"))
+
+
+class StageTimeout(Exception):
+    """A job stage did not finish within its timeout."""
+
+
+async def run_stage(name: str, awaitable: Awaitable, timeout: float):
+    """
+    Await one stage of a job under its own timeout.
+
+    Args:
+        name: Stage name used in the error message
+        awaitable: Coroutine or future for the stage
+        timeout: Seconds before the stage is abandoned
+
+    Raises:
+        StageTimeout: If the stage took longer than `timeout`
+    """
+    try:
+        return await asyncio.wait_for(awaitable, timeout)
+    except asyncio.TimeoutError:
+        raise StageTimeout(f"{name} timed out after {timeout:g}s") from None
+
+
+class JobRegistry:
+    """Tracks in-flight job tasks and bounds how many run concurrently."""
+
+    def __init__(self, max_concurrency: int = MAX_CONCURRENT_JOBS, component: str = "server"):
+        """
+        Initialize the registry.
+
+        Args:
+            max_concurrency: Jobs allowed past the semaphore at once
+            component: Label for the queue wait time metric
+        """
+        self.max_concurrency = max_concurrency
+        self.component = component
+        self.semaphore = asyncio.Semaphore(max_concurrency)
+        self.running = 0
+        self.completed = 0
+        self.cancelled = 0
+        self._tasks: Dict[str, asyncio.Task] = {}
+
+    def spawn(self, job_id: str, job: Callable[..., Awaitable], *args) -> asyncio.Task:
+        """
+        Start a job in the background.
+
+        Args:
+            job_id: Unique job ID
+            job: Coroutine function run as `job(*args)` once a slot is free
+
+        Returns:
+            asyncio.Task: The job's task
+        """
+        task = asyncio.create_task(self._run(job, *args), name=f"job-{job_id}")
+        self._tasks[job_id] = task
+        task.add_done_callback(lambda _: self._finished(job_id))
+        return task
+
+    async def _run(self, job: Callable[..., Awaitable], *args):
+        queued_at = time.perf_counter()
+        async with self.semaphore:
+            QUEUE_WAIT_SECONDS.labels(self.component).observe(time.perf_counter() - queued_at)
+            self.running += 1
+            try:
+                return await job(*args)
+            finally:
+                self.running -= 1
+
+    def _finished(self, job_id: str):
+        task = self._tasks.pop(job_id, None)
+        if task is not None and task.cancelled():
+            self.cancelled += 1
+        else:
+            self.completed += 1
+
+    def cancel(self, job_id: str) -> bool:
+        """Cancel an in-flight job. Returns False if it is unknown or already done."""
+        task = self._tasks.get(job_id)
+        if task is None or task.done():
+            return False
+        return task.cancel()
+
+    def __contains__(self, job_id: str) -> bool:
+        return job_id in self._tasks
+
+    def __len__(self) -> int:
+        return len(self._tasks)
+
+    async def shutdown(self):
+        """Cancel every in-flight job and wait for them to unwind."""
+        tasks = list(self._tasks.values())
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    def stats(self) -> dict:
+        """In-flight counters for monitoring."""
+        return {
+            "in_flight": len(self._tasks),
+            "running": self.running,
+            "waiting": len(self._tasks) - self.running,
+            "max_concurrency": self.max_concurrency,
+            "completed": self.completed,
+            "cancelled": self.cancelled
+        }
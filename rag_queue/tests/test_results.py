@@ -0,0 +1,57 @@
+"""Tests for the job results stores' paging."""
+import asyncio
+import bisect
+import json
+import sys
+from pathlib import Path
+
+import fakeredis
+import pytest
+
+sys.path.append(str(Path(__file__).resolve().parent.parent))
+
+from results import RESULT_INDEX_KEY, RESULT_KEY, MemoryResultsStore, RedisResultsStore  # noqa: E402
+
+JOB_IDS = [f"job-{i:02d}" for i in range(15)]
+# Several jobs share each creation time
+CREATED_AT = [1000.0] * 7 + [1001.0] * 5 + [1002.0] * 3
+
+
+def redis_store() -> RedisResultsStore:
+    server = fakeredis.FakeServer()
+    redis = fakeredis.FakeRedis(server=server)
+    for job_id, created_at in zip(JOB_IDS, CREATED_AT):
+        redis.set(RESULT_KEY.format(job_id), json.dumps({"job_id": job_id}))
+        redis.zadd(RESULT_INDEX_KEY, {job_id: created_at})
+    return RedisResultsStore(redis, async_redis=fakeredis.FakeAsyncRedis(server=server))
+
+
+def memory_store() -> MemoryResultsStore:
+    store = MemoryResultsStore()
+    for job_id, created_at in zip(JOB_IDS, CREATED_AT):
+        store._entries[job_id] = (float("inf"), created_at, {"job_id": job_id})
+        bisect.insort(store._created, (created_at, job_id))
+    return store
+
+
+def all_pages(store, limit: int, use_async: bool = False) -> list:
+    pages, cursor = [], None
+    while True:
+        if use_async:
+            results, cursor = asyncio.run(store.alist(cursor, limit))
+        else:
+            results, cursor = store.list(cursor, limit)
+        pages.append([result["job_id"] for result in results])
+        if cursor is None:
+            return pages
+
+
+@pytest.mark.parametrize("limit", [1, 2, 4, 6, 15, 20])
+def test_backends_page_the_same_through_ties(limit):
+    pages = all_pages(memory_store(), limit)
+    assert all_pages(redis_store(), limit) == pages
+    assert all_pages(redis_store(), limit, use_async=True) == pages
+
+    listed = [job_id for page in pages for job_id in page]
+    assert sorted(listed) == JOB_IDS
+    assert listed == sorted(JOB_IDS, key=lambda j: (CREATED_AT[JOB_IDS.index(j)], j), reverse=True)
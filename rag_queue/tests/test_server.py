@@ -0,0 +1,74 @@
+"""
+Tests for the rag_queue server's push endpoints.
+
+The server is imported against a scratch local vector store and fakeredis, as
+in benchmarks/rag_queue_load.py, so no Qdrant, Redis or model download is needed.
+"""
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import fakeredis
+import pytest
+
+RAG_QUEUE_DIR = Path(__file__).resolve().parent.parent
+sys.path.append(str(RAG_QUEUE_DIR.parent))
+sys.path.append(str(RAG_QUEUE_DIR))
+
+# Configuration is read at import time
+SCRATCH = Path(tempfile.mkdtemp(prefix="rag-queue-test-"))
+os.environ.update({
+    "VECTOR_BACKEND": "local",
+    "LOCAL_VECTOR_DIR": str(SCRATCH / "vectors"),
+    "EMBEDDING_CACHE_DIR": str(SCRATCH / "embeddings"),
+    "RESULTS_BACKEND": "memory",
+    "RESULT_CALLBACK_URL": "",
+    "PUSHGATEWAY_URL": ""
+})
+
+from fastapi.testclient import TestClient  # noqa: E402
+
+import server  # noqa: E402
+from results import RedisResultsStore  # noqa: E402
+
+
+@pytest.fixture
+def client(monkeypatch):
+    fake_server = fakeredis.FakeServer()
+    monkeypatch.setattr(server, "worker_results", RedisResultsStore(
+        fakeredis.FakeRedis(server=fake_server),
+        async_redis=fakeredis.FakeAsyncRedis(server=fake_server)
+    ))
+    with TestClient(server.app) as client:
+        yield client
+
+
+def test_ws_unknown_job_does_not_busy_loop(client, monkeypatch):
+    lookups = 0
+    load_result = server.load_result
+
+    async def counting_load_result(job_id):
+        nonlocal lookups
+        lookups += 1
+        if lookups > 1000:
+            raise RuntimeError("busy loop")  # ends the socket instead of hanging the test
+        return await load_result(job_id)
+
+    monkeypatch.setattr(server, "load_result", counting_load_result)
+    monkeypatch.setattr(server, "MAX_WAIT_SECONDS", 1)
+
+    with client.websocket_connect("/ws/no-such-job") as websocket:
+        assert websocket.receive_json() == {"job_id": "no-such-job", "status": "not_found"}
+        time.sleep(0.5)
+        # Sent once, then one lookup per notifier.wait check while idle
+        assert lookups < 10
+
+
+def test_ws_sends_worker_result(client):
+    worker_results = server.worker_results
+    with client.websocket_connect("/ws/rq-job") as websocket:
+        assert websocket.receive_json()["status"] == "not_found"
+        worker_results.set("rq-job", {"job_id": "rq-job", "status": "completed", "response": "ok"})
+        assert websocket.receive_json()["response"] == "ok"
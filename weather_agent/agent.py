@@ -1,11 +1,19 @@
 import os
+import sys
 import json
+from pathlib import Path
 from openai import OpenAI
 from dotenv import load_dotenv
 import requests
+
+# Make the shared `common` package importable when run from this directory
+sys.path.append(str(Path(__file__).resolve().parent.parent))
+from common import ShortTermMemory, get_token_counter
+
 load_dotenv()
 
 client = OpenAI()
+MODEL = "gpt-4o"
 
 
 def get_weather(city : str):
@@ -67,8 +75,12 @@ available_tools = {
     "get_weather": get_weather
 }
 
-# Initialize message history with system prompt
-messages = [{"role": "system", "content": SYSTEM_PROMPT}]
+# Conversation history (including tool observations) within a token budget;
+# older turns are summarized
+history = ShortTermMemory(
+    get_token_counter(MODEL),
+    complete=lambda messages: client.chat.completions.create(model=MODEL, messages=messages).choices[0].message.content
+)
 
 while True:
     # Get user input
@@ -84,21 +96,21 @@ while True:
         continue
     
     # Add user message to history
-    messages.append({"role": "user", "content": user_input})
+    history.add("user", user_input)
     
     # Agent loop - keeps running until no more tool calls
     while True:
         # Get response from API
         response = client.chat.completions.create(
-            model="gpt-4o",
-            messages=messages
+            model=MODEL,
+            messages=[{"role": "system", "content": SYSTEM_PROMPT}] + history.messages()
         )
         
         # Extract assistant's reply
         assistant_reply = response.choices[0].message.content
         
         # Add assistant's reply to history
-        messages.append({"role": "assistant", "content": assistant_reply})
+        history.add("assistant", assistant_reply)
         
         # Print the response in JSON format
         try:
@@ -119,15 +131,12 @@ while True:
                     tool_response = available_tools[tool_to_call](tool_input)
                     
                     # Add tool observation to message history
-                    messages.append({
-                        "role": "developer",
-                        "content": json.dumps({
-                            "step": "OBSERVE",
-                            "tool": tool_to_call,
-                            "input": tool_input,
-                            "output": tool_response
-                        })
-                    })
+                    history.add("developer", json.dumps({
+                        "step": "OBSERVE",
+                        "tool": tool_to_call,
+                        "input": tool_input,
+                        "output": tool_response
+                    }))
                     tool_called = True
             
             # If no tool was called, break out of the agent loop